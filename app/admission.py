@@ -0,0 +1,322 @@
+"""
+Admission control for write requests.
+
+Every POST, PUT, PATCH and DELETE under /api/v1 (except read-only batch
+lookups) passes through AdmissionMiddleware before the app sees its body:
+
+- Overload: when this worker already has admission_max_inflight_writes
+  writes running, or a MongoDB pool is admission_pool_shed_ratio checked
+  out, the request is shed with 503 so the pool never runs dry.
+- Concurrency: each user and each device may have only so many writes in
+  flight; further ones get 429.
+- Rate: each user and each device has a token bucket; a request that finds
+  it empty gets 429 with the time until the next token.
+
+Rejections carry Retry-After. Clients are identified by the user_id and
+device_id the request carries. Fields near the start of a JSON or form body
+(at most admission_identify_peek_bytes are read ahead and then replayed to
+the app) are authoritative, since they own the write; the X-User-Id and
+X-Device-Id headers and the query string only fill in what the body does
+not name, so a made-up header cannot buy a fresh bucket for a user's
+writes. Requests naming neither, such as moves and deletes by ID, are only subject
+to overload shedding, unless rate_limit_unidentified_by_address keys them
+by client address; behind a proxy that address is usually the proxy's.
+
+Like the in-memory cache, limits are per worker process, so serve.py
+refuses to run several workers while they are enabled.
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from fastapi.responses import JSONResponse
+from app.config import settings
+from app.metrics import Counter, pool_stats
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+READ_ONLY_SUFFIXES = (":batchGet",)
+# (limiter kind, request field or header carrying the ID)
+IDENTITY_FIELDS = (("user", "user_id"), ("device", "device_id"))
+MAX_KEY_LENGTH = 256
+
+admission_rejections = Counter("admission_rejections_total", "Write requests shed by admission control", ("reason",))
+
+class TokenBucket:
+    """Holds up to burst tokens, refilled at rate tokens per second"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        """Seconds until cost tokens are available (0 if they are now); call refill() first"""
+        if self.tokens >= cost:
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (cost - self.tokens) / self.rate
+
+class RateLimiter:
+    """
+    Token buckets by key, for one kind of client (users or devices).
+
+    Only the max_keys most recently seen keys are kept; a bucket that is
+    dropped would have refilled completely anyway unless the key was very
+    active, so eviction only ever errs towards admitting.
+    """
+
+    def __init__(self, rate: float, burst: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def bucket(self, key: str, now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.burst, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.refill(now)
+        return bucket
+
+class ConcurrencyLimiter:
+    """Counts requests in flight by key"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight: Dict[str, int] = {}
+
+    def available(self, key: str) -> bool:
+        return self.limit <= 0 or self.in_flight.get(key, 0) < self.limit
+
+    def acquire(self, key: str) -> None:
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def release(self, key: str) -> None:
+        count = self.in_flight.get(key, 0) - 1
+        if count > 0:
+            self.in_flight[key] = count
+        else:
+            self.in_flight.pop(key, None)
+
+# (status, detail, retry after in seconds)
+Rejection = Tuple[int, str, float]
+
+class AdmissionController:
+    """
+    Decides whether a write may run. Keys are ("user", id) and ("device", id)
+    pairs; admit() and release() must be called with the same keys.
+
+    Runs on the event loop only, so no locking is needed.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.rate_limiters = {
+            "user": RateLimiter(settings.rate_limit_user_per_second, settings.rate_limit_user_burst, settings.rate_limit_max_keys),
+            "device": RateLimiter(settings.rate_limit_device_per_second, settings.rate_limit_device_burst, settings.rate_limit_max_keys),
+        }
+        self.concurrency_limiters = {
+            "user": ConcurrencyLimiter(settings.concurrency_limit_per_user),
+            "device": ConcurrencyLimiter(settings.concurrency_limit_per_device),
+        }
+
+    @staticmethod
+    def pool_saturated() -> bool:
+        """Whether any MongoDB pool has more than admission_pool_shed_ratio of its connections checked out"""
+        if not settings.metrics_enabled or settings.admission_pool_shed_ratio <= 0:
+            return False
+        threshold = settings.mongodb_max_pool_size * settings.admission_pool_shed_ratio
+        return any(server["in_use"] >= threshold for server in pool_stats().values())
+
+    def admit(self, keys: List[Tuple[str, str]], now: Optional[float] = None) -> Optional[Rejection]:
+        """Admit a request, returning None, or why it was rejected (nothing is taken then)"""
+        if settings.admission_max_inflight_writes > 0 and self.in_flight >= settings.admission_max_inflight_writes:
+            admission_rejections.inc(reason="overloaded")
+            return 503, "Server is busy; retry shortly", settings.admission_retry_after_seconds
+        if self.pool_saturated():
+            admission_rejections.inc(reason="pool_saturated")
+            return 503, "Server is busy; retry shortly", settings.admission_retry_after_seconds
+
+        for kind, key in keys:
+            if not self.concurrency_limiters[kind].available(key):
+                admission_rejections.inc(reason=f"{kind}_concurrency")
+                return 429, f"Too many concurrent requests for this {kind}", settings.admission_retry_after_seconds
+
+        now = time.monotonic() if now is None else now
+        buckets = []
+        for kind, key in keys:
+            limiter = self.rate_limiters[kind]
+            if limiter.rate <= 0:
+                continue
+            bucket = limiter.bucket(key, now)
+            wait = bucket.wait_time()
+            if wait > 0:
+                admission_rejections.inc(reason=f"{kind}_rate")
+                return 429, f"Rate limit exceeded for this {kind}", wait
+            buckets.append(bucket)
+
+        for bucket in buckets:
+            bucket.tokens -= 1
+        for kind, key in keys:
+            self.concurrency_limiters[kind].acquire(key)
+        self.in_flight += 1
+        return None
+
+    def release(self, keys: List[Tuple[str, str]]) -> None:
+        self.in_flight -= 1
+        for kind, key in keys:
+            self.concurrency_limiters[kind].release(key)
+
+def is_limited(scope) -> bool:
+    """Whether a request is a write subject to admission control"""
+    path = scope["path"]
+    return (
+        scope["method"] in WRITE_METHODS
+        and path.startswith("/api/")
+        and not path.endswith(READ_ONLY_SUFFIXES)
+    )
+
+def _identity(values: Dict[str, str]) -> Dict[str, str]:
+    """Limiter kind -> ID for the identity fields present in values"""
+    identity = {}
+    for kind, field in IDENTITY_FIELDS:
+        value = values.get(field)
+        if isinstance(value, str) and value.strip():
+            identity[kind] = value.strip()[:MAX_KEY_LENGTH]
+    return identity
+
+def header_identity(scope) -> Dict[str, str]:
+    """IDs from the X-User-Id / X-Device-Id headers, then the query string"""
+    headers = dict(scope.get("headers") or [])
+    identity = _identity({
+        field: headers.get(f"x-{field.replace('_', '-')}".encode(), b"").decode("latin-1")
+        for _, field in IDENTITY_FIELDS
+    })
+    query = parse_qs((scope.get("query_string") or b"").decode("latin-1"))
+    return {**_identity({field: values[0] for field, values in query.items()}), **identity}
+
+def _multipart_fields(body: bytes, boundary: bytes) -> Dict[str, str]:
+    """Complete text fields at the start of a multipart/form-data body"""
+    fields = {}
+    # The last piece may be cut off by the peek limit, so only earlier ones are read
+    for part in body.split(b"--" + boundary)[1:-1]:
+        head, sep, value = part.partition(b"\r\n\r\n")
+        if not sep or b"filename=" in head:
+            continue
+        for _, field in IDENTITY_FIELDS:
+            if f'name="{field}"'.encode() in head:
+                fields[field] = value.removesuffix(b"\r\n").decode("utf-8", "replace")
+    return fields
+
+def body_identity(content_type: str, body: bytes, complete: bool) -> Dict[str, str]:
+    """IDs from a JSON, urlencoded or multipart body (or its first bytes, if not complete)"""
+    media_type, _, params = content_type.partition(";")
+    media_type = media_type.strip().lower()
+    try:
+        if media_type == "application/json" and complete:
+            values = json.loads(body)
+            return _identity(values) if isinstance(values, dict) else {}
+        if media_type == "application/x-www-form-urlencoded" and complete:
+            query = parse_qs(body.decode("latin-1"))
+            return _identity({field: values[0] for field, values in query.items()})
+        if media_type == "multipart/form-data":
+            for param in params.split(";"):
+                name, _, value = param.strip().partition("=")
+                if name.lower() == "boundary" and value:
+                    return _identity(_multipart_fields(body, value.strip('"').encode("latin-1")))
+    except ValueError:
+        pass
+    return {}
+
+def client_keys(identity: Dict[str, str], scope) -> List[Tuple[str, str]]:
+    """Rate limit keys for a request: its user and device, or its address if allowed and it names neither"""
+    keys = [(kind, identity[kind]) for kind, _ in IDENTITY_FIELDS if kind in identity]
+    if not keys and settings.rate_limit_unidentified_by_address:
+        client = scope.get("client")
+        keys.append(("user", f"address:{client[0] if client else 'unknown'}"))
+    return keys
+
+async def peek_body(receive, limit: int) -> Tuple[List[dict], bytes, bool]:
+    """
+    Receive the start of a request body, up to about limit bytes.
+
+    Returns the messages received (to replay to the app), their bytes and
+    whether that was the whole body.
+    """
+    messages = []
+    body = bytearray()
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return messages, bytes(body), False
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return messages, bytes(body), True
+        if len(body) >= limit:
+            return messages, bytes(body), False
+
+def replay(messages: List[dict], receive):
+    """receive callable that returns messages before reading on"""
+    pending = list(messages)
+
+    async def replayed():
+        if pending:
+            return pending.pop(0)
+        return await receive()
+    return replayed
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware, so a rejected upload is answered after reading at
+    most admission_identify_peek_bytes of its body, and admitted requests
+    stream through untouched apart from that replayed prefix.
+    """
+
+    def __init__(self, app, controller: Optional[AdmissionController] = None):
+        self.app = app
+        self.controller = controller or AdmissionController()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_limited(scope):
+            await self.app(scope, receive, send)
+            return
+
+        identity = header_identity(scope)
+        headers = dict(scope.get("headers") or [])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if content_type and settings.admission_identify_peek_bytes > 0:
+            messages, body, complete = await peek_body(receive, settings.admission_identify_peek_bytes)
+            receive = replay(messages, receive)
+            # The body names who owns the write; headers only fill in what it leaves out
+            identity = {**identity, **body_identity(content_type, body, complete)}
+        keys = client_keys(identity, scope)
+        rejection = self.controller.admit(keys)
+        if rejection:
+            status, detail, retry_after = rejection
+            response = JSONResponse(
+                {"detail": detail},
+                status_code=status,
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(keys)
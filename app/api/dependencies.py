@@ -0,0 +1,49 @@
+from app.config import settings
+from app.database import get_database
+from app.services.blob_index import BlobIndex
+from app.services.playlist_service import PlaylistService
+from app.services.song_service import SongService
+from app.services.cloud_storage import CloudStorageService
+from app.services.cache import get_cache
+from app.services.change_log import ChangeLog
+from app.services.export_service import ExportService
+from app.services.quota_service import QuotaService
+from app.services.search_service import SearchService
+from app.services.sync_service import SyncService
+from app.services.upload_session_service import UploadSessionService
+from app.services.direct_upload_service import DirectUploadService
+
+def get_change_log():
+    return ChangeLog(get_database()) if settings.sync_enabled else None
+
+def get_quota_service():
+    return QuotaService(get_database()) if settings.quota_enabled else None
+
+def get_playlist_service():
+    db = get_database()
+    return PlaylistService(db, cache=get_cache(), change_log=get_change_log(), quota=get_quota_service())
+
+def get_song_service():
+    db = get_database()
+    return SongService(db, cache=get_cache(), change_log=get_change_log(), quota=get_quota_service())
+
+def get_cloud_storage():
+    blob_index = BlobIndex(get_database()) if settings.storage_dedup_enabled else None
+    return CloudStorageService(blob_index=blob_index)
+
+def get_export_service():
+    db = get_database()
+    return ExportService(db)
+
+def get_search_service():
+    db = get_database()
+    return SearchService(db)
+
+def get_sync_service():
+    return SyncService(get_database(), cache=get_cache())
+
+def get_upload_session_service():
+    return UploadSessionService(get_database(), get_cloud_storage())
+
+def get_direct_upload_service():
+    return DirectUploadService(get_database(), get_cloud_storage())
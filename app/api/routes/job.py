@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Optional
+from app.schemas.job import JobResponse
+from app.services.job_queue import JobQueue, get_job_queue
+
+router = APIRouter()
+
+def require_job_queue(queue: Optional[JobQueue] = Depends(get_job_queue)) -> JobQueue:
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Background jobs are disabled")
+    return queue
+
+@router.get("/jobs", response_model=List[JobResponse])
+async def list_jobs(
+    song_id: str = Query(..., description="Jobs for this song, newest first"),
+    queue: JobQueue = Depends(require_job_queue)
+):
+    """List background jobs for a song, e.g. to see whether its analysis finished"""
+    jobs = await queue.store.find({"payload.song_id": song_id})
+    for job in jobs:
+        job["_id"] = str(job["_id"])
+    return jobs
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    queue: JobQueue = Depends(require_job_queue)
+):
+    """Get the status of a background job"""
+    job = await queue.store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job["_id"] = str(job["_id"])
+    return job
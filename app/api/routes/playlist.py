@@ -1,15 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 from typing import List, Optional
-from app.database import get_database
-from app.schemas.playlist import PlaylistCreate, PlaylistResponse
-from app.services.playlist_service import PlaylistService
+from app.api.dependencies import get_playlist_service, get_song_service, get_cloud_storage, get_quota_service
+from app.config import settings
+from app.responses import MongoJSONResponse, stream_json_array
+from app.schemas.playlist import (
+    PlaylistCreate, PlaylistResponse, PlaylistTreeResponse, PlaylistMove,
+    PlaylistUploadNode, PlaylistUploadResponse, PlaylistBatchGet, PlaylistBatchGetResponse,
+    PlaylistSongMove, PlaylistSongInsert, PlaylistSongPosition
+)
+from app.services.playlist_service import PlaylistService, PlaylistConflictError, PLAYLIST_LIST_FIELDS
+from app.services.playlist_jobs import schedule_rebalance
+from app.services.song_service import SongService
+from app.services.cloud_storage import CloudStorageService, upload_storage_paths
+from app.services.job_queue import JobQueue, get_job_queue
+from app.services.quota_service import QuotaExceededError, QuotaService, check_quota
+from app.services.song_analysis import enqueue_song_analysis
 
 router = APIRouter()
 
-def get_playlist_service():
-    db = get_database()
-    return PlaylistService(db)
-
 @router.post("/playlists", response_model=PlaylistResponse, status_code=201)
 async def create_playlist(
     playlist: PlaylistCreate,
@@ -33,35 +43,285 @@ async def create_playlist(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/playlists/upload", response_model=PlaylistUploadResponse, status_code=201)
+async def upload_playlist(
+    user_id: str = Form(...),
+    device_id: str = Form(...),
+    playlist_structure: str = Form(...),
+    audio_files: List[UploadFile] = File(...),
+    service: PlaylistService = Depends(get_playlist_service),
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage),
+    jobs: Optional[JobQueue] = Depends(get_job_queue),
+    quota: Optional[QuotaService] = Depends(get_quota_service)
+):
+    """
+    Upload a whole nested playlist tree with its audio files in one request.
+    
+    Form Data:
+    - user_id: User identifier
+    - device_id: Device identifier
+    - playlist_structure: JSON tree of {name, songs, children} (see example_upload.json)
+    - audio_files: Audio files, referenced from songs by file_index
+    
+    Files are stored concurrently, then the tree is written with a fixed
+    number of batched inserts. A file used by several songs is stored once
+    per song, so deleting one of them leaves the others playable. Returns
+    403 if the songs do not fit in the user's quota.
+    """
+    try:
+        structure = PlaylistUploadNode.model_validate_json(playlist_structure)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid playlist_structure: {e}")
+    
+    try:
+        file_indexes = service.get_upload_file_indexes(structure, len(audio_files))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        size = sum(audio_files[index].size or 0 for index in file_indexes)
+        await check_quota(quota, user_id, songs=len(file_indexes), size=size)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    try:
+        uploads = await cloud_storage.upload_audio_files(audio_files, user_id, file_indexes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
+        result = await service.create_playlist_tree(user_id, device_id, structure, uploads)
+    except QuotaExceededError as e:
+        await cloud_storage.delete_audio_files(upload_storage_paths(uploads))
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        await cloud_storage.delete_audio_files(upload_storage_paths(uploads))
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    def song_ids(node: dict):
+        yield from (song["_id"] for song in node["songs"])
+        for child in node["children"]:
+            yield from song_ids(child)
+    await enqueue_song_analysis(jobs, list(song_ids(result["playlist"])))
+    return result
+
 @router.get("/playlists", response_model=List[PlaylistResponse])
 async def get_playlists(
     user_id: Optional[str] = Query(None, description="Filter by user ID"),
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    include_songs: bool = Query(True, description="Set to false to omit song references"),
+    skip: Optional[int] = Query(None, ge=0, deprecated=True, description="Offset pagination; use cursor instead"),
     service: PlaylistService = Depends(get_playlist_service)
 ):
-    """Get all playlists, optionally filtered by user"""
-    if user_id:
-        return await service.get_playlists_by_user(user_id, skip=skip, limit=limit)
-    return await service.get_playlists(skip=skip, limit=limit)
+    """
+    Get all playlists, optionally filtered by user.
+    
+    Pages are returned in creation order. When more results exist, the
+    X-Next-Cursor response header holds the cursor for the next page.
+    Documents are encoded directly with orjson rather than validated
+    against the response model one by one.
+    """
+    if skip is not None:
+        if user_id:
+            return await service.get_playlists_by_user(user_id, skip=skip, limit=limit)
+        return await service.get_playlists(skip=skip, limit=limit)
+    
+    try:
+        if limit >= settings.json_stream_min_items:
+            # Large pages stream straight off the Motor cursor
+            next_cursor = await service.get_next_cursor(user_id, cursor, limit)
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+            documents = service.find_playlists_page(user_id, cursor, limit, include_songs)
+            return StreamingResponse(stream_json_array(documents), media_type="application/json", headers=headers)
+        
+        playlists, next_cursor = await service.get_playlists_page(
+            user_id=user_id,
+            cursor=cursor,
+            limit=limit,
+            include_songs=include_songs,
+            convert_ids=False
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(playlists, headers=headers)
+
+@router.post("/playlists:batchGet", response_model=PlaylistBatchGetResponse)
+async def batch_get_playlists(
+    request: PlaylistBatchGet,
+    service: PlaylistService = Depends(get_playlist_service)
+):
+    """
+    Get many playlists in one request.
+    
+    Playlists are resolved with one $in query and returned in the order
+    requested. IDs that do not exist (or are invalid) are listed under
+    "missing". Pass "fields" (e.g. ["name", "parent_id"]) to return only
+    those fields; leaving out "songs" keeps large playlists cheap.
+    """
+    fields = request.fields if request.fields is not None else PLAYLIST_LIST_FIELDS
+    playlists_by_id = await service.get_playlists_by_ids(request.playlist_ids, fields)
+    playlist_ids = list(dict.fromkeys(request.playlist_ids))
+    return {
+        "playlists": [playlists_by_id[pid] for pid in playlist_ids if pid in playlists_by_id],
+        "missing": [pid for pid in playlist_ids if pid not in playlists_by_id]
+    }
 
 @router.get("/playlists/{playlist_id}", response_model=PlaylistResponse)
 async def get_playlist(
     playlist_id: str,
-    service: PlaylistService = Depends(get_playlist_service)
+    expand: Optional[str] = Query(None, description="Comma-separated relations to expand, e.g. 'songs'"),
+    fields: Optional[str] = Query(None, description="Comma-separated song fields to return when expanding songs"),
+    songs_skip: int = Query(0, ge=0),
+    songs_limit: int = Query(100, ge=1, le=1000),
+    service: PlaylistService = Depends(get_playlist_service),
+    song_service: SongService = Depends(get_song_service)
 ):
-    """Get a specific playlist with its songs"""
-    playlist = await service.get_playlist(playlist_id)
+    """
+    Get a specific playlist with its songs.
+    
+    By default songs are returned as compact references ({_id, position}).
+    Use ?expand=songs to resolve them to song documents, and ?fields=title,artist
+    to return only selected song fields (fields implies expand=songs).
+    """
+    expand_songs = "songs" in (expand or "").split(",") or fields is not None
+    playlist = await service.get_playlist(
+        playlist_id,
+        songs_skip=songs_skip,
+        songs_limit=songs_limit if expand_songs else None
+    )
     if not playlist:
         raise HTTPException(status_code=404, detail="Playlist not found")
+    if expand_songs:
+        song_fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        playlist["songs"] = await song_service.hydrate_song_refs(playlist.get("songs", []), fields=song_fields)
     return playlist
 
+@router.get("/playlists/{playlist_id}/tree", response_model=PlaylistTreeResponse)
+async def get_playlist_tree(
+    playlist_id: str,
+    max_depth: Optional[int] = Query(None, ge=0, description="Levels below the root to include"),
+    expand: Optional[str] = Query(None, description="Comma-separated relations to expand, e.g. 'songs'"),
+    fields: Optional[str] = Query(None, description="Comma-separated song fields to return when expanding songs"),
+    service: PlaylistService = Depends(get_playlist_service),
+    song_service: SongService = Depends(get_song_service)
+):
+    """
+    Get a playlist with its whole nested subtree.
+    
+    The subtree is read with two indexed queries, one for the root and one
+    for its descendants through their ancestors path, whatever its depth.
+    With ?expand=songs (or ?fields=) the songs of every node are resolved
+    with one more batched query.
+    """
+    expand_songs = "songs" in (expand or "").split(",") or fields is not None
+    tree = await service.get_playlist_tree(playlist_id, max_depth=max_depth)
+    if not tree:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    
+    if expand_songs:
+        nodes = []
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node["children"])
+        song_fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        songs = await song_service.hydrate_song_refs(
+            [ref for node in nodes for ref in node.get("songs", [])],
+            fields=song_fields
+        )
+        songs_by_id = {song["_id"]: song for song in songs}
+        for node in nodes:
+            node["songs"] = [
+                {**songs_by_id[ref["_id"]], "position": ref.get("position")}
+                for ref in node.get("songs", []) if ref["_id"] in songs_by_id
+            ]
+    return tree
+
+@router.post("/playlists/{playlist_id}/move", response_model=PlaylistResponse)
+async def move_playlist(
+    playlist_id: str,
+    move: PlaylistMove,
+    service: PlaylistService = Depends(get_playlist_service)
+):
+    """
+    Move a playlist and everything nested under it to a new parent.
+    Set parent_id to null to make it a top-level playlist.
+    """
+    try:
+        moved = await service.move_playlist(playlist_id, move.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not moved:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    return await service.get_playlist(playlist_id)
+
+async def _place_song(
+    service: PlaylistService,
+    jobs: Optional[JobQueue],
+    playlist_id: str,
+    song_id: str,
+    target: PlaylistSongMove,
+    insert: bool
+) -> dict:
+    try:
+        placed = await service.place_song(
+            playlist_id,
+            song_id,
+            before_song_id=target.before_song_id,
+            after_song_id=target.after_song_id,
+            index=target.index,
+            insert=insert
+        )
+    except PlaylistConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not placed:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+    if placed["rebalance"]:
+        await schedule_rebalance(jobs, service, playlist_id)
+    return placed
+
+@router.post("/playlists/{playlist_id}/songs", response_model=PlaylistSongPosition, status_code=201)
+async def insert_song(
+    playlist_id: str,
+    placement: PlaylistSongInsert,
+    service: PlaylistService = Depends(get_playlist_service),
+    jobs: Optional[JobQueue] = Depends(get_job_queue)
+):
+    """
+    Add an existing song to a playlist at a given place.
+    
+    Example: {"song_id": "...", "after_song_id": "..."}. Use before_song_id,
+    after_song_id or index (0-based) to place it; without one it is appended.
+    """
+    return await _place_song(service, jobs, playlist_id, placement.song_id, placement, insert=True)
+
+@router.post("/playlists/{playlist_id}/songs/{song_id}/move", response_model=PlaylistSongPosition)
+async def move_song(
+    playlist_id: str,
+    song_id: str,
+    move: PlaylistSongMove,
+    service: PlaylistService = Depends(get_playlist_service),
+    jobs: Optional[JobQueue] = Depends(get_job_queue)
+):
+    """
+    Move a song within a playlist.
+    
+    Example: {"before_song_id": "..."} or {"index": 0}; an empty body moves it
+    to the end. Only the moved song's position changes, so this costs the same
+    for any playlist length.
+    """
+    return await _place_song(service, jobs, playlist_id, song_id, move, insert=False)
+
 @router.delete("/playlists/{playlist_id}", status_code=200)
 async def delete_playlist(
     playlist_id: str,
     service: PlaylistService = Depends(get_playlist_service)
 ):
-    """Delete a playlist"""
+    """Delete a playlist and all playlists nested under it"""
     result = await service.delete_playlist(playlist_id)
     if not result:
         raise HTTPException(status_code=404, detail="Playlist not found")
@@ -0,0 +1,38 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from app.api.dependencies import get_search_service
+from app.responses import MongoJSONResponse
+from app.services.search_service import SearchService
+
+router = APIRouter()
+
+@router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    user_id: str = Query(..., description="Only this user's library is searched"),
+    type: Literal["songs", "playlists"] = Query("songs", description="Collection to search"),
+    mode: Literal["prefix", "text"] = Query("prefix", description="prefix for typeahead, text for ranked full-text"),
+    cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+    limit: int = Query(20, ge=1, le=100),
+    service: SearchService = Depends(get_search_service)
+):
+    """
+    Search a user's songs (title, artist, album) or playlists (name).
+    
+    - mode=prefix: every word must match, the last one as a prefix; results
+      in creation order. Suited to search-as-you-type.
+    - mode=text: ranked full-text search; each hit carries a relevance score
+      and results are ordered best first.
+    
+    When more results exist, the X-Next-Cursor response header holds the
+    cursor for the next page. Cursors are specific to the mode.
+    """
+    try:
+        if mode == "prefix":
+            hits, next_cursor = await service.prefix_search(type, user_id, q, cursor, limit)
+        else:
+            hits, next_cursor = await service.text_search(type, user_id, q, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return MongoJSONResponse(hits, headers=headers)
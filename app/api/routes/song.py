@@ -1,19 +1,19 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query
-from typing import Optional
-from app.database import get_database
-from app.schemas.song import SongResponse
-from app.services.song_service import SongService
-from app.services.cloud_storage import CloudStorageService
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Query, Request
+from pydantic import TypeAdapter, ValidationError
+from typing import List, Optional
+from app.api.dependencies import get_song_service, get_cloud_storage, get_quota_service
+from app.schemas.song import (
+    SongResponse, SongMetadata, SongBatchDelete, SongBatchDeleteResponse, SongBatchGet, SongBatchGetResponse
+)
+from app.services.song_service import SongService, build_song_document, SONG_FIELDS
+from app.services.cloud_storage import CloudStorageService, upload_storage_paths
+from app.services.job_queue import JobQueue, get_job_queue
+from app.services.quota_service import QuotaExceededError, QuotaService, check_quota
+from app.services.song_analysis import enqueue_song_analysis
+from app.streaming import stream_song
 
 router = APIRouter()
 
-def get_song_service():
-    db = get_database()
-    return SongService(db)
-
-def get_cloud_storage():
-    return CloudStorageService()
-
 @router.post("/songs/add-to-playlist", response_model=SongResponse, status_code=201)
 async def add_song_to_playlist(
     playlist_id: str = Form(...),
@@ -25,14 +25,16 @@ async def add_song_to_playlist(
     album: Optional[str] = Form(None),
     duration: Optional[int] = Form(None),
     song_service: SongService = Depends(get_song_service),
-    cloud_storage: CloudStorageService = Depends(get_cloud_storage)
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage),
+    jobs: Optional[JobQueue] = Depends(get_job_queue),
+    quota: Optional[QuotaService] = Depends(get_quota_service)
 ):
     """
     Add a song to a playlist by uploading audio file.
     
     This endpoint:
     1. Receives audio file from mobile
-    2. Uploads to cloud storage (S3/GCS)
+    2. Streams it to cloud storage in fixed-size chunks
     3. Creates song record with cloud URL
     4. Adds song to specified playlist
     
@@ -45,11 +47,21 @@ async def add_song_to_playlist(
     - artist: Artist name (optional)
     - album: Album name (optional)
     - duration: Duration in seconds (optional)
+    
+    Returns 403 if the song does not fit in the user's quota.
     """
+    try:
+        await check_quota(quota, user_id, songs=1, size=audio_file.size or 0)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
     try:
         # Upload audio file to cloud storage
         upload_result = await cloud_storage.upload_audio_file(audio_file, user_id)
-        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    try:
         # Create song record
         song = await song_service.create_song_and_add_to_playlist(
             playlist_id=playlist_id,
@@ -63,15 +75,113 @@ async def add_song_to_playlist(
             file_url=upload_result["file_url"],
             storage_path=upload_result["storage_path"],
             file_size=upload_result["file_size"],
-            original_filename=upload_result["original_filename"]
+            original_filename=upload_result["original_filename"],
+            content_hash=upload_result["content_hash"]
+        )
+    except QuotaExceededError as e:
+        await cloud_storage.delete_audio_files([upload_result["storage_path"]])
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        await cloud_storage.delete_audio_files([upload_result["storage_path"]])
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await cloud_storage.delete_audio_files([upload_result["storage_path"]])
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # Duration, tags and waveform are extracted in the background
+    await enqueue_song_analysis(jobs, [song["_id"]])
+    return song
+
+@router.post("/songs/add-many-to-playlist", response_model=List[SongResponse], status_code=201)
+async def add_songs_to_playlist(
+    playlist_id: str = Form(...),
+    user_id: str = Form(...),
+    device_id: str = Form(...),
+    songs: str = Form(...),
+    audio_files: List[UploadFile] = File(...),
+    song_service: SongService = Depends(get_song_service),
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage),
+    jobs: Optional[JobQueue] = Depends(get_job_queue),
+    quota: Optional[QuotaService] = Depends(get_quota_service)
+):
+    """
+    Add several songs to one playlist in a single request.
+    
+    Form Data:
+    - playlist_id: Playlist to add songs to
+    - user_id: User identifier
+    - device_id: Device identifier
+    - songs: JSON list of {title, artist, album, duration}, one entry per audio file
+    - audio_files: Audio files, in the same order as songs
+    
+    All songs are written with one insert and one playlist update.
+    """
+    try:
+        metadata = TypeAdapter(List[SongMetadata]).validate_json(songs)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid songs: {e}")
+    if len(metadata) != len(audio_files):
+        raise HTTPException(status_code=400, detail="songs and audio_files must have the same length")
+    try:
+        await check_quota(quota, user_id, songs=len(metadata), size=sum(audio_file.size or 0 for audio_file in audio_files))
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    try:
+        uploads = await cloud_storage.upload_audio_files(audio_files, user_id, range(len(audio_files)))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    song_docs = [
+        build_song_document(
+            user_id=user_id,
+            device_id=device_id,
+            title=song.title,
+            artist=song.artist,
+            album=song.album,
+            duration=song.duration,
+            file_id=upload["file_id"],
+            file_url=upload["file_url"],
+            storage_path=upload["storage_path"],
+            file_size=upload["file_size"],
+            original_filename=upload["original_filename"],
+            content_hash=upload["content_hash"]
         )
-        
-        return song
-        
+        for song, [upload] in zip(metadata, uploads.values())
+    ]
+    try:
+        created = await song_service.create_songs_and_add_to_playlist(playlist_id, song_docs)
+    except QuotaExceededError as e:
+        await cloud_storage.delete_audio_files(upload_storage_paths(uploads))
+        raise HTTPException(status_code=403, detail=str(e))
     except ValueError as e:
+        await cloud_storage.delete_audio_files(upload_storage_paths(uploads))
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        await cloud_storage.delete_audio_files(upload_storage_paths(uploads))
         raise HTTPException(status_code=500, detail=str(e))
+    await enqueue_song_analysis(jobs, [song["_id"] for song in created])
+    return created
+
+@router.post("/songs:batchGet", response_model=SongBatchGetResponse)
+async def batch_get_songs(
+    request: SongBatchGet,
+    service: SongService = Depends(get_song_service)
+):
+    """
+    Get many songs in one request.
+    
+    Songs are resolved with one $in query and returned in the order requested.
+    IDs that do not exist (or are invalid) are listed under "missing".
+    Pass "fields" to return only those song fields.
+    """
+    fields = request.fields if request.fields is not None else SONG_FIELDS
+    songs_by_id = await service.get_songs_by_ids(request.song_ids, fields)
+    song_ids = list(dict.fromkeys(request.song_ids))
+    return {
+        "songs": [songs_by_id[song_id] for song_id in song_ids if song_id in songs_by_id],
+        "missing": [song_id for song_id in song_ids if song_id not in songs_by_id]
+    }
 
 @router.get("/songs/{song_id}", response_model=SongResponse)
 async def get_song(
@@ -84,16 +194,59 @@ async def get_song(
         raise HTTPException(status_code=404, detail="Song not found")
     return song
 
+@router.get("/songs/{song_id}/stream")
+async def stream_song_audio(
+    song_id: str,
+    request: Request,
+    service: SongService = Depends(get_song_service),
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage)
+):
+    """
+    Stream a song's audio through the API, with seeking.
+    
+    Send "Range: bytes=start-end" to get just those bytes (206). The ETag is
+    the file's content hash: If-None-Match returns 304 when it matches, and
+    If-Range makes a Range request return the whole file if it does not.
+    """
+    song = await service.get_song(song_id)
+    if not song:
+        raise HTTPException(status_code=404, detail="Song not found")
+    try:
+        return await stream_song(request, song, cloud_storage.backend)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+@router.post("/songs:batchDelete", response_model=SongBatchDeleteResponse)
+async def batch_delete_songs(
+    request: SongBatchDelete,
+    service: SongService = Depends(get_song_service),
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage)
+):
+    """
+    Delete many songs in one request.
+    
+    Songs are removed from every playlist containing them with one batched
+    write, and their audio files are deleted from cloud storage.
+    """
+    deleted = await service.delete_songs(request.song_ids)
+    await cloud_storage.delete_audio_files([song.get("storage_path") for song in deleted])
+    deleted_ids = {song["_id"] for song in deleted}
+    return {
+        "deleted": [song_id for song_id in request.song_ids if song_id in deleted_ids],
+        "not_found": [song_id for song_id in request.song_ids if song_id not in deleted_ids]
+    }
+
 @router.delete("/songs/{song_id}", status_code=200)
 async def delete_song(
     song_id: str,
     playlist_id: Optional[str] = Query(None, description="Remove from specific playlist"),
-    service: SongService = Depends(get_song_service)
+    service: SongService = Depends(get_song_service),
+    cloud_storage: CloudStorageService = Depends(get_cloud_storage)
 ):
     """
     Delete a song or remove it from a playlist.
     - If playlist_id is provided: removes song from that playlist only
-    - If playlist_id is not provided: deletes song completely
+    - If playlist_id is not provided: deletes song completely, including its audio file
     """
     if playlist_id:
         result = await service.remove_song_from_playlist(song_id, playlist_id)
@@ -101,7 +254,8 @@ async def delete_song(
             raise HTTPException(status_code=404, detail="Song or playlist not found")
         return {"message": "Song removed from playlist", "song_id": song_id, "playlist_id": playlist_id}
     else:
-        result = await service.delete_song(song_id)
-        if not result:
+        song = await service.delete_song(song_id)
+        if not song:
             raise HTTPException(status_code=404, detail="Song not found")
+        await cloud_storage.delete_audio_files([song.get("storage_path")])
         return {"message": "Song deleted successfully", "song_id": song_id}
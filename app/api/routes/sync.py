@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from app.api.dependencies import get_sync_service
+from app.config import settings
+from app.schemas.sync import SyncResponse
+from app.services.sync_service import SyncService, SyncTokenExpired
+
+router = APIRouter()
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync(
+    user_id: str = Query(..., description="Whose library to sync"),
+    since: Optional[str] = Query(None, description="next_token from the device's previous sync"),
+    limit: int = Query(500, ge=1, le=5000, description="Maximum change log entries to read"),
+    service: SyncService = Depends(get_sync_service)
+):
+    """
+    Return the playlists and songs created, changed or deleted since a token.
+    
+    First sync: call without since and keep next_token, then list the library
+    (GET /playlists, ...). After that, call with since=<next_token> and apply
+    the changes, repeating while has_more is true. A 410 means the token is
+    too old to sync from; start over with a first sync.
+    """
+    if not settings.sync_enabled:
+        raise HTTPException(status_code=503, detail="Incremental sync is disabled")
+    try:
+        return await service.sync(user_id, since, limit)
+    except SyncTokenExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
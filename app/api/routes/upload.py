@@ -0,0 +1,239 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from app.api.dependencies import get_direct_upload_service, get_quota_service, get_song_service, get_upload_session_service
+from app.schemas.song import SongResponse
+from app.schemas.upload import DirectUploadCreate, DirectUploadResponse, UploadSessionCreate, UploadSessionResponse
+from app.services.direct_upload_service import DirectUploadService
+from app.services.job_queue import JobQueue, get_job_queue
+from app.services.quota_service import QuotaExceededError, QuotaService, check_quota
+from app.services.song_analysis import enqueue_song_analysis
+from app.services.song_service import SongService
+from app.services.upload_session_service import UploadSessionService
+
+router = APIRouter()
+
+@router.post("/uploads", response_model=UploadSessionResponse, status_code=201)
+async def create_upload(
+    request: UploadSessionCreate,
+    uploads: UploadSessionService = Depends(get_upload_session_service),
+    quota: Optional[QuotaService] = Depends(get_quota_service)
+):
+    """
+    Start a resumable upload of one song.
+    
+    The response gives the chunk_size to use: send part N as
+    PUT /uploads/{upload_id}/parts?offset=(N-1)*chunk_size with exactly
+    chunk_size bytes (the last part may be shorter). Parts may be sent in any
+    order and in parallel; a failed part is simply sent again.
+    
+    Returns 403 if the file does not fit in the user's quota.
+    """
+    try:
+        await check_quota(quota, request.user_id, songs=1, size=request.size)
+        session = await uploads.create_session(request)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return uploads.progress(session)
+
+@router.put("/uploads/{upload_id}/parts", response_model=UploadSessionResponse)
+async def upload_part(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="Byte offset of this part in the file"),
+    uploads: UploadSessionService = Depends(get_upload_session_service)
+):
+    """Upload one part as the raw request body; it is streamed to storage as it arrives"""
+    try:
+        session = await uploads.write_part(upload_id, offset, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return uploads.progress(session)
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload(
+    upload_id: str,
+    uploads: UploadSessionService = Depends(get_upload_session_service)
+):
+    """Progress of an upload: received and missing parts, to resume after a dropped connection"""
+    session = await uploads.get_session(upload_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return uploads.progress(session)
+
+@router.post("/uploads/{upload_id}/complete", response_model=SongResponse, status_code=201)
+async def complete_upload(
+    upload_id: str,
+    uploads: UploadSessionService = Depends(get_upload_session_service),
+    song_service: SongService = Depends(get_song_service),
+    jobs: Optional[JobQueue] = Depends(get_job_queue)
+):
+    """
+    Assemble the uploaded parts and create the song in its playlist.
+    
+    Safe to retry: completing an upload that already completed returns its song.
+    """
+    try:
+        session = await uploads.complete(upload_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    if session["status"] == "completed":
+        song = await song_service.get_song(session["song_id"])
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        return song
+    
+    upload = session["upload"]
+    try:
+        song = await song_service.create_song_and_add_to_playlist(
+            playlist_id=session["playlist_id"],
+            user_id=session["user_id"],
+            device_id=session["device_id"],
+            title=session["title"],
+            artist=session.get("artist"),
+            album=session.get("album"),
+            duration=session.get("duration"),
+            file_id=upload["file_id"],
+            file_url=upload["file_url"],
+            storage_path=upload["storage_path"],
+            file_size=upload["file_size"],
+            original_filename=upload["original_filename"],
+            content_hash=upload["content_hash"]
+        )
+    except QuotaExceededError as e:
+        await uploads.fail(session)
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        await uploads.fail(session)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await uploads.fail(session)
+        raise HTTPException(status_code=500, detail=str(e))
+    await uploads.mark_completed(upload_id, song["_id"])
+    await enqueue_song_analysis(jobs, [song["_id"]])
+    return song
+
+@router.post("/direct-uploads", response_model=DirectUploadResponse, status_code=201)
+async def create_direct_upload(
+    request: DirectUploadCreate,
+    uploads: DirectUploadService = Depends(get_direct_upload_service),
+    quota: Optional[QuotaService] = Depends(get_quota_service)
+):
+    """
+    Start an upload that goes straight to storage instead of through the API.
+    
+    Send the file with the returned method, url and headers before
+    url_expires_at, then call POST /direct-uploads/{upload_id}/finalize. The
+    storage refuses a body whose size or SHA-256 differs from the declared
+    ones. If upload_required is false the file is already stored: finalize
+    right away. Returns 403 if the file does not fit in the user's quota.
+    """
+    try:
+        await check_quota(quota, request.user_id, songs=1, size=request.size)
+        return await uploads.create_upload(request)
+    except QuotaExceededError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/direct-uploads/{upload_id}", response_model=DirectUploadResponse)
+async def get_direct_upload(
+    upload_id: str,
+    uploads: DirectUploadService = Depends(get_direct_upload_service)
+):
+    """Status of a direct upload (a presigned URL is only returned when one is issued)"""
+    upload = await uploads.get_upload(upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return uploads.view(upload)
+
+@router.post("/direct-uploads/{upload_id}/url", response_model=DirectUploadResponse)
+async def renew_direct_upload_url(
+    upload_id: str,
+    uploads: DirectUploadService = Depends(get_direct_upload_service)
+):
+    """
+    Issue a new presigned target for a pending upload.
+    
+    Use it when url_expires_at has passed, or when finalize answers 409
+    because an upload that needed no transfer lost its stored copy.
+    """
+    try:
+        upload = await uploads.renew_url(upload_id)
+    except NotImplementedError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
+
+@router.post("/direct-uploads/{upload_id}/finalize", response_model=SongResponse, status_code=201)
+async def finalize_direct_upload(
+    upload_id: str,
+    uploads: DirectUploadService = Depends(get_direct_upload_service),
+    song_service: SongService = Depends(get_song_service),
+    jobs: Optional[JobQueue] = Depends(get_job_queue)
+):
+    """
+    Verify the uploaded file's size and SHA-256 and create the song in its playlist.
+    
+    Safe to retry: finalizing an upload that already finished returns its song.
+    """
+    try:
+        upload = await uploads.finalize(upload_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    if upload["status"] == "completed":
+        song = await song_service.get_song(upload["song_id"])
+        if not song:
+            raise HTTPException(status_code=404, detail="Song not found")
+        return song
+    
+    stored = upload["upload"]
+    try:
+        song = await song_service.create_song_and_add_to_playlist(
+            playlist_id=upload["playlist_id"],
+            user_id=upload["user_id"],
+            device_id=upload["device_id"],
+            title=upload["title"],
+            artist=upload.get("artist"),
+            album=upload.get("album"),
+            duration=upload.get("duration"),
+            file_id=stored["file_id"],
+            file_url=stored["file_url"],
+            storage_path=stored["storage_path"],
+            file_size=stored["file_size"],
+            original_filename=stored["original_filename"],
+            content_hash=stored["content_hash"]
+        )
+    except QuotaExceededError as e:
+        await uploads.fail(upload)
+        raise HTTPException(status_code=403, detail=str(e))
+    except ValueError as e:
+        await uploads.fail(upload)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        await uploads.fail(upload)
+        raise HTTPException(status_code=500, detail=str(e))
+    await uploads.mark_completed(upload_id, song["_id"], stored["storage_path"])
+    await enqueue_song_analysis(jobs, [song["_id"]])
+    return song
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+async def abort_upload(
+    upload_id: str,
+    uploads: UploadSessionService = Depends(get_upload_session_service)
+):
+    """Cancel an upload and discard the parts received so far"""
+    if not await uploads.abort(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
@@ -0,0 +1,37 @@
+import re
+from urllib.parse import quote
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from app.api.dependencies import get_export_service
+from app.services.export_service import ExportService
+
+router = APIRouter()
+
+def attachment_disposition(filename: str) -> str:
+    """
+    Content-Disposition for a download named after client input: a plain
+    ASCII filename for old clients plus the exact name as RFC 5987 filename*,
+    so quotes, CR/LF or non-latin-1 characters cannot break the header.
+    """
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+@router.get("/users/{user_id}/export")
+async def export_user_library(
+    user_id: str,
+    service: ExportService = Depends(get_export_service)
+):
+    """
+    Export a user's playlists and songs as NDJSON.
+    
+    Lines are {"type": "header" | "playlist" | "song", ...}. Playlists carry
+    parent_id and song references; songs carry their metadata and storage
+    location. The response is streamed from the database with constant memory.
+    Use export_to_upload_structures() in app/services/export_service.py to turn
+    an export back into bulk upload requests.
+    """
+    return StreamingResponse(
+        service.stream_user_library(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": attachment_disposition(f"{user_id}-library.ndjson")}
+    )
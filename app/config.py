@@ -1,11 +1,117 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     mongodb_url: str = "mongodb://localhost:27017"
     mongodb_db_name: str = "playlist_db"
+    mongodb_use_transactions: bool = False  # Requires a replica set or sharded cluster
     api_host: str = "127.0.0.1"
     api_port: int = 8000
     
+    # MongoDB connection pool (per worker process)
+    mongodb_max_pool_size: int = 100
+    mongodb_min_pool_size: int = 10  # Connections opened during startup and kept warm
+    mongodb_max_idle_time_ms: Optional[int] = None
+    mongodb_wait_queue_timeout_ms: Optional[int] = 5000  # Fail fast instead of queueing forever for a connection
+    mongodb_connect_timeout_ms: int = 10000
+    mongodb_server_selection_timeout_ms: int = 10000
+    mongodb_socket_timeout_ms: Optional[int] = None
+    mongodb_read_preference: str = "primary"  # primary, primaryPreferred, secondary, secondaryPreferred, nearest
+    mongodb_write_concern: Optional[str] = None  # e.g. "1" or "majority"; None uses the server default
+    mongodb_compressors: str = ""  # e.g. "zstd,snappy,zlib"; zstd/snappy need their Python packages
+    
+    # Production server (serve.py)
+    api_workers: int = 1  # 0 means one worker per CPU; more than 1 needs the per-process features off
+    api_backlog: int = 2048
+    api_keepalive_timeout: int = 5
+    api_access_log: bool = False
+    json_stream_min_items: int = 500  # List pages at least this large are streamed instead of buffered
+    
+    # Startup checks
+    create_indexes_on_startup: bool = True
+    verify_query_plans_on_startup: bool = False  # Fail startup if a service query would COLLSCAN
+    
+    # Audio storage
+    storage_backend: str = "local"  # local or s3
+    storage_local_root: str = "./storage"
+    storage_base_url: str = "https://cdn.example.com"
+    upload_chunk_size: int = 1024 * 1024  # Bytes read per chunk while streaming uploads
+    upload_concurrency: int = 4  # Files stored in parallel by the bulk upload endpoint
+    storage_dedup_enabled: bool = True  # Store identical files once (content-addressed, reference counted)
+    storage_upload_url: Optional[str] = "http://127.0.0.1:9000"  # Local stand-in storage server for direct uploads
+    storage_signing_secret: str = ""  # Signs direct upload URLs; shared with the stand-in server, required for direct uploads
+    storage_server_port: int = 9000
+    stream_chunk_size: int = 256 * 1024  # Bytes per read when streaming local files from /songs/{id}/stream
+    stream_cache_max_age_seconds: int = 24 * 60 * 60  # Cache-Control max-age for streamed audio (files never change)
+    
+    # S3 or S3-compatible storage (STORAGE_BACKEND=s3); files are served from storage_base_url
+    storage_s3_bucket: str = ""
+    storage_s3_region: Optional[str] = None
+    storage_s3_endpoint_url: Optional[str] = None  # e.g. http://127.0.0.1:9000 for MinIO; None for AWS
+    storage_s3_access_key_id: Optional[str] = None  # None uses the default AWS credential chain
+    storage_s3_secret_access_key: Optional[str] = None
+    storage_s3_addressing_style: str = "auto"  # "path" for MinIO and most local stand-ins
+    storage_s3_part_size: int = 8 * 1024 * 1024  # Multipart part size for uploads and downloads; at least 5 MiB
+    storage_s3_part_concurrency: int = 4  # Parts in flight per transfer
+    storage_s3_max_workers: int = 16  # Threads running S3 calls (per worker process)
+    
+    # Resumable uploads (/uploads)
+    resumable_chunk_size: int = 8 * 1024 * 1024  # Part size clients send; at least 5 MiB for S3-style backends
+    resumable_max_size: int = 2 * 1024 * 1024 * 1024
+    resumable_session_ttl_seconds: int = 24 * 60 * 60  # Idle time before a session expires; extended by every chunk
+    resumable_complete_lease_seconds: int = 600  # A completion that has not finished in time may be retried
+    resumable_gc_interval_seconds: int = 600  # How often expired resumable and direct uploads are collected; 0 disables the collector
+    
+    # Direct uploads (/direct-uploads): clients PUT to storage with a presigned URL
+    direct_upload_url_ttl_seconds: int = 15 * 60
+    direct_upload_session_ttl_seconds: int = 24 * 60 * 60  # Time to finalize before the upload is discarded
+    direct_upload_max_size: int = 2 * 1024 * 1024 * 1024
+    
+    # Read-through cache for playlists and songs; the built-in cache lives in one process,
+    # so it needs API_WORKERS=1 (or a shared backend installed with set_cache_backend())
+    cache_enabled: bool = False
+    cache_ttl_seconds: float = 60.0
+    cache_max_bytes: int = 64 * 1024 * 1024
+    
+    # Background jobs (post-upload audio analysis)
+    jobs_enabled: bool = True
+    jobs_concurrency: int = 2  # Jobs run at once per worker process
+    jobs_process_pool_size: int = 2  # Processes for CPU-heavy job steps
+    jobs_max_attempts: int = 5
+    jobs_retry_base_seconds: float = 5.0  # Doubles after each failed attempt
+    jobs_poll_interval_seconds: float = 1.0
+    jobs_lease_seconds: float = 300.0  # A running job is retried elsewhere if not finished in time
+    waveform_points: int = 200
+    
+    # Incremental device sync (/sync)
+    sync_enabled: bool = True  # Log every playlist and song change for /sync
+    sync_log_retention_seconds: int = 30 * 24 * 60 * 60  # Older tokens must do a full resync
+    sync_gap_timeout_seconds: float = 30.0  # How long a sync waits on a sequence number that was never written
+    
+    # Admission control for writes (per worker process); clients are identified by their user_id
+    # and device_id (X-User-Id / X-Device-Id headers, query or the start of the body)
+    admission_enabled: bool = True
+    admission_identify_peek_bytes: int = 64 * 1024  # Body bytes read to find user_id/device_id before admitting
+    admission_max_inflight_writes: int = 64  # Writes running at once before new ones get 503; 0 disables
+    admission_pool_shed_ratio: float = 0.9  # Shed writes with 503 once a Mongo pool is this full (needs metrics); 0 disables
+    admission_retry_after_seconds: int = 1  # Retry-After for 503s and concurrency 429s
+    rate_limit_user_per_second: float = 10.0  # Token refill rate; 0 disables
+    rate_limit_user_burst: int = 40
+    rate_limit_device_per_second: float = 5.0
+    rate_limit_device_burst: int = 20
+    rate_limit_max_keys: int = 100_000  # Token buckets kept per limiter, least recently used dropped first
+    concurrency_limit_per_user: int = 8  # Writes in flight per user; 0 disables
+    concurrency_limit_per_device: int = 4
+    rate_limit_unidentified_by_address: bool = False  # Limit writes naming no user or device by client address
+    
+    # Per-user quotas, checked against counters in user_usage; 0 means unlimited
+    quota_enabled: bool = True  # Maintain the usage counters and enforce the limits below
+    quota_max_songs_per_user: int = 50_000
+    quota_max_bytes_per_user: int = 100 * 1024 * 1024 * 1024
+    
+    # Request and MongoDB metrics, exposed on /metrics
+    metrics_enabled: bool = True
+    
     class Config:
         env_file = ".env"
 
@@ -1,15 +1,48 @@
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.config import settings
+from app.metrics import get_event_listeners
 
 class MongoDB:
     client: AsyncIOMotorClient = None
     
 mongodb = MongoDB()
 
+def get_client_options() -> dict:
+    """Build Motor client options from settings"""
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "readPreference": settings.mongodb_read_preference,
+        "event_listeners": get_event_listeners(),
+    }
+    if settings.mongodb_max_idle_time_ms is not None:
+        options["maxIdleTimeMS"] = settings.mongodb_max_idle_time_ms
+    if settings.mongodb_wait_queue_timeout_ms is not None:
+        options["waitQueueTimeoutMS"] = settings.mongodb_wait_queue_timeout_ms
+    if settings.mongodb_socket_timeout_ms is not None:
+        options["socketTimeoutMS"] = settings.mongodb_socket_timeout_ms
+    if settings.mongodb_write_concern:
+        w = settings.mongodb_write_concern
+        options["w"] = int(w) if w.isdigit() else w
+    if settings.mongodb_compressors:
+        options["compressors"] = settings.mongodb_compressors
+    return options
+
 async def connect_to_mongo():
-    mongodb.client = AsyncIOMotorClient(settings.mongodb_url)
+    mongodb.client = AsyncIOMotorClient(settings.mongodb_url, **get_client_options())
     print(f"Connected to MongoDB at {settings.mongodb_url}")
 
+async def warm_connection_pool():
+    """
+    Open min_pool_size connections up front so the first requests after a
+    deploy don't pay connection setup and server selection latency.
+    """
+    db = get_database()
+    await asyncio.gather(*(db.command("ping") for _ in range(max(settings.mongodb_min_pool_size, 1))))
+
 async def close_mongo_connection():
     mongodb.client.close()
     print("Closed MongoDB connection")
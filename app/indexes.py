@@ -0,0 +1,214 @@
+"""
+Declarative index registry and query-plan verification.
+
+Every query shape the services issue should be listed in QUERY_SHAPES and be
+covered by an index in INDEXES. Run the check manually with:
+
+    python -m app.indexes          # create indexes
+    python -m app.indexes --check  # create indexes, then explain() every query shape
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, List
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, TEXT, IndexModel
+from app.config import settings
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "playlists": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_1__id_1"),
+        IndexModel([("parent_id", ASCENDING)], name="parent_id_1"),
+        IndexModel([("ancestors", ASCENDING)], name="ancestors_1"),
+        IndexModel([("songs._id", ASCENDING)], name="songs._id_1"),
+        IndexModel([("user_id", ASCENDING), ("search_terms", ASCENDING)], name="user_id_1_search_terms_1"),
+        IndexModel([("user_id", ASCENDING), ("name", TEXT)], name="user_id_1_name_text", default_language="none"),
+    ],
+    "songs": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id_1__id_1"),
+        IndexModel([("user_id", ASCENDING), ("search_terms", ASCENDING)], name="user_id_1_search_terms_1"),
+        IndexModel(
+            [("user_id", ASCENDING), ("title", TEXT), ("artist", TEXT), ("album", TEXT)],
+            name="user_id_1_song_text",
+            weights={"title": 10, "artist": 5, "album": 2},
+            default_language="none"
+        ),
+    ],
+    "jobs": [
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_1_run_at_1"),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)], name="status_1_locked_until_1"),
+        IndexModel([("payload.song_id", ASCENDING)], name="payload.song_id_1"),
+    ],
+    "changes": [
+        IndexModel([("user_id", ASCENDING), ("seq", ASCENDING)], name="user_id_1_seq_1", unique=True),
+        IndexModel([("at", ASCENDING)], name="at_ttl", expireAfterSeconds=settings.sync_log_retention_seconds),
+    ],
+    "upload_sessions": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1"),
+    ],
+    "direct_uploads": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_1"),
+    ],
+    "blobs": [
+        IndexModel([("storage_path", ASCENDING)], name="storage_path_1", unique=True),
+    ],
+}
+
+# Representative filters for each query the services run; values are placeholders
+QUERY_SHAPES: List[dict] = [
+    {"name": "playlist_by_id", "collection": "playlists", "filter": {"_id": ObjectId()}},
+    {
+        "name": "playlists_by_user",
+        "collection": "playlists",
+        "filter": {"user_id": "user"},
+        "sort": [("_id", ASCENDING)],
+    },
+    {
+        "name": "playlists_by_user_page",
+        "collection": "playlists",
+        "filter": {"user_id": "user", "_id": {"$gt": ObjectId()}},
+        "sort": [("_id", ASCENDING)],
+    },
+    {
+        "name": "playlists_page",
+        "collection": "playlists",
+        "filter": {"_id": {"$gt": ObjectId()}},
+        "sort": [("_id", ASCENDING)],
+    },
+    {"name": "playlists_by_parent", "collection": "playlists", "filter": {"parent_id": "parent"}},
+    {"name": "playlist_descendants", "collection": "playlists", "filter": {"ancestors": "playlist"}},
+    {
+        "name": "playlist_subtree",
+        "collection": "playlists",
+        "filter": {"$or": [{"_id": ObjectId()}, {"ancestors": "playlist"}]},
+    },
+    {"name": "playlists_containing_song", "collection": "playlists", "filter": {"songs._id": "song"}},
+    {"name": "song_by_id", "collection": "songs", "filter": {"_id": ObjectId()}},
+    {"name": "expired_upload_sessions", "collection": "upload_sessions", "filter": {"expires_at": {"$lte": datetime.utcnow()}}},
+    {"name": "expired_direct_uploads", "collection": "direct_uploads", "filter": {"expires_at": {"$lte": datetime.utcnow()}}},
+    {
+        "name": "due_jobs",
+        "collection": "jobs",
+        "filter": {"$or": [
+            {"status": "queued", "run_at": {"$lte": datetime.utcnow()}},
+            {"status": "running", "locked_until": {"$lte": datetime.utcnow()}},
+        ]},
+        "sort": [("run_at", ASCENDING)],
+    },
+    {"name": "jobs_by_song", "collection": "jobs", "filter": {"payload.song_id": "song"}, "sort": [("_id", -1)]},
+    {
+        "name": "changes_since",
+        "collection": "changes",
+        "filter": {"user_id": "user", "seq": {"$gt": 0}},
+        "sort": [("seq", ASCENDING)],
+    },
+    {"name": "user_usage_by_id", "collection": "user_usage", "filter": {"_id": "user"}},
+    {"name": "blob_by_hash", "collection": "blobs", "filter": {"_id": "sha256"}},
+    {"name": "blob_by_path", "collection": "blobs", "filter": {"storage_path": "audio/ab/abcd.mp3"}},
+    {
+        "name": "songs_by_user",
+        "collection": "songs",
+        "filter": {"user_id": "user"},
+        "sort": [("_id", ASCENDING)],
+    },
+    {"name": "songs_by_ids", "collection": "songs", "filter": {"_id": {"$in": [ObjectId(), ObjectId()]}}},
+    {"name": "playlists_by_ids", "collection": "playlists", "filter": {"_id": {"$in": [ObjectId(), ObjectId()]}}},
+    {
+        "name": "songs_prefix_search",
+        "collection": "songs",
+        "filter": {"user_id": "user", "$and": [{"search_terms": {"$regex": "^abc"}}]},
+        "sort": [("_id", ASCENDING)],
+    },
+    {"name": "songs_text_search", "collection": "songs", "filter": {"user_id": "user", "$text": {"$search": "abc"}}},
+    {
+        "name": "playlists_prefix_search",
+        "collection": "playlists",
+        "filter": {"user_id": "user", "$and": [{"search_terms": {"$regex": "^abc"}}]},
+        "sort": [("_id", ASCENDING)],
+    },
+    {"name": "playlists_text_search", "collection": "playlists", "filter": {"user_id": "user", "$text": {"$search": "abc"}}},
+]
+
+class QueryPlanError(RuntimeError):
+    """Raised when a registered query shape would scan a whole collection"""
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """
+    Create every registered index. Safe to call on every startup.
+
+    A TTL taken from settings may differ from the one an existing index was
+    built with; create_indexes() would fail with IndexOptionsConflict, so
+    the new expireAfterSeconds is applied in place with collMod first.
+    """
+    for collection, indexes in INDEXES.items():
+        await _update_ttls(db, collection, indexes)
+        await db[collection].create_indexes(indexes)
+
+async def _update_ttls(db: AsyncIOMotorDatabase, collection: str, indexes: List[IndexModel]) -> None:
+    ttl_indexes = [index.document for index in indexes if "expireAfterSeconds" in index.document]
+    if not ttl_indexes:
+        return
+    existing = await db[collection].index_information()
+    for index in ttl_indexes:
+        current = existing.get(index["name"])
+        if current is not None and current.get("expireAfterSeconds") != index["expireAfterSeconds"]:
+            await db.command(
+                "collMod",
+                collection,
+                index={"name": index["name"], "expireAfterSeconds": index["expireAfterSeconds"]}
+            )
+
+def _plan_stages(plan) -> List[str]:
+    """Collect every stage name in an explain() plan tree"""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def verify_query_plans(db: AsyncIOMotorDatabase) -> Dict[str, List[str]]:
+    """
+    Run explain() on each registered query shape.
+
+    Returns the winning plan stages per shape, or raises QueryPlanError
+    listing every shape whose plan contains a COLLSCAN.
+    """
+    plans = {}
+    failures = []
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        explain = await cursor.explain()
+        stages = _plan_stages(explain.get("queryPlanner", {}).get("winningPlan", {}))
+        plans[shape["name"]] = stages
+        if "COLLSCAN" in stages:
+            failures.append(f"{shape['name']} ({shape['collection']}: {shape['filter']})")
+    if failures:
+        raise QueryPlanError("Query shapes would scan whole collections: " + ", ".join(failures))
+    return plans
+
+async def main(check: bool):
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    try:
+        db = client[settings.mongodb_db_name]
+        await ensure_indexes(db)
+        print("Indexes created")
+        if check:
+            for name, stages in (await verify_query_plans(db)).items():
+                print(f"{name}: {' <- '.join(stages)}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(check="--check" in sys.argv[1:]))
+    except QueryPlanError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
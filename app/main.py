@@ -1,14 +1,50 @@
+import asyncio
+import time
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
-from app.api.routes import playlist, song
-from app.database import connect_to_mongo, close_mongo_connection
+from app.api.routes import job, playlist, search, song, sync, upload, user
+from app.admission import AdmissionMiddleware
+from app.config import settings
+from app.api.dependencies import get_direct_upload_service, get_upload_session_service
+from app.database import connect_to_mongo, close_mongo_connection, get_database, warm_connection_pool
+from app.indexes import ensure_indexes, verify_query_plans
+from app.metrics import MetricsMiddleware, pool_stats, render_metrics
+from app.services.cache import get_cache
+from app.services.job_queue import create_job_queue
+from app.services.playlist_jobs import register_playlist_jobs
+from app.services.song_analysis import register_song_jobs
+from app.services.upload_session_service import collect_expired_uploads
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    # Fails fast if the cache cannot be consistent with this many workers
+    get_cache()
     await connect_to_mongo()
+    await warm_connection_pool()
+    if settings.create_indexes_on_startup:
+        await ensure_indexes(get_database())
+    if settings.verify_query_plans_on_startup:
+        await verify_query_plans(get_database())
+    upload_gc = []
+    if settings.resumable_gc_interval_seconds > 0:
+        upload_gc = [
+            asyncio.create_task(collect_expired_uploads(factory, settings.resumable_gc_interval_seconds))
+            for factory in (get_upload_session_service, get_direct_upload_service)
+        ]
+    job_queue = None
+    if settings.jobs_enabled:
+        job_queue = create_job_queue(get_database())
+        register_song_jobs(job_queue)
+        register_playlist_jobs(job_queue)
+        await job_queue.start()
     yield
     # Shutdown
+    if job_queue:
+        await job_queue.stop()
+    for task in upload_gc:
+        task.cancel()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -18,9 +54,20 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware)
+# Added last so it is outermost and also counts requests shed by admission control
+if settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(playlist.router, prefix="/api/v1", tags=["playlists"])
 app.include_router(song.router, prefix="/api/v1", tags=["songs"])
+app.include_router(user.router, prefix="/api/v1", tags=["users"])
+app.include_router(search.router, prefix="/api/v1", tags=["search"])
+app.include_router(upload.router, prefix="/api/v1", tags=["uploads"])
+app.include_router(job.router, prefix="/api/v1", tags=["jobs"])
+app.include_router(sync.router, prefix="/api/v1", tags=["sync"])
 
 @app.get("/")
 def read_root():
@@ -28,4 +75,33 @@ def read_root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "database": "mongodb"}
+    """Ping the database and report connection pool usage; 503 if MongoDB is unreachable"""
+    start = time.perf_counter()
+    try:
+        await get_database().command("ping")
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unhealthy", "database": {"ok": False, "error": str(e)}}
+        )
+    return {
+        "status": "healthy",
+        "database": {"ok": True, "ping_ms": round((time.perf_counter() - start) * 1000, 2)},
+        "pool": {
+            "max_pool_size": settings.mongodb_max_pool_size,
+            "min_pool_size": settings.mongodb_min_pool_size,
+            "servers": pool_stats()
+        }
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    cache = get_cache()
+    if not cache:
+        return {"enabled": False}
+    return {"enabled": True, **cache.backend.stats()}
@@ -0,0 +1,311 @@
+"""
+In-process request metrics with Prometheus text exposition.
+
+- MetricsMiddleware records per-route latency, in-flight requests and
+  request/response sizes, and adds a Server-Timing header.
+- MongoCommandListener and MongoPoolListener (passed to the Mongo client as
+  event_listeners) time every command and track connection pool usage.
+- Commands and storage operations are attributed to the request that issued
+  them through a context variable; Motor copies the context into the threads
+  that run PyMongo, so listener callbacks see the request's stats.
+
+Metrics are per worker process, like the in-memory cache; Prometheus should
+scrape each worker or the values be aggregated.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+from app.config import settings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], list] = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', repr(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {state[-1]}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {state[-2]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {state[-1]}")
+        return lines
+
+REGISTRY: List[_Metric] = []
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# HTTP
+http_requests = Counter("http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being handled", ("method",))
+http_request_size = Histogram("http_request_size_bytes", "HTTP request body size", ("method", "route"), SIZE_BUCKETS)
+http_response_size = Histogram("http_response_size_bytes", "HTTP response body size", ("method", "route"), SIZE_BUCKETS)
+
+# MongoDB
+mongo_command_duration = Histogram("mongo_command_duration_seconds", "MongoDB command round-trip time", ("command",))
+mongo_commands = Counter("mongo_commands_total", "MongoDB commands by outcome", ("command", "status"))
+mongo_commands_per_request = Histogram("mongo_commands_per_request", "MongoDB commands issued per HTTP request", ("route",), COUNT_BUCKETS)
+mongo_time_per_request = Histogram("mongo_time_per_request_seconds", "Time spent in MongoDB commands per HTTP request", ("route",))
+mongo_pool_connections = Gauge("mongo_pool_connections", "Open pooled connections", ("address",))
+mongo_pool_in_use = Gauge("mongo_pool_connections_in_use", "Pooled connections checked out", ("address",))
+mongo_pool_checkout_failures = Counter("mongo_pool_checkout_failures_total", "Connection checkouts that failed", ("address", "reason"))
+
+# Storage
+storage_operation_duration = Histogram("storage_operation_duration_seconds", "Audio storage operation time", ("operation",))
+storage_bytes = Counter("storage_bytes_total", "Audio bytes processed by storage operations", ("operation",))
+storage_time_per_request = Histogram("storage_time_per_request_seconds", "Time spent in audio storage per HTTP request", ("route",))
+storage_delete_failures = Counter("storage_delete_failures_total", "Audio files whose best-effort deletion failed")
+upload_cleanup_failures = Counter("upload_cleanup_failures_total", "Expired uploads that could not be removed", ("kind",))
+
+class RequestStats:
+    """Work attributed to one HTTP request; updated from Motor's worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+        self.storage_seconds = 0.0
+
+    def add_mongo(self, seconds: float) -> None:
+        with self._lock:
+            self.mongo_commands += 1
+            self.mongo_seconds += seconds
+
+    def add_storage(self, seconds: float) -> None:
+        with self._lock:
+            self.storage_seconds += seconds
+
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("current_request", default=None)
+
+def record_storage(operation: str, seconds: float, size: int = 0) -> None:
+    """Record a storage operation and attribute it to the current request"""
+    storage_operation_duration.observe(seconds, operation=operation)
+    if size:
+        storage_bytes.inc(size, operation=operation)
+    stats = current_request.get()
+    if stats:
+        stats.add_storage(seconds)
+
+class MongoCommandListener(monitoring.CommandListener):
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def _record(self, event, status: str) -> None:
+        seconds = event.duration_micros / 1_000_000
+        mongo_command_duration.observe(seconds, command=event.command_name)
+        mongo_commands.inc(command=event.command_name, status=status)
+        stats = current_request.get()
+        if stats:
+            stats.add_mongo(seconds)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, "failed")
+
+class MongoPoolListener(monitoring.ConnectionPoolListener):
+    @staticmethod
+    def _address(event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc(address=self._address(event))
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec(address=self._address(event))
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(address=self._address(event), reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        mongo_pool_in_use.inc(address=self._address(event))
+
+    def connection_checked_in(self, event):
+        mongo_pool_in_use.dec(address=self._address(event))
+
+def get_event_listeners() -> list:
+    """Listeners to pass to the Mongo client"""
+    if not settings.metrics_enabled:
+        return []
+    return [MongoCommandListener(), MongoPoolListener()]
+
+def pool_stats() -> dict:
+    """Connection pool usage per server, from the pool listener"""
+    with mongo_pool_connections._lock:
+        addresses = [key[0] for key in mongo_pool_connections._values]
+    return {
+        address: {
+            "open": int(mongo_pool_connections.get(address=address)),
+            "in_use": int(mongo_pool_in_use.get(address=address)),
+        }
+        for address in addresses
+    }
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware, so streaming responses pass through untouched.
+
+    Routes are labelled by their path template (e.g. /api/v1/playlists/{playlist_id})
+    to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        request_size = 0
+        response_size = 0
+        start = time.perf_counter()
+
+        async def receive_wrapper():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                timing = (
+                    f'mongo;dur={stats.mongo_seconds * 1000:.1f};desc="{stats.mongo_commands} commands", '
+                    f"storage;dur={stats.storage_seconds * 1000:.1f}, "
+                    f"app;dur={(time.perf_counter() - start) * 1000:.1f}"
+                )
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            http_requests_in_flight.dec(method=method)
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            elapsed = time.perf_counter() - start
+            http_requests.inc(method=method, route=route, status=str(status))
+            http_request_duration.observe(elapsed, method=method, route=route)
+            http_request_size.observe(request_size, method=method, route=route)
+            http_response_size.observe(response_size, method=method, route=route)
+            mongo_commands_per_request.observe(stats.mongo_commands, route=route)
+            mongo_time_per_request.observe(stats.mongo_seconds, route=route)
+            if stats.storage_seconds:
+                storage_time_per_request.observe(stats.storage_seconds, route=route)
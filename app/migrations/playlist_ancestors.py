@@ -0,0 +1,52 @@
+"""
+Backfill the materialized ancestors path on playlists.
+
+Run with: python -m app.migrations.playlist_ancestors
+
+Walks the tree level by level from the top-level playlists using parent_id,
+so it costs one query and one bulk write per level. Safe to run repeatedly.
+"""
+import asyncio
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from app.config import settings
+
+async def backfill_ancestors(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Set ancestors on every playlist reachable from a top-level playlist, returning the number updated"""
+    collection = db["playlists"]
+    updated = 0
+    
+    # Each level maps playlist ID -> its ancestors path
+    level = {}
+    async for playlist in collection.find({"parent_id": None}, {"_id": 1}):
+        level[str(playlist["_id"])] = []
+    
+    while level:
+        ops = [
+            UpdateOne({"_id": ObjectId(playlist_id)}, {"$set": {"ancestors": ancestors}})
+            for playlist_id, ancestors in level.items()
+        ]
+        for start in range(0, len(ops), batch_size):
+            await collection.bulk_write(ops[start:start + batch_size], ordered=False)
+        updated += len(ops)
+        
+        next_level = {}
+        parent_ids = list(level)
+        for start in range(0, len(parent_ids), batch_size):
+            chunk = parent_ids[start:start + batch_size]
+            async for child in collection.find({"parent_id": {"$in": chunk}}, {"parent_id": 1}):
+                next_level[str(child["_id"])] = level[child["parent_id"]] + [child["parent_id"]]
+        level = next_level
+    return updated
+
+async def main():
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    try:
+        updated = await backfill_ancestors(client[settings.mongodb_db_name])
+        print(f"Set ancestors on {updated} playlists")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Backfill the search_terms array used by prefix search.
+
+Run with: python -m app.migrations.search_terms
+
+Reads only the searchable fields and writes in batches. Safe to run
+repeatedly; terms are recomputed from the current field values.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from app.config import settings
+from app.services.search_service import search_terms
+
+# Source fields of search_terms per collection
+SEARCHABLE_FIELDS = {
+    "songs": ("title", "artist", "album"),
+    "playlists": ("name",),
+}
+
+async def backfill_search_terms(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Set search_terms on every song and playlist, returning the number updated"""
+    updated = 0
+    for collection_name, fields in SEARCHABLE_FIELDS.items():
+        collection = db[collection_name]
+        ops = []
+        async for doc in collection.find({}, {field: 1 for field in fields}).batch_size(batch_size):
+            terms = search_terms(*(doc.get(field) for field in fields))
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"search_terms": terms}}))
+            if len(ops) >= batch_size:
+                await collection.bulk_write(ops, ordered=False)
+                updated += len(ops)
+                ops = []
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+            updated += len(ops)
+    return updated
+
+async def main():
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    try:
+        updated = await backfill_search_terms(client[settings.mongodb_db_name])
+        print(f"Set search_terms on {updated} documents")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
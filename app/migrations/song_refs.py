@@ -0,0 +1,64 @@
+"""
+Migrate playlists that embed full song documents to compact song references.
+
+Run with: python -m app.migrations.song_refs
+
+Safe to run repeatedly; playlists that only hold references are skipped.
+"""
+import asyncio
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from app.config import settings
+from app.services.song_service import build_song_ref
+
+async def migrate_embedded_songs(db: AsyncIOMotorDatabase, batch_size: int = 500) -> int:
+    """Rewrite embedded songs as {_id, position} references, returning the number of playlists migrated"""
+    playlists_collection = db["playlists"]
+    songs_collection = db["songs"]
+    
+    playlist_ops = []
+    song_ops = []
+    migrated = 0
+    
+    async def flush():
+        nonlocal playlist_ops, song_ops, migrated
+        # Restore any embedded song missing from the songs collection before dropping the copy
+        if song_ops:
+            await songs_collection.bulk_write(song_ops, ordered=False)
+        if playlist_ops:
+            await playlists_collection.bulk_write(playlist_ops, ordered=False)
+            migrated += len(playlist_ops)
+        playlist_ops, song_ops = [], []
+    
+    cursor = playlists_collection.find(
+        {"songs": {"$elemMatch": {"position": {"$exists": False}}}},
+        {"songs": 1}
+    )
+    async for playlist in cursor:
+        refs = []
+        for position, song in enumerate(playlist["songs"]):
+            song_id = str(song["_id"])
+            refs.append(build_song_ref(song_id, position))
+            if len(song) > 1 and ObjectId.is_valid(song_id):
+                song_doc = {key: value for key, value in song.items() if key != "_id"}
+                song_ops.append(UpdateOne({"_id": ObjectId(song_id)}, {"$setOnInsert": song_doc}, upsert=True))
+        playlist_ops.append(UpdateOne(
+            {"_id": playlist["_id"]},
+            {"$set": {"songs": refs, "next_position": len(refs)}}
+        ))
+        if len(playlist_ops) >= batch_size:
+            await flush()
+    await flush()
+    return migrated
+
+async def main():
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    try:
+        migrated = await migrate_embedded_songs(client[settings.mongodb_db_name])
+        print(f"Migrated {migrated} playlists to song references")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+"""
+Recompute the per-user usage counters that quotas are checked against.
+
+Run with: python -m app.migrations.user_usage
+
+Needed once when quotas are first enabled, and to correct drift (e.g. after
+songs were deleted directly in the database). Counts every user's songs and
+bytes with one aggregation and overwrites their counters; safe to run
+repeatedly, though uploads finishing while it runs may be counted twice or
+not at all.
+"""
+import asyncio
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from app.config import settings
+
+async def recompute_usage(db: AsyncIOMotorDatabase, batch_size: int = 1000) -> int:
+    """Set every user's song count and total file_size, returning the number of users updated"""
+    usage_collection = db["user_usage"]
+    pipeline = [
+        {"$match": {"user_id": {"$ne": None}}},
+        {"$group": {"_id": "$user_id", "songs": {"$sum": 1}, "bytes": {"$sum": {"$ifNull": ["$file_size", 0]}}}},
+    ]
+    run_id = ObjectId()
+    ops = []
+    updated = 0
+    async for usage in db["songs"].aggregate(pipeline, allowDiskUse=True):
+        ops.append(UpdateOne(
+            {"_id": usage["_id"]},
+            {"$set": {"songs": usage["songs"], "bytes": usage["bytes"], "recomputed_by": run_id}},
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            await usage_collection.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        await usage_collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+
+    # Users whose songs are all gone
+    await usage_collection.delete_many({"recomputed_by": {"$ne": run_id}})
+    return updated
+
+async def main():
+    client = AsyncIOMotorClient(settings.mongodb_url)
+    try:
+        updated = await recompute_usage(client[settings.mongodb_db_name])
+        print(f"Recomputed usage for {updated} users")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import base64
+import struct
+from typing import Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _b64decode(cursor: str) -> bytes:
+    return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """Encode the last _id of a page as an opaque cursor"""
+    return _b64encode(last_id.binary)
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """Decode a cursor produced by encode_cursor, raising ValueError if it is malformed"""
+    try:
+        return ObjectId(_b64decode(cursor))
+    except (ValueError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor") from None
+
+def encode_sync_token(seq: int, issued_at: float) -> str:
+    """Encode a change log sequence number and the time the token was issued"""
+    return _b64encode(struct.pack(">qd", seq, issued_at))
+
+def decode_sync_token(token: str) -> Tuple[int, float]:
+    """Decode a token produced by encode_sync_token, raising ValueError if it is malformed"""
+    try:
+        seq, issued_at = struct.unpack(">qd", _b64decode(token))
+    except (ValueError, TypeError, struct.error):
+        raise ValueError("Invalid sync token") from None
+    if seq < 0:
+        raise ValueError("Invalid sync token")
+    return seq, issued_at
+
+def encode_score_cursor(score: float, last_id: ObjectId) -> str:
+    """Encode the (score, _id) of the last hit of a ranked page"""
+    return _b64encode(struct.pack(">d", score) + last_id.binary)
+
+def decode_score_cursor(cursor: str) -> Tuple[float, ObjectId]:
+    """Decode a cursor produced by encode_score_cursor, raising ValueError if it is malformed"""
+    try:
+        raw = _b64decode(cursor)
+        if len(raw) != 20:
+            raise ValueError
+        return struct.unpack(">d", raw[:8])[0], ObjectId(raw[8:])
+    except (ValueError, TypeError, InvalidId, struct.error):
+        raise ValueError("Invalid cursor") from None
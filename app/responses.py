@@ -0,0 +1,46 @@
+"""
+Fast JSON responses for Mongo documents.
+
+Documents are encoded straight from BSON types with orjson, skipping the
+per-item Pydantic validation and the Python walk that converts ObjectIds.
+Callers are responsible for projecting documents to the response shape.
+"""
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator
+import orjson
+from bson import ObjectId, Decimal128
+from fastapi.responses import Response
+
+def bson_default(obj: Any) -> Any:
+    """orjson fallback for BSON types it does not know"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=bson_default)
+
+class MongoJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+async def stream_json_array(documents: AsyncIterator[dict]) -> AsyncIterator[bytes]:
+    """Encode documents as a JSON array while they come off a Motor cursor"""
+    yield b"["
+    first = True
+    async for document in documents:
+        if first:
+            first = False
+            yield dumps(document)
+        else:
+            yield b"," + dumps(document)
+    yield b"]"
@@ -0,0 +1,19 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Optional
+
+class JobResponse(BaseModel):
+    id: str = Field(alias="_id")
+    type: str
+    status: str  # queued, running, succeeded or failed
+    payload: dict
+    attempts: int
+    max_attempts: int
+    run_at: Optional[datetime] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    
+    class Config:
+        populate_by_name = True
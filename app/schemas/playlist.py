@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List
 
 class PlaylistBase(BaseModel):
@@ -22,3 +22,53 @@ class PlaylistResponse(BaseModel):
     class Config:
         populate_by_name = True
         from_attributes = True
+
+class PlaylistTreeResponse(PlaylistResponse):
+    children: List["PlaylistTreeResponse"] = []
+
+class PlaylistMove(BaseModel):
+    parent_id: Optional[str] = None
+
+class PlaylistSongMove(BaseModel):
+    """Where to put a song: before or after another song, or at an index; last if none is given"""
+    before_song_id: Optional[str] = None
+    after_song_id: Optional[str] = None
+    index: Optional[int] = Field(None, ge=0)
+    
+    @model_validator(mode="after")
+    def check_single_target(self):
+        if sum(value is not None for value in (self.before_song_id, self.after_song_id, self.index)) > 1:
+            raise ValueError("Give at most one of before_song_id, after_song_id and index")
+        return self
+
+class PlaylistSongInsert(PlaylistSongMove):
+    song_id: str
+
+class PlaylistSongPosition(BaseModel):
+    song_id: str
+    position: float
+
+class PlaylistUploadSong(BaseModel):
+    file_index: int = Field(ge=0)
+    title: str
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    duration: Optional[int] = None
+
+class PlaylistUploadNode(BaseModel):
+    name: str
+    songs: List[PlaylistUploadSong] = []
+    children: List["PlaylistUploadNode"] = []
+
+class PlaylistUploadResponse(BaseModel):
+    playlists_created: int
+    songs_created: int
+    playlist: dict
+
+class PlaylistBatchGet(BaseModel):
+    playlist_ids: List[str] = Field(min_length=1, max_length=1000)
+    fields: Optional[List[str]] = None
+
+class PlaylistBatchGetResponse(BaseModel):
+    playlists: List[dict]
+    missing: List[str]
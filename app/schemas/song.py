@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 
 class SongBase(BaseModel):
     title: str
@@ -25,3 +25,24 @@ class SongUpload(BaseModel):
     album: Optional[str] = None
     duration: Optional[int] = None
     user_id: str
+
+class SongMetadata(BaseModel):
+    title: str
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    duration: Optional[int] = None
+
+class SongBatchDelete(BaseModel):
+    song_ids: List[str] = Field(min_length=1, max_length=1000)
+
+class SongBatchDeleteResponse(BaseModel):
+    deleted: List[str]
+    not_found: List[str]
+
+class SongBatchGet(BaseModel):
+    song_ids: List[str] = Field(min_length=1, max_length=1000)
+    fields: Optional[List[str]] = None
+
+class SongBatchGetResponse(BaseModel):
+    songs: List[dict]
+    missing: List[str]
@@ -0,0 +1,10 @@
+from pydantic import BaseModel
+from typing import List
+
+class SyncResponse(BaseModel):
+    playlists: List[dict]  # Created or changed, in their current state
+    songs: List[dict]
+    deleted_playlists: List[str]
+    deleted_songs: List[str]
+    next_token: str  # Pass as ?since= on the next sync
+    has_more: bool  # Sync again right away with next_token
@@ -0,0 +1,41 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+
+class UploadSessionCreate(BaseModel):
+    playlist_id: str
+    user_id: str
+    device_id: str
+    title: str
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    duration: Optional[int] = None
+    filename: str
+    content_type: Optional[str] = None
+    size: int = Field(gt=0, description="Total file size in bytes")
+
+class DirectUploadCreate(UploadSessionCreate):
+    sha256: str = Field(pattern="^[0-9a-f]{64}$", description="Hex SHA-256 of the file")
+
+class DirectUploadResponse(BaseModel):
+    upload_id: str
+    status: str
+    upload_required: bool  # False if the file is already stored; finalize right away
+    url: Optional[str] = None  # Presigned target, only in responses that issue one
+    method: Optional[str] = None
+    headers: Dict[str, str] = {}  # Send these headers with the upload
+    url_expires_at: Optional[datetime] = None
+    expires_at: datetime
+    song_id: Optional[str] = None
+
+class UploadSessionResponse(BaseModel):
+    upload_id: str
+    status: str
+    size: int
+    chunk_size: int
+    total_parts: int
+    received_bytes: int
+    received_parts: List[int]
+    missing_parts: List[int]
+    expires_at: datetime
+    song_id: Optional[str] = None
@@ -0,0 +1,143 @@
+"""
+CPU-bound audio inspection, run in the job queue's process pool.
+
+Everything here is a plain function of a local file path so it can be
+pickled into a worker process. Duration and tags come from mutagen, which
+reads them from the container without decoding audio. The waveform needs
+PCM samples: WAV files are read directly, other formats are decoded with
+ffmpeg when it is on PATH; otherwise the waveform is left out.
+"""
+import shutil
+import subprocess
+import wave
+from array import array
+from typing import List, Optional
+import mutagen
+
+# Tags copied from the file, using mutagen's format-independent "easy" names
+TAG_FIELDS = ("title", "artist", "album", "albumartist", "genre", "date", "tracknumber")
+
+# Decoding rate for waveforms of compressed files; plenty for a few hundred points
+FFMPEG_SAMPLE_RATE = 4000
+# WAV frames read per block when computing a waveform
+WAV_READ_FRAMES = 64 * 1024
+
+def analyze_audio(path: str, waveform_points: int = 200) -> dict:
+    """Return duration (seconds), tags, stream info and a waveform of peak levels in [0, 1]"""
+    result = {
+        "duration": None,
+        "tags": {},
+        "format": None,
+        "bitrate": None,
+        "sample_rate": None,
+        "channels": None,
+        "waveform": None,
+    }
+    try:
+        audio = mutagen.File(path, easy=True)
+    except mutagen.MutagenError:
+        audio = None
+    if audio is not None:
+        info = audio.info
+        result["format"] = type(audio).__name__.lower()
+        result["duration"] = getattr(info, "length", None)
+        result["bitrate"] = getattr(info, "bitrate", None)
+        result["sample_rate"] = getattr(info, "sample_rate", None)
+        result["channels"] = getattr(info, "channels", None)
+        for field in TAG_FIELDS:
+            try:
+                values = audio.tags.get(field) if audio.tags is not None else None
+            except (KeyError, ValueError):
+                values = None
+            if values:
+                result["tags"][field] = str(values[0])
+
+    if waveform_points > 0:
+        result["waveform"] = _wav_waveform(path, waveform_points)
+        if result["waveform"] is None:
+            result["waveform"] = _ffmpeg_waveform(path, waveform_points)
+    if result["duration"] is None:
+        result["duration"] = _wav_duration(path)
+    return result
+
+def _peaks(samples: array, full_scale: float, points: int, offset: float = 0.0) -> List[float]:
+    """Peak absolute level of each of points equal slices, scaled to [0, 1]"""
+    if not samples:
+        return []
+    step = max(1, -(-len(samples) // points))
+    peaks = []
+    for start in range(0, len(samples), step):
+        window = samples[start:start + step]
+        # min()/max() run in C, so this stays fast for millions of samples
+        peak = max(abs(max(window) - offset), abs(min(window) - offset))
+        peaks.append(round(min(peak / full_scale, 1.0), 3))
+    return peaks
+
+def _wav_duration(path: str) -> Optional[float]:
+    try:
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+def _wav_waveform(path: str, points: int) -> Optional[List[float]]:
+    """
+    Waveform of a WAV file, read WAV_READ_FRAMES frames at a time so memory
+    stays bounded however long the file is. Peaks are accumulated per window
+    as blocks arrive, matching _peaks() over the whole file.
+    """
+    try:
+        wav = wave.open(path, "rb")
+    except (wave.Error, EOFError, OSError):
+        return None
+    with wav:
+        width = wav.getsampwidth()
+        typecode = {1: "B", 2: "h", 4: "i"}.get(width)
+        if typecode is None:
+            return None
+        # 8-bit WAV is unsigned, centred on 128
+        offset = 128.0 if width == 1 else 0.0
+        full_scale = 128.0 if width == 1 else float(2 ** (8 * width - 1))
+        window = max(1, -(-wav.getnframes() * wav.getnchannels() // points))
+        peaks = []
+        peak = 0.0
+        filled = 0
+        while True:
+            data = wav.readframes(WAV_READ_FRAMES)
+            if not data:
+                break
+            samples = array(typecode)
+            samples.frombytes(data[:len(data) - len(data) % width])
+            start = 0
+            while start < len(samples):
+                chunk = samples[start:start + window - filled]
+                peak = max(peak, abs(max(chunk) - offset), abs(min(chunk) - offset))
+                filled += len(chunk)
+                start += len(chunk)
+                if filled == window:
+                    peaks.append(round(min(peak / full_scale, 1.0), 3))
+                    peak = 0.0
+                    filled = 0
+        if filled:
+            peaks.append(round(min(peak / full_scale, 1.0), 3))
+    return peaks
+
+def _ffmpeg_waveform(path: str, points: int) -> Optional[List[float]]:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return None
+    try:
+        decoded = subprocess.run(
+            [
+                ffmpeg, "-v", "error", "-i", path,
+                "-ac", "1", "-ar", str(FFMPEG_SAMPLE_RATE), "-f", "s16le", "-"
+            ],
+            capture_output=True,
+            check=True,
+            timeout=300
+        ).stdout
+    except (subprocess.SubprocessError, OSError):
+        return None
+    samples = array("h")
+    samples.frombytes(decoded[:len(decoded) - len(decoded) % 2])
+    return _peaks(samples, 32768.0, points)
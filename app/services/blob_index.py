@@ -0,0 +1,80 @@
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+class BlobIndex:
+    """
+    Reference-counted index of content-addressed audio blobs.
+    
+    One document per distinct file content, keyed by its SHA-256 hash.
+    ref_count is the number of song documents storing the blob's
+    storage_path: a reference is taken for every song created with it (even
+    when several songs come from one upload) and released for every song
+    deleted, so the blob outlives all of its songs but no longer.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["blobs"]
+    
+    async def find(self, content_hash: str) -> Optional[dict]:
+        """Look up a blob without taking a reference"""
+        return await self.collection.find_one({"_id": content_hash})
+    
+    async def acquire(self, content_hash: str, references: int = 1) -> Optional[dict]:
+        """Take references on an existing blob, or return None if it is not stored yet"""
+        return await self.collection.find_one_and_update(
+            {"_id": content_hash},
+            {"$inc": {"ref_count": references}},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def register(
+        self,
+        content_hash: str,
+        storage_path: str,
+        size: int,
+        content_type: Optional[str],
+        references: int = 1
+    ) -> dict:
+        """Record a newly stored blob with references taken (or take them if a concurrent upload got there first)"""
+        for _ in range(2):
+            try:
+                return await self.collection.find_one_and_update(
+                    {"_id": content_hash},
+                    {
+                        "$inc": {"ref_count": references},
+                        "$setOnInsert": {
+                            "storage_path": storage_path,
+                            "size": size,
+                            "content_type": content_type
+                        }
+                    },
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+            except DuplicateKeyError:
+                # Lost an upsert race with an identical upload; the retry takes a reference
+                continue
+        raise RuntimeError(f"Could not register blob {content_hash}")
+    
+    async def release(self, storage_path: str) -> Optional[bool]:
+        """
+        Drop one reference to the blob stored at storage_path, for one
+        deleted song (or one song that was never created).
+        
+        Returns True when that was the last reference and the blob has been
+        removed from the index (so its object can be deleted), False while it
+        is still referenced, and None if the path is not a tracked blob.
+        """
+        blob = await self.collection.find_one_and_update(
+            {"storage_path": storage_path},
+            {"$inc": {"ref_count": -1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if blob is None:
+            return None
+        if blob["ref_count"] > 0:
+            return False
+        result = await self.collection.delete_one({"_id": blob["_id"], "ref_count": {"$lte": 0}})
+        return result.deleted_count == 1
@@ -0,0 +1,156 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import bson
+from app.config import settings
+
+class CacheBackend(ABC):
+    """
+    Byte-oriented cache interface.
+
+    Values are opaque bytes so the same interface fits an in-process store
+    and a shared one (e.g. Redis or Memcached) used by several workers.
+    """
+
+    @abstractmethod
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        """Return the cached values for the keys that are present"""
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        """Store values, each expiring after ttl seconds"""
+
+    @abstractmethod
+    async def delete(self, keys: Iterable[str]) -> None:
+        """Remove keys if present"""
+
+    @abstractmethod
+    def stats(self) -> dict:
+        """Counters describing cache behaviour"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_many([key])).get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        await self.set_many({key: value}, ttl)
+
+class InMemoryCache(CacheBackend):
+    """Per-process LRU cache with TTL expiry and a bound on total stored bytes"""
+
+    def __init__(self, max_bytes: int, default_ttl: float):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                continue
+            value, expires_at = entry
+            if expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                continue
+            self._entries.move_to_end(key)
+            self.hits += 1
+            found[key] = value
+        return found
+
+    async def set_many(self, items: Dict[str, bytes], ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.default_ttl)
+        for key, value in items.items():
+            if len(value) > self.max_bytes:
+                continue
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at)
+            self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
+
+    async def delete(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            if key in self._entries:
+                self._remove(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class DocumentCache:
+    """Stores Mongo documents in a CacheBackend, keyed by kind and ID"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    async def get_many(self, kind: str, ids: List[str]) -> Dict[str, dict]:
+        found = await self.backend.get_many([f"{kind}:{doc_id}" for doc_id in ids])
+        return {key.split(":", 1)[1]: bson.decode(value) for key, value in found.items()}
+
+    async def get(self, kind: str, doc_id: str) -> Optional[dict]:
+        return (await self.get_many(kind, [doc_id])).get(doc_id)
+
+    async def set_many(self, kind: str, docs: List[dict]) -> None:
+        await self.backend.set_many({f"{kind}:{doc['_id']}": bson.encode(doc) for doc in docs})
+
+    async def set(self, kind: str, doc: dict) -> None:
+        await self.set_many(kind, [doc])
+
+    async def invalidate(self, kind: str, ids: Iterable[str]) -> None:
+        await self.backend.delete(f"{kind}:{doc_id}" for doc_id in ids)
+
+class CacheState:
+    backend: Optional[CacheBackend] = None
+
+cache_state = CacheState()
+
+def set_cache_backend(backend: Optional[CacheBackend]) -> None:
+    """Install a cache backend, e.g. a shared one; None restores the default"""
+    cache_state.backend = backend
+
+def get_cache() -> Optional[DocumentCache]:
+    """
+    Document cache for services, or None when caching is disabled.
+
+    The default InMemoryCache is only invalidated in the process that made
+    the write, so other workers would serve stale documents; it is refused
+    unless API_WORKERS=1. Several workers need a shared backend installed
+    with set_cache_backend() first.
+    """
+    if cache_state.backend is None and settings.cache_enabled:
+        if settings.api_workers != 1:
+            raise RuntimeError(
+                "CACHE_ENABLED uses a per-process in-memory cache, which goes stale across workers: "
+                "set API_WORKERS=1, disable the cache, or install a shared backend with set_cache_backend()"
+            )
+        cache_state.backend = InMemoryCache(settings.cache_max_bytes, settings.cache_ttl_seconds)
+    if cache_state.backend is None:
+        return None
+    return DocumentCache(cache_state.backend)
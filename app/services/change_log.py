@@ -0,0 +1,133 @@
+"""
+Per-user change log for incremental device sync.
+
+Every write to a user's playlists or songs appends entries to the `changes`
+collection, each numbered from a per-user counter, so a device can ask for
+everything after the last sequence number it saw. Entries only name the
+playlist or song and whether it was upserted or deleted; the current
+documents are read when syncing, so repeated edits collapse into one.
+
+Sequence numbers are allocated before the entries are inserted, so two
+concurrent writers can insert out of order. Readers stop at a gap in the
+sequence until it is filled, or until it is older than
+sync_gap_timeout_seconds (the writer died between allocating and
+inserting). Entries expire after sync_log_retention_seconds; a device whose
+token is older than that has to do a full resync.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from app.config import settings
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST = "playlist"
+SONG = "song"
+UPSERT = "upsert"
+DELETE = "delete"
+
+# (user_id, kind, entity ID, op)
+Change = Tuple[str, str, str, str]
+
+change_log_failures = Counter("change_log_failures_total", "Change log writes that failed after their data write committed")
+
+class ChangeLog:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["changes"]
+        self.counters = db["change_counters"]
+        self.playlists_collection = db["playlists"]
+
+    async def record(self, changes: Iterable[Change]) -> None:
+        """
+        Append changes to the log: one counter update per user to reserve a
+        block of sequence numbers, then one insert for all entries.
+
+        Writers call this once their data write has committed, so a failure
+        is reported and counted rather than raised: the write stands, and its
+        caller must not undo it (e.g. by deleting the uploaded audio). Devices
+        syncing incrementally miss that change until they list the library
+        again.
+        """
+        try:
+            await self._append(changes)
+        except Exception:
+            change_log_failures.inc()
+            logger.exception("Failed to record changes")
+
+    async def _append(self, changes: Iterable[Change]) -> None:
+        by_user: Dict[str, List[Change]] = {}
+        for change in changes:
+            if change[0]:
+                by_user.setdefault(change[0], []).append(change)
+        if not by_user:
+            return
+
+        now = datetime.utcnow()
+        entries = []
+        for user_id, user_changes in by_user.items():
+            counter = await self.counters.find_one_and_update(
+                {"_id": user_id},
+                {"$inc": {"seq": len(user_changes)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            first_seq = counter["seq"] - len(user_changes) + 1
+            entries.extend(
+                {"user_id": user_id, "seq": first_seq + offset, "kind": kind, "entity_id": entity_id, "op": op, "at": now}
+                for offset, (_, kind, entity_id, op) in enumerate(user_changes)
+            )
+        await self.collection.insert_many(entries, ordered=False)
+
+    async def record_playlists(self, playlist_ids: Iterable[str]) -> None:
+        """Record playlists that still exist as changed, looking up their owners (failures are reported like record())"""
+        object_ids = [ObjectId(pid) for pid in set(map(str, playlist_ids)) if ObjectId.is_valid(pid)]
+        if not object_ids:
+            return
+        try:
+            playlists = await self.playlists_collection.find(
+                {"_id": {"$in": object_ids}},
+                {"user_id": 1}
+            ).to_list(length=None)
+        except Exception:
+            change_log_failures.inc()
+            logger.exception("Failed to look up playlists to record changes")
+            return
+        await self.record(
+            (playlist.get("user_id"), PLAYLIST, str(playlist["_id"]), UPSERT) for playlist in playlists
+        )
+
+    async def current_seq(self, user_id: str) -> int:
+        counter = await self.counters.find_one({"_id": user_id})
+        return counter["seq"] if counter else 0
+
+    async def changes_since(self, user_id: str, since: int, limit: int) -> Tuple[List[dict], int, bool]:
+        """
+        Entries after sequence number since, in order.
+
+        Returns the entries, the sequence number to resume from and whether
+        more entries can be read right away. Reading stops early at a gap that
+        may still be filled by a writer in flight; that reports no more, since
+        syncing again at once would only stop at the same gap until it settles.
+        """
+        entries = await self.collection.find(
+            {"user_id": user_id, "seq": {"$gt": since}}
+        ).sort("seq", 1).limit(limit + 1).to_list(length=None)
+
+        settled_before = datetime.utcnow() - timedelta(seconds=settings.sync_gap_timeout_seconds)
+        last_seq = since
+        taken = []
+        for entry in entries[:limit]:
+            if entry["seq"] != last_seq + 1 and entry["at"] > settled_before:
+                return taken, last_seq, False
+            taken.append(entry)
+            last_seq = entry["seq"]
+        return taken, last_seq, len(entries) > limit
+
+def sync_token_expired(issued_at: float) -> bool:
+    """Whether entries after a token issued at issued_at (epoch seconds) may have expired"""
+    return issued_at < time.time() - settings.sync_log_retention_seconds
@@ -1,104 +1,224 @@
+import asyncio
+import hashlib
+import logging
+import time
 import uuid
-from typing import BinaryIO
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
 from fastapi import UploadFile
+from app.config import settings
+from app.metrics import record_storage, storage_delete_failures
+from app.services.blob_index import BlobIndex
+from app.services.storage_backends import StorageBackend, get_storage_backend
+
+logger = logging.getLogger(__name__)
 
 class CloudStorageService:
     """
     Service to handle cloud storage operations.
-    In production, integrate with AWS S3, Google Cloud Storage, or Azure Blob Storage.
+    Audio bytes are streamed in fixed-size chunks to a pluggable StorageBackend
+    (the one selected by STORAGE_BACKEND unless one is passed in), so memory
+    per upload is bounded by the chunk size rather than the file size.
+    
+    With a BlobIndex, storage is content-addressed: identical files are stored
+    once and shared through reference counts.
     """
     
-    def __init__(self):
-        # In production, initialize cloud storage client here
-        # Example: self.s3_client = boto3.client('s3')
-        # Example: self.gcs_client = storage.Client()
-        pass
+    def __init__(
+        self,
+        backend: Optional[StorageBackend] = None,
+        chunk_size: Optional[int] = None,
+        blob_index: Optional[BlobIndex] = None
+    ):
+        self.backend = backend or get_storage_backend()
+        self.chunk_size = chunk_size or settings.upload_chunk_size
+        self.blob_index = blob_index
     
-    async def upload_audio_file(self, file: UploadFile, user_id: str) -> dict:
+    async def upload_audio_file(self, file: UploadFile, user_id: str, references: int = 1) -> dict:
         """
-        Upload audio file to cloud storage and return access URL.
+        Stream audio file to the storage backend and return access URL.
         
-        In production, this would:
-        1. Upload to S3/GCS/Azure
-        2. Set appropriate permissions
-        3. Return CDN URL
+        Size and SHA-256 content hash are computed while the chunks
+        are forwarded, so the file is never held in memory at once.
         
-        For now, simulates cloud upload.
+        With a BlobIndex, references is the number of songs that will store
+        the returned storage_path; each gets its own blob reference.
         """
+        start = time.perf_counter()
+        if self.blob_index:
+            result = await self._upload_deduplicated(file, references)
+        else:
+            result = await self._upload(file, user_id)
+        record_storage("upload", time.perf_counter() - start, result["file_size"])
+        return result
+    
+    async def _upload(self, file: UploadFile, user_id: str) -> dict:
         # Generate unique file ID
-        file_extension = file.filename.split(".")[-1] if "." in file.filename else "mp3"
+        file_extension = self._extension(file)
         file_id = str(uuid.uuid4())
-        
-        # Simulate cloud upload
-        # In production:
-        # - Upload to S3: s3_client.upload_fileobj(file.file, bucket, key)
-        # - Upload to GCS: bucket.blob(key).upload_from_file(file.file)
-        
-        # Simulated cloud URLs
         storage_path = f"users/{user_id}/audio/{file_id}.{file_extension}"
-        file_url = f"https://cdn.example.com/{storage_path}"
-        
-        # Read file size (in production, this happens during upload)
-        content = await file.read()
-        file_size = len(content)
-        await file.seek(0)  # Reset file pointer
+        file_size, content_hash = await self._stream_to_backend(file, storage_path)
         
         return {
             "file_id": file_id,
-            "file_url": file_url,
+            "file_url": self.backend.get_url(storage_path),
             "storage_path": storage_path,
             "file_size": file_size,
+            "content_hash": content_hash,
             "content_type": file.content_type,
             "original_filename": file.filename
         }
     
-    async def delete_audio_file(self, storage_path: str) -> bool:
+    async def _upload_deduplicated(self, file: UploadFile, references: int) -> dict:
         """
-        Delete audio file from cloud storage.
+        Content-addressed upload.
         
-        In production:
-        - S3: s3_client.delete_object(Bucket=bucket, Key=storage_path)
-        - GCS: bucket.blob(storage_path).delete()
+        The request body is already spooled locally, so it is hashed first;
+        if a blob with that hash exists, references are taken and nothing is
+        written to storage.
         """
-        # Simulate deletion
-        return True
-
-
-# Production example for AWS S3:
-"""
-import boto3
-from botocore.exceptions import ClientError
-
-class S3StorageService:
-    def __init__(self, bucket_name: str, region: str = 'us-east-1'):
-        self.s3_client = boto3.client('s3', region_name=region)
-        self.bucket_name = bucket_name
-    
-    async def upload_audio_file(self, file: UploadFile, user_id: str) -> dict:
-        file_extension = file.filename.split(".")[-1]
-        file_id = str(uuid.uuid4())
-        storage_path = f"users/{user_id}/audio/{file_id}.{file_extension}"
+        file_size, content_hash = await self._hash_file(file)
+        blob = await self.blob_index.acquire(content_hash, references)
+        if blob is None:
+            # The random suffix keeps a racing upload or a just-released blob
+            # from ever writing to (or deleting) the object we store here
+            storage_path = f"audio/{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex[:8]}.{self._extension(file)}"
+            await self._stream_to_backend(file, storage_path)
+            blob = await self.blob_index.register(content_hash, storage_path, file_size, file.content_type, references)
+            if blob["storage_path"] != storage_path:
+                # An identical upload registered first; share its object instead
+                await self.backend.delete(storage_path)
         
+        return {
+            "file_id": content_hash,
+            "file_url": self.backend.get_url(blob["storage_path"]),
+            "storage_path": blob["storage_path"],
+            "file_size": file_size,
+            "content_hash": content_hash,
+            "content_type": file.content_type,
+            "original_filename": file.filename
+        }
+    
+    @staticmethod
+    def _extension(file: UploadFile) -> str:
+        return file.filename.split(".")[-1] if file.filename and "." in file.filename else "mp3"
+    
+    async def _hash_file(self, file: UploadFile) -> Tuple[int, str]:
+        """Read the upload once in chunks to get its size and SHA-256, then rewind it"""
+        hasher = hashlib.sha256()
+        file_size = 0
+        while True:
+            chunk = await file.read(self.chunk_size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            file_size += len(chunk)
+        await file.seek(0)
+        return file_size, hasher.hexdigest()
+    
+    async def _stream_to_backend(self, file: UploadFile, storage_path: str) -> Tuple[int, str]:
+        """Forward the upload to the backend chunk by chunk, returning its size and SHA-256"""
+        hasher = hashlib.sha256()
+        file_size = 0
+        writer = await self.backend.open_writer(storage_path, file.content_type)
         try:
-            # Upload to S3
-            self.s3_client.upload_fileobj(
-                file.file,
-                self.bucket_name,
-                storage_path,
-                ExtraArgs={
-                    'ContentType': file.content_type,
-                    'ACL': 'public-read'  # or 'private' with signed URLs
-                }
+            while True:
+                chunk = await file.read(self.chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                file_size += len(chunk)
+                await writer.write(chunk)
+            await writer.commit()
+        except BaseException:
+            await writer.abort()
+            raise
+        return file_size, hasher.hexdigest()
+    
+    async def upload_audio_files(
+        self,
+        files: List[UploadFile],
+        user_id: str,
+        indexes: Iterable[int],
+        concurrency: Optional[int] = None
+    ) -> Dict[int, List[dict]]:
+        """
+        Upload the files at the given indexes with a bounded number in flight.
+        
+        An index listed several times is stored once per listing, so every
+        song made from it owns its storage: its own object, or its own blob
+        reference when deduplicating. Deleting one of those songs then never
+        removes the audio of the others. Returns the uploads by index.
+        
+        If any upload fails, the files already stored are deleted before
+        the error is re-raised.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.upload_concurrency)
+        
+        async def _upload(index: int, count: int) -> List[dict]:
+            uploads = []
+            async with semaphore:
+                if self.blob_index:
+                    # One hash and one blob update, however many songs share the file
+                    upload = await self.upload_audio_file(files[index], user_id, references=count)
+                    return [dict(upload) for _ in range(count)]
+                try:
+                    for _ in range(count):
+                        await files[index].seek(0)
+                        uploads.append(await self.upload_audio_file(files[index], user_id))
+                except BaseException:
+                    await self.delete_audio_files([upload["storage_path"] for upload in uploads])
+                    raise
+            return uploads
+        
+        counts = Counter(indexes)
+        indexes = sorted(counts)
+        results = await asyncio.gather(*(_upload(i, counts[i]) for i in indexes), return_exceptions=True)
+        
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            await self.delete_audio_files(
+                [upload["storage_path"] for r in results if not isinstance(r, BaseException) for upload in r]
             )
-            
-            # Generate URL
-            file_url = f"https://{self.bucket_name}.s3.amazonaws.com/{storage_path}"
-            
-            return {
-                "file_id": file_id,
-                "file_url": file_url,
-                "storage_path": storage_path
-            }
-        except ClientError as e:
-            raise Exception(f"Failed to upload to S3: {str(e)}")
-"""
+            raise errors[0]
+        return dict(zip(indexes, results))
+    
+    async def delete_audio_file(self, storage_path: str) -> bool:
+        """
+        Delete audio file from the storage backend.
+        
+        Shared blobs only lose one reference; the object is removed once
+        nothing references it any more.
+        """
+        start = time.perf_counter()
+        try:
+            if self.blob_index:
+                released = await self.blob_index.release(storage_path)
+                if released is False:
+                    return False
+            return await self.backend.delete(storage_path)
+        finally:
+            record_storage("delete", time.perf_counter() - start)
+    
+    async def delete_audio_files(self, storage_paths: List[str]) -> int:
+        """
+        Delete several audio files concurrently.
+        
+        Best effort: failures are reported and skipped so callers can clean up
+        after database changes that already happened. Returns the number deleted.
+        """
+        storage_paths = [path for path in storage_paths if path]
+        results = await asyncio.gather(
+            *(self.delete_audio_file(path) for path in storage_paths),
+            return_exceptions=True
+        )
+        for path, result in zip(storage_paths, results):
+            if isinstance(result, BaseException):
+                storage_delete_failures.inc()
+                logger.error("Failed to delete audio file %s", path, exc_info=result)
+        return sum(1 for result in results if result is True)
+
+def upload_storage_paths(uploads: Dict[int, List[dict]]) -> List[str]:
+    """Storage paths of every upload returned by upload_audio_files(), for cleanup"""
+    return [upload["storage_path"] for group in uploads.values() for upload in group]
+
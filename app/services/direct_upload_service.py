@@ -0,0 +1,234 @@
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from app.config import settings
+from app.metrics import record_storage, upload_cleanup_failures
+from app.schemas.upload import DirectUploadCreate
+from app.services.cloud_storage import CloudStorageService
+
+logger = logging.getLogger(__name__)
+
+class DirectUploadService:
+    """
+    Uploads that go straight from the client to the storage backend.
+
+    create_upload() records what the client promised (size, SHA-256) and
+    returns a presigned PUT target; the bytes never pass through the API.
+    finalize() checks the stored object against the promise before the song
+    is created. With deduplication on, a file whose hash is already stored
+    needs no upload at all, and a finalized upload is registered as a blob.
+
+    Uploads that are not finalized within direct_upload_session_ttl_seconds
+    are removed, with any object written for them, by expire_sessions().
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, cloud_storage: CloudStorageService):
+        self.collection = db["direct_uploads"]
+        self.cloud_storage = cloud_storage
+        self.backend = cloud_storage.backend
+        self.blob_index = cloud_storage.blob_index
+
+    def view(self, upload: dict, target: Optional[dict] = None) -> dict:
+        """Client-facing view of an upload, with the presigned target when one was just issued"""
+        return {
+            "upload_id": str(upload["_id"]),
+            "status": upload["status"],
+            "upload_required": upload["upload_required"],
+            "url": target["url"] if target else None,
+            "method": target["method"] if target else None,
+            "headers": target["headers"] if target else {},
+            "url_expires_at": upload.get("url_expires_at"),
+            "expires_at": upload["expires_at"],
+            "song_id": upload.get("song_id")
+        }
+
+    async def create_upload(self, request: DirectUploadCreate) -> dict:
+        """
+        Record a pending upload and return its view, with the presigned target.
+
+        Raises NotImplementedError if the backend cannot presign uploads.
+        """
+        if request.size > settings.direct_upload_max_size:
+            raise ValueError(f"File too large; the limit is {settings.direct_upload_max_size} bytes")
+        if not ObjectId.is_valid(request.playlist_id):
+            raise ValueError("Invalid playlist_id")
+
+        extension = request.filename.split(".")[-1] if "." in request.filename else "mp3"
+        file_id = str(uuid.uuid4())
+        if self.blob_index:
+            storage_path = f"audio/{request.sha256[:2]}/{request.sha256}-{uuid.uuid4().hex[:8]}.{extension}"
+        else:
+            storage_path = f"users/{request.user_id}/audio/{file_id}.{extension}"
+
+        # Already stored: finalize can take a reference without any upload
+        upload_required = not (self.blob_index and await self.blob_index.find(request.sha256))
+        target = None
+        if upload_required:
+            target = self._presign(storage_path, request.size, request.sha256, request.content_type)
+
+        now = datetime.utcnow()
+        upload = {
+            **request.model_dump(),
+            "file_id": request.sha256 if self.blob_index else file_id,
+            "storage_path": storage_path,
+            "upload_required": upload_required,
+            "status": "pending",
+            "created_at": now.isoformat(),
+            "url_expires_at": now + timedelta(seconds=settings.direct_upload_url_ttl_seconds) if target else None,
+            "expires_at": now + timedelta(seconds=settings.direct_upload_session_ttl_seconds)
+        }
+        result = await self.collection.insert_one(upload)
+        upload["_id"] = result.inserted_id
+        return self.view(upload, target)
+
+    def _presign(self, storage_path: str, size: int, sha256: str, content_type: Optional[str]) -> dict:
+        return self.backend.presign_upload(
+            storage_path, size, sha256, content_type, settings.direct_upload_url_ttl_seconds
+        )
+
+    async def renew_url(self, upload_id: str) -> Optional[dict]:
+        """
+        Presign a new target for a pending upload and return its view, or None
+        if it does not exist. For when the first URL expired, or when the
+        stored copy an upload without one was relying on has been removed.
+        """
+        upload = await self.get_upload(upload_id)
+        if not upload:
+            return None
+        if upload["status"] != "pending":
+            raise ValueError(f"Upload is {upload['status']}")
+        target = self._presign(upload["storage_path"], upload["size"], upload["sha256"], upload.get("content_type"))
+        upload = await self.collection.find_one_and_update(
+            {"_id": upload["_id"], "status": "pending"},
+            {"$set": {
+                "upload_required": True,
+                "url_expires_at": datetime.utcnow() + timedelta(seconds=settings.direct_upload_url_ttl_seconds)
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if not upload:
+            raise ValueError("Upload is already being finalized")
+        return self.view(upload, target)
+
+    async def get_upload(self, upload_id: str) -> Optional[dict]:
+        """Get an upload that has not expired"""
+        if not ObjectId.is_valid(upload_id):
+            return None
+        upload = await self.collection.find_one({"_id": ObjectId(upload_id)})
+        if not upload or upload["expires_at"] <= datetime.utcnow():
+            return None
+        return upload
+
+    async def finalize(self, upload_id: str) -> Optional[dict]:
+        """
+        Verify the uploaded object and claim it for a song.
+
+        The object must exist with the promised size and SHA-256; one that
+        does not match is deleted so the client can upload again. The upload
+        moves from pending to finalizing atomically, so concurrent calls
+        cannot both create a song. Returns the upload with the stored file's
+        details under "upload" (shaped like upload_audio_file()), the upload
+        as is if it was already finalized, or None if it does not exist.
+        """
+        upload = await self.get_upload(upload_id)
+        if not upload:
+            return None
+        if upload["status"] == "completed":
+            return upload
+        if upload["status"] != "pending":
+            raise ValueError(f"Upload is {upload['status']}")
+
+        start = time.perf_counter()
+        stored = await self.backend.head(upload["storage_path"])
+        record_storage("head", time.perf_counter() - start)
+        if stored is not None and (stored["size"] != upload["size"] or stored["sha256"] not in (None, upload["sha256"])):
+            await self.backend.delete(upload["storage_path"])
+            raise ValueError("The uploaded file does not match the declared size and SHA-256; upload it again")
+
+        upload = await self.collection.find_one_and_update(
+            {"_id": upload["_id"], "status": "pending"},
+            {"$set": {"status": "finalizing"}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not upload:
+            raise ValueError("Upload is already being finalized")
+
+        try:
+            storage_path = await self._claim_object(upload, stored is not None)
+        except BaseException:
+            await self.collection.update_one({"_id": upload["_id"]}, {"$set": {"status": "pending"}})
+            raise
+
+        upload["upload"] = {
+            "file_id": upload["file_id"],
+            "file_url": self.backend.get_url(storage_path),
+            "storage_path": storage_path,
+            "file_size": upload["size"],
+            "content_hash": upload["sha256"],
+            "content_type": upload.get("content_type"),
+            "original_filename": upload["filename"]
+        }
+        return upload
+
+    async def _claim_object(self, upload: dict, uploaded: bool) -> str:
+        """Storage path the song will use, taking a blob reference when deduplicating"""
+        if not self.blob_index:
+            if not uploaded:
+                raise ValueError("The file has not been uploaded yet")
+            return upload["storage_path"]
+
+        if not uploaded:
+            blob = await self.blob_index.acquire(upload["sha256"])
+            if blob is None and not upload["upload_required"]:
+                # The stored copy was removed after the upload was created, and there is no URL to send the file to
+                raise ValueError(
+                    f"The file is no longer stored; get an upload URL from "
+                    f"POST /direct-uploads/{upload['_id']}/url and upload it"
+                )
+            if blob is None:
+                raise ValueError("The file has not been uploaded yet")
+            return blob["storage_path"]
+        blob = await self.blob_index.register(
+            upload["sha256"], upload["storage_path"], upload["size"], upload.get("content_type")
+        )
+        if blob["storage_path"] != upload["storage_path"]:
+            # An identical file was registered first; share it instead
+            await self.backend.delete(upload["storage_path"])
+        return blob["storage_path"]
+
+    async def mark_completed(self, upload_id: str, song_id: str, storage_path: str) -> None:
+        await self.collection.update_one(
+            {"_id": ObjectId(upload_id)},
+            {"$set": {"status": "completed", "song_id": song_id, "storage_path": storage_path}}
+        )
+
+    async def fail(self, upload: dict) -> None:
+        """
+        Give up on a finalized upload whose song could not be created: the
+        stored file (or blob reference) is released and the upload removed.
+        """
+        await self.cloud_storage.delete_audio_files([upload["upload"]["storage_path"]])
+        await self.collection.delete_one({"_id": upload["_id"]})
+
+    async def expire_sessions(self) -> int:
+        """Remove expired uploads and any unclaimed object written for them"""
+        removed = 0
+        async for upload in self.collection.find(
+            {"expires_at": {"$lte": datetime.utcnow()}},
+            {"storage_path": 1, "status": 1}
+        ):
+            if upload["status"] == "pending":
+                try:
+                    await self.backend.delete(upload["storage_path"])
+                except Exception:
+                    upload_cleanup_failures.inc(kind="direct")
+                    logger.exception("Failed to remove expired direct upload %s", upload["_id"])
+                    continue
+            await self.collection.delete_one({"_id": upload["_id"]})
+            removed += 1
+        return removed
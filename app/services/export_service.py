@@ -0,0 +1,111 @@
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.responses import dumps
+from app.services.playlist_service import order_songs
+
+EXPORT_FORMAT = "playlist-export/1"
+
+# Song fields written to the export; enough to recreate the song elsewhere
+SONG_EXPORT_FIELDS = (
+    "title", "artist", "album", "duration", "file_url", "storage_path",
+    "file_size", "content_hash", "original_filename", "created_at"
+)
+
+class ExportService:
+    """
+    Streams a user's library as NDJSON, one record per line:
+    a header, then every playlist (with parent_id and song references),
+    then every song. Memory use is bounded by the cursor batch and the
+    output buffer, not by the library size.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase, batch_size: int = 500, buffer_size: int = 64 * 1024):
+        self.playlists_collection = db["playlists"]
+        self.songs_collection = db["songs"]
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+    
+    async def stream_user_library(self, user_id: str) -> AsyncIterator[bytes]:
+        """
+        Yield NDJSON chunks of roughly buffer_size bytes.
+        
+        Each chunk is only produced when the previous one has been sent, so a
+        slow client slows down the cursor instead of filling memory.
+        """
+        buffer = bytearray(dumps({
+            "type": "header",
+            "format": EXPORT_FORMAT,
+            "user_id": user_id,
+            "exported_at": datetime.utcnow().isoformat()
+        }))
+        buffer += b"\n"
+        
+        playlists = self.playlists_collection.find(
+            {"user_id": user_id},
+            {"device_id": 1, "name": 1, "parent_id": 1, "songs": 1, "created_at": 1}
+        ).sort("_id", 1).batch_size(self.batch_size)
+        async for playlist in playlists:
+            buffer += dumps({"type": "playlist", **order_songs(playlist)}) + b"\n"
+            if len(buffer) >= self.buffer_size:
+                yield bytes(buffer)
+                buffer.clear()
+        
+        songs = self.songs_collection.find(
+            {"user_id": user_id},
+            {field: 1 for field in SONG_EXPORT_FIELDS}
+        ).sort("_id", 1).batch_size(self.batch_size)
+        async for song in songs:
+            buffer += dumps({"type": "song", **song}) + b"\n"
+            if len(buffer) >= self.buffer_size:
+                yield bytes(buffer)
+                buffer.clear()
+        
+        if buffer:
+            yield bytes(buffer)
+
+def export_to_upload_structures(records: Iterable[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Convert parsed export records into the bulk upload format (see example_upload.json).
+    
+    Returns one playlist_structure per top-level playlist, and the list of files
+    to send as audio_files, where files[i] is the exported song that file_index i
+    refers to. A song that appears in several playlists gets a single file_index.
+    """
+    playlists: Dict[str, dict] = {}
+    songs: Dict[str, dict] = {}
+    for record in records:
+        if record.get("type") == "playlist":
+            playlists[record["_id"]] = record
+        elif record.get("type") == "song":
+            songs[record["_id"]] = record
+    
+    files: List[dict] = []
+    file_indexes: Dict[str, int] = {}
+    nodes: Dict[str, dict] = {}
+    for playlist_id, playlist in playlists.items():
+        node_songs = []
+        for ref in sorted(playlist.get("songs", []), key=lambda ref: ref.get("position", 0)):
+            song = songs.get(ref["_id"])
+            if not song:
+                continue
+            if ref["_id"] not in file_indexes:
+                file_indexes[ref["_id"]] = len(files)
+                files.append(song)
+            node_songs.append({
+                "file_index": file_indexes[ref["_id"]],
+                "title": song["title"],
+                "artist": song.get("artist"),
+                "album": song.get("album"),
+                "duration": song.get("duration")
+            })
+        nodes[playlist_id] = {"name": playlist["name"], "songs": node_songs, "children": []}
+    
+    roots = []
+    for playlist_id, playlist in playlists.items():
+        parent_id = playlist.get("parent_id")
+        if parent_id in nodes:
+            nodes[parent_id]["children"].append(nodes[playlist_id])
+        else:
+            roots.append(nodes[playlist_id])
+    return roots, files
@@ -0,0 +1,247 @@
+"""
+In-process background job queue.
+
+Jobs are persisted through a JobStore (MongoDB by default), so they survive
+restarts and can be picked up by any worker process: a job is claimed with
+an atomic update and leased for a while, and a lease that runs out (e.g.
+the process died) makes the job claimable again. Each process runs a fixed
+number of asyncio workers; CPU-heavy steps are sent to a process pool with
+JobQueue.run_in_process() so they never block the event loop.
+
+Failed jobs are retried with exponential backoff up to max_attempts;
+handlers raise PermanentJobError for failures that retrying cannot fix.
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from app.config import settings
+from app.metrics import Counter
+
+logger = logging.getLogger(__name__)
+job_claim_failures = Counter("job_claim_failures_total", "Attempts to claim the next job that failed")
+job_failures = Counter("job_failures_total", "Job attempts that raised, by type and outcome", ("type", "outcome"))
+
+class PermanentJobError(Exception):
+    """Raised by a handler when the job cannot succeed; it is failed without retrying"""
+
+class JobStore(ABC):
+    """Persistent storage for jobs"""
+
+    @abstractmethod
+    async def insert(self, job: dict) -> str:
+        """Store a new queued job and return its ID"""
+
+    @abstractmethod
+    async def claim(self, lease_seconds: float) -> Optional[dict]:
+        """Atomically take the next due job, marking it running for lease_seconds"""
+
+    @abstractmethod
+    async def finish(self, job_id: Any, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        """Mark a job succeeded or failed"""
+
+    @abstractmethod
+    async def retry(self, job_id: Any, run_at: datetime, error: str) -> None:
+        """Queue a job again to run at run_at"""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        """Get a job by ID"""
+
+    @abstractmethod
+    async def find(self, query: dict, limit: int = 100) -> List[dict]:
+        """Jobs matching a filter on job fields, newest first"""
+
+class MongoJobStore(JobStore):
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["jobs"]
+
+    async def insert(self, job: dict) -> str:
+        result = await self.collection.insert_one(job)
+        return str(result.inserted_id)
+
+    async def claim(self, lease_seconds: float) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "locked_until": {"$lte": now}},
+            ]},
+            {
+                "$set": {"status": "running", "locked_until": now + timedelta(seconds=lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def finish(self, job_id: Any, status: str, result: Any = None, error: Optional[str] = None) -> None:
+        await self.collection.update_one(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "status": status,
+                    "result": result,
+                    "error": error,
+                    "finished_at": datetime.utcnow().isoformat()
+                },
+                "$unset": {"locked_until": ""}
+            }
+        )
+
+    async def retry(self, job_id: Any, run_at: datetime, error: str) -> None:
+        await self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "queued", "run_at": run_at, "error": error}, "$unset": {"locked_until": ""}}
+        )
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.collection.find_one({"_id": ObjectId(job_id)})
+
+    async def find(self, query: dict, limit: int = 100) -> List[dict]:
+        return await self.collection.find(query).sort("_id", -1).limit(limit).to_list(length=None)
+
+JobHandler = Callable[[dict, "JobQueue"], Awaitable[Any]]
+
+class JobQueue:
+    def __init__(
+        self,
+        store: JobStore,
+        concurrency: int = 2,
+        process_pool_size: int = 2,
+        max_attempts: int = 5,
+        retry_base_seconds: float = 5.0,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 300.0
+    ):
+        self.store = store
+        self.concurrency = concurrency
+        self.process_pool_size = process_pool_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.handlers: Dict[str, JobHandler] = {}
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        """Handle jobs of job_type with an async handler(payload, queue)"""
+        self.handlers[job_type] = handler
+
+    async def enqueue(self, job_type: str, payload: dict, max_attempts: Optional[int] = None) -> str:
+        """Persist a job and wake an idle worker; returns the job ID"""
+        job_id = await self.store.insert({
+            "type": job_type,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "run_at": datetime.utcnow(),
+            "created_at": datetime.utcnow().isoformat()
+        })
+        self._wakeup.set()
+        return job_id
+
+    async def run_in_process(self, fn: Callable, *args) -> Any:
+        """Run a picklable CPU-bound function in the process pool"""
+        if self._pool is None:
+            # spawn rather than fork: this process has event loop and driver threads running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.process_pool_size,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return await asyncio.get_running_loop().run_in_executor(self._pool, functools.partial(fn, *args))
+
+    async def start(self) -> None:
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running are picked up again after their lease"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                job = await self.store.claim(self.lease_seconds)
+            except Exception:
+                job_claim_failures.inc()
+                logger.exception("Job claim failed")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict) -> None:
+        handler = self.handlers.get(job["type"])
+        if handler is None:
+            await self.store.finish(job["_id"], "failed", error=f"No handler for job type {job['type']}")
+            return
+        if job["attempts"] > job["max_attempts"]:
+            # Lease expired on the last attempt (e.g. the worker process died)
+            await self.store.finish(job["_id"], "failed", error=job.get("error") or "Lease expired")
+            return
+        try:
+            result = await handler(job["payload"], self)
+        except asyncio.CancelledError:
+            raise
+        except PermanentJobError as e:
+            job_failures.inc(type=job["type"], outcome="failed")
+            logger.warning("Job %s (%s) failed permanently: %s", job["_id"], job["type"], e)
+            await self.store.finish(job["_id"], "failed", error=str(e))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job["attempts"] >= job["max_attempts"]:
+                job_failures.inc(type=job["type"], outcome="failed")
+                logger.error("Job %s (%s) failed after %d attempts", job["_id"], job["type"], job["attempts"], exc_info=e)
+                await self.store.finish(job["_id"], "failed", error=error)
+            else:
+                delay = self.retry_base_seconds * 2 ** (job["attempts"] - 1)
+                job_failures.inc(type=job["type"], outcome="retried")
+                logger.warning("Job %s (%s) failed, retrying in %.0fs: %s", job["_id"], job["type"], delay, error)
+                await self.store.retry(job["_id"], datetime.utcnow() + timedelta(seconds=delay), error)
+        else:
+            await self.store.finish(job["_id"], "succeeded", result=result)
+
+class JobQueueState:
+    queue: Optional[JobQueue] = None
+
+job_queue_state = JobQueueState()
+
+def create_job_queue(db: AsyncIOMotorDatabase) -> JobQueue:
+    """Build the process-wide queue from settings"""
+    job_queue_state.queue = JobQueue(
+        MongoJobStore(db),
+        concurrency=settings.jobs_concurrency,
+        process_pool_size=settings.jobs_process_pool_size,
+        max_attempts=settings.jobs_max_attempts,
+        retry_base_seconds=settings.jobs_retry_base_seconds,
+        poll_interval=settings.jobs_poll_interval_seconds,
+        lease_seconds=settings.jobs_lease_seconds
+    )
+    return job_queue_state.queue
+
+def get_job_queue() -> Optional[JobQueue]:
+    """The running queue, or None when background jobs are disabled"""
+    return job_queue_state.queue
@@ -0,0 +1,42 @@
+import logging
+from typing import Optional
+from app.config import settings
+from app.database import get_database
+from app.metrics import Counter
+from app.services.cache import get_cache
+from app.services.change_log import ChangeLog
+from app.services.job_queue import JobQueue, PermanentJobError
+from app.services.playlist_service import PlaylistService
+
+REBALANCE_PLAYLIST = "rebalance_playlist"
+
+logger = logging.getLogger(__name__)
+rebalance_failures = Counter("playlist_rebalance_failures_total", "Playlist rebalances that could not be run or queued")
+
+async def rebalance_playlist(payload: dict, queue: JobQueue) -> dict:
+    """Job handler: respace a playlist's song ranks once moves have crowded them"""
+    db = get_database()
+    change_log = ChangeLog(db) if settings.sync_enabled else None
+    service = PlaylistService(db, cache=get_cache(), change_log=change_log)
+    songs = await service.rebalance_song_positions(payload["playlist_id"])
+    if songs is None:
+        raise PermanentJobError("Playlist not found")
+    return {"songs": songs}
+
+async def schedule_rebalance(queue: Optional[JobQueue], service: PlaylistService, playlist_id: str) -> None:
+    """
+    Respace a playlist's ranks in the background, or right away when
+    background jobs are disabled. Best effort: the move that asked for it has
+    already been saved, and a later move respaces the playlist if it must.
+    """
+    try:
+        if queue is None:
+            await service.rebalance_song_positions(playlist_id)
+        else:
+            await queue.enqueue(REBALANCE_PLAYLIST, {"playlist_id": playlist_id})
+    except Exception:
+        rebalance_failures.inc()
+        logger.exception("Failed to rebalance playlist %s", playlist_id)
+
+def register_playlist_jobs(queue: JobQueue) -> None:
+    queue.register(REBALANCE_PLAYLIST, rebalance_playlist)
@@ -1,63 +1,609 @@
+import math
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import List, Optional
+from pymongo import UpdateMany, UpdateOne
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
-from app.schemas.playlist import PlaylistCreate
+from app.pagination import encode_cursor, decode_cursor
+from app.schemas.playlist import PlaylistCreate, PlaylistUploadNode
+from app.services.cache import DocumentCache
+from app.services.change_log import ChangeLog, PLAYLIST, SONG, UPSERT, DELETE
+from app.services.quota_service import QuotaService
+from app.services.search_service import search_terms
+from app.services.song_service import build_song_document, build_song_ref
+
+# Fields returned by playlist listings; projecting to them lets the
+# fast response path skip response-model filtering
+PLAYLIST_LIST_FIELDS = ("user_id", "device_id", "name", "parent_id", "songs", "created_at")
+
+# Song positions are float ranks. Placing a song halves the gap between its
+# neighbours; once a gap drops below RANK_REBALANCE_GAP the playlist is
+# respaced in the background, and below RANK_MIN_GAP it is respaced first.
+RANK_REBALANCE_GAP = 1e-6
+RANK_MIN_GAP = 1e-9
+# Optimistic updates retried before giving up on a busy playlist
+RANK_UPDATE_ATTEMPTS = 5
+
+class PlaylistConflictError(ValueError):
+    """Raised when a playlist's songs kept changing under an update"""
+
+def sort_song_refs(refs: List[dict]) -> List[dict]:
+    """Song references in playlist order"""
+    return sorted(refs, key=lambda ref: ref.get("position", 0))
+
+def order_songs(playlist: dict) -> dict:
+    """
+    Put a playlist document's song references (if it has them) in playlist
+    order. Moves only change ranks, so every read path must do this.
+    """
+    if "songs" in playlist:
+        playlist["songs"] = sort_song_refs(playlist["songs"])
+    return playlist
 
 class PlaylistService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        cache: Optional[DocumentCache] = None,
+        change_log: Optional[ChangeLog] = None,
+        quota: Optional[QuotaService] = None
+    ):
         self.collection = db["playlists"]
+        self.songs_collection = db["songs"]
+        self.cache = cache
+        self.change_log = change_log
+        self.quota = quota
     
     async def create_playlist(self, playlist: PlaylistCreate) -> dict:
         """Create a simple playlist"""
         playlist_dict = playlist.model_dump()
         
-        # Validate parent_id if provided
+        # Validate parent_id if provided and derive the ancestor path from it
+        playlist_dict["ancestors"] = []
         if playlist_dict.get("parent_id"):
             if not ObjectId.is_valid(playlist_dict["parent_id"]):
                 raise ValueError("Invalid parent_id")
-            parent = await self.collection.find_one({"_id": ObjectId(playlist_dict["parent_id"])})
+            parent = await self.collection.find_one(
+                {"_id": ObjectId(playlist_dict["parent_id"])},
+                {"ancestors": 1}
+            )
             if not parent:
                 raise ValueError("Parent playlist not found")
+            playlist_dict["ancestors"] = parent.get("ancestors", []) + [playlist_dict["parent_id"]]
         
         # Initialize empty songs list and add timestamp
+        playlist_dict["search_terms"] = search_terms(playlist_dict["name"])
         playlist_dict["songs"] = []
         playlist_dict["created_at"] = datetime.utcnow().isoformat()
         
         result = await self.collection.insert_one(playlist_dict)
         playlist_dict["_id"] = str(result.inserted_id)
+        if self.change_log:
+            await self.change_log.record([(playlist_dict["user_id"], PLAYLIST, playlist_dict["_id"], UPSERT)])
         return playlist_dict
     
-    async def get_playlist(self, playlist_id: str) -> Optional[dict]:
-        """Get a playlist by ID"""
+    async def get_playlist(
+        self,
+        playlist_id: str,
+        songs_skip: int = 0,
+        songs_limit: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        Get a playlist by ID.
+        
+        Song references are returned in position order. Moves only change a
+        reference's rank, not its place in the stored array, so the array is
+        sorted here before songs_skip/songs_limit pick a page from it. With a
+        cache configured the document is read through the cache.
+        """
         if not ObjectId.is_valid(playlist_id):
             return None
-        playlist = await self.collection.find_one({"_id": ObjectId(playlist_id)})
-        if playlist:
+        if self.cache:
+            playlist = await self.cache.get("playlist", playlist_id)
+            if playlist is None:
+                playlist = await self.collection.find_one({"_id": ObjectId(playlist_id)})
+                if not playlist:
+                    return None
+                playlist["_id"] = str(playlist["_id"])
+                await self.cache.set("playlist", playlist)
+        else:
+            playlist = await self.collection.find_one({"_id": ObjectId(playlist_id)})
+            if not playlist:
+                return None
             playlist["_id"] = str(playlist["_id"])
-        return playlist
+        songs = sort_song_refs(playlist.get("songs", []))
+        if songs_limit is not None:
+            songs = songs[songs_skip:songs_skip + songs_limit]
+        return {**playlist, "songs": songs}
+    
+    async def get_playlists_by_ids(self, playlist_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, dict]:
+        """
+        Fetch many playlists with a single $in query, keyed by ID.
+        
+        Read through the cache like get_playlist. IDs that are invalid or not
+        found are absent from the result. If fields is given, only those
+        playlist fields (plus _id) are returned.
+        """
+        playlist_ids = list(dict.fromkeys(pid for pid in playlist_ids if ObjectId.is_valid(pid)))
+        if not playlist_ids:
+            return {}
+        
+        playlists_by_id = await self.cache.get_many("playlist", playlist_ids) if self.cache else {}
+        missing_ids = [ObjectId(pid) for pid in playlist_ids if pid not in playlists_by_id]
+        
+        projection = None
+        if fields is not None and not self.cache:
+            projection = {field: 1 for field in fields if field in PLAYLIST_LIST_FIELDS}
+        
+        if missing_ids:
+            fetched = []
+            async for playlist in self.collection.find({"_id": {"$in": missing_ids}}, projection):
+                playlist["_id"] = str(playlist["_id"])
+                playlists_by_id[playlist["_id"]] = playlist
+                fetched.append(playlist)
+            if self.cache and fetched:
+                await self.cache.set_many("playlist", fetched)
+        
+        if fields is not None:
+            keep = {field for field in fields if field in PLAYLIST_LIST_FIELDS} | {"_id"}
+            playlists_by_id = {
+                pid: {key: value for key, value in playlist.items() if key in keep}
+                for pid, playlist in playlists_by_id.items()
+            }
+        return {pid: order_songs(playlist) for pid, playlist in playlists_by_id.items()}
+    
+    @staticmethod
+    def _page_query(user_id: Optional[str], cursor: Optional[str]) -> dict:
+        query = {}
+        if user_id:
+            query["user_id"] = user_id
+        if cursor:
+            query["_id"] = {"$gt": decode_cursor(cursor)}
+        return query
+    
+    @staticmethod
+    def _list_projection(include_songs: bool) -> dict:
+        return {field: 1 for field in PLAYLIST_LIST_FIELDS if include_songs or field != "songs"}
+    
+    async def get_playlists_page(
+        self,
+        user_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        include_songs: bool = True,
+        convert_ids: bool = True
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Get one page of playlists in _id order, optionally filtered by user,
+        with song references in playlist order.
+        
+        Pages are keyed on the last _id seen, so each page costs the same no
+        matter how deep it is. Returns the playlists and the cursor for the
+        next page (None on the last page). With convert_ids=False the _id
+        values are left as ObjectIds for the fast response encoder.
+        """
+        query = self._page_query(user_id, cursor)
+        projection = self._list_projection(include_songs)
+        
+        playlists = await self.collection.find(query, projection).sort("_id", 1).limit(limit + 1).to_list(length=None)
+        next_cursor = None
+        if len(playlists) > limit:
+            playlists = playlists[:limit]
+            next_cursor = encode_cursor(playlists[-1]["_id"])
+        for playlist in playlists:
+            order_songs(playlist)
+            if convert_ids:
+                playlist["_id"] = str(playlist["_id"])
+        return playlists, next_cursor
+    
+    async def get_next_cursor(self, user_id: Optional[str], cursor: Optional[str], limit: int) -> Optional[str]:
+        """
+        Find the cursor that follows a page without fetching the page itself.
+        
+        Only _id is projected, so the lookahead is answered from the index.
+        """
+        query = self._page_query(user_id, cursor)
+        ids = await self.collection.find(query, {"_id": 1}).sort("_id", 1).skip(limit - 1).limit(2).to_list(length=None)
+        return encode_cursor(ids[0]["_id"]) if len(ids) == 2 else None
+    
+    async def find_playlists_page(
+        self,
+        user_id: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        include_songs: bool = True
+    ) -> AsyncIterator[dict]:
+        """One page of playlists read off a Motor cursor as they arrive, for streaming responses"""
+        query = self._page_query(user_id, cursor)
+        async for playlist in self.collection.find(query, self._list_projection(include_songs)).sort("_id", 1).limit(limit):
+            yield order_songs(playlist)
     
     async def get_playlists(self, skip: int = 0, limit: int = 100) -> List[dict]:
-        """Get all playlists"""
+        """Get all playlists (offset pagination, deprecated in favour of get_playlists_page)"""
         playlists = []
         cursor = self.collection.find().skip(skip).limit(limit)
         async for playlist in cursor:
             playlist["_id"] = str(playlist["_id"])
-            playlists.append(playlist)
+            playlists.append(order_songs(playlist))
         return playlists
     
     async def get_playlists_by_user(self, user_id: str, skip: int = 0, limit: int = 100) -> List[dict]:
-        """Get all playlists for a user"""
+        """Get all playlists for a user (offset pagination, deprecated in favour of get_playlists_page)"""
         playlists = []
         cursor = self.collection.find({"user_id": user_id}).skip(skip).limit(limit)
         async for playlist in cursor:
             playlist["_id"] = str(playlist["_id"])
-            playlists.append(playlist)
+            playlists.append(order_songs(playlist))
         return playlists
     
+    async def get_playlist_tree(
+        self,
+        playlist_id: str,
+        max_depth: Optional[int] = None,
+        include_songs: bool = True
+    ) -> Optional[dict]:
+        """
+        Get a playlist and its whole subtree.
+        
+        Descendants are found through the materialized ancestors path, so the
+        cost is two indexed queries whatever the depth. max_depth limits how
+        many levels below the root are returned (0 returns only the root).
+        """
+        if not ObjectId.is_valid(playlist_id):
+            return None
+        projection = None if include_songs else {"songs": 0}
+        
+        root = await self.collection.find_one({"_id": ObjectId(playlist_id)}, projection)
+        if not root:
+            return None
+        
+        descendants = []
+        if max_depth is None or max_depth > 0:
+            query = {"ancestors": playlist_id}
+            if max_depth is not None:
+                # A descendant N levels down has exactly len(root ancestors) + N ancestors
+                query[f"ancestors.{len(root.get('ancestors', [])) + max_depth}"] = {"$exists": False}
+            descendants = await self.collection.find(query, projection).sort("_id", 1).to_list(length=None)
+        
+        nodes = {}
+        for playlist in [root] + sorted(descendants, key=lambda doc: len(doc.get("ancestors", []))):
+            playlist["_id"] = str(playlist["_id"])
+            if include_songs:
+                playlist["songs"] = sort_song_refs(playlist.get("songs", []))
+            playlist["children"] = []
+            nodes[playlist["_id"]] = playlist
+            if playlist is not root and playlist.get("parent_id") in nodes:
+                nodes[playlist["parent_id"]]["children"].append(playlist)
+        return root
+    
+    async def move_playlist(self, playlist_id: str, new_parent_id: Optional[str]) -> bool:
+        """
+        Move a playlist (with its subtree) under a new parent, or to the root if None.
+        
+        One read fetches both ancestor paths, then a single ordered bulk write
+        rewrites the moved node and the ancestor prefix of every descendant.
+        With a cache or change log, the descendants' IDs are read first so all
+        of the rewritten playlists are invalidated and logged.
+        """
+        if not ObjectId.is_valid(playlist_id):
+            return False
+        if new_parent_id is not None and not ObjectId.is_valid(new_parent_id):
+            raise ValueError("Invalid parent_id")
+        if new_parent_id == playlist_id:
+            raise ValueError("A playlist cannot be its own parent")
+        
+        ids = [ObjectId(playlist_id)] + ([ObjectId(new_parent_id)] if new_parent_id else [])
+        docs = {
+            str(doc["_id"]): doc
+            async for doc in self.collection.find({"_id": {"$in": ids}}, {"ancestors": 1, "user_id": 1})
+        }
+        if playlist_id not in docs:
+            return False
+        
+        new_ancestors = []
+        if new_parent_id:
+            parent = docs.get(new_parent_id)
+            if not parent:
+                raise ValueError("Parent playlist not found")
+            if playlist_id in parent.get("ancestors", []):
+                raise ValueError("Cannot move a playlist into its own subtree")
+            new_ancestors = parent.get("ancestors", []) + [new_parent_id]
+        
+        # Descendants swap the moved node's old ancestor prefix for the new one
+        old_ancestors = docs[playlist_id].get("ancestors", [])
+        subtree_ops = []
+        if old_ancestors:
+            subtree_ops.append(UpdateMany(
+                {"ancestors": playlist_id},
+                {"$pull": {"ancestors": {"$in": old_ancestors}}}
+            ))
+        if new_ancestors:
+            subtree_ops.append(UpdateMany(
+                {"ancestors": playlist_id},
+                {"$push": {"ancestors": {"$each": new_ancestors, "$position": 0}}}
+            ))
+        moved = [playlist_id]
+        if (self.cache or self.change_log) and subtree_ops:
+            # Every descendant's ancestors change too, so each is dropped from the cache and logged
+            moved += [
+                str(playlist["_id"])
+                async for playlist in self.collection.find({"ancestors": playlist_id}, {"_id": 1})
+            ]
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"_id": ObjectId(playlist_id)},
+                {"$set": {"parent_id": new_parent_id, "ancestors": new_ancestors}}
+            ),
+            *subtree_ops
+        ], ordered=True)
+        if self.cache:
+            await self.cache.invalidate("playlist", moved)
+        if self.change_log:
+            await self.change_log.record_playlists(moved)
+        return True
+    
     async def delete_playlist(self, playlist_id: str) -> bool:
-        """Delete a playlist"""
+        """Delete a playlist together with all of its nested playlists"""
         if not ObjectId.is_valid(playlist_id):
             return False
-        result = await self.collection.delete_one({"_id": ObjectId(playlist_id)})
+        subtree_filter = {"$or": [{"_id": ObjectId(playlist_id)}, {"ancestors": playlist_id}]}
+        if self.cache or self.change_log:
+            # Resolve the subtree first so its cache entries can be dropped and its deletions logged
+            subtree = await self.collection.find(subtree_filter, {"user_id": 1}).to_list(length=None)
+            subtree_filter = {"_id": {"$in": [playlist["_id"] for playlist in subtree]}}
+        result = await self.collection.delete_many(subtree_filter)
+        if self.cache:
+            await self.cache.invalidate("playlist", [str(playlist["_id"]) for playlist in subtree])
+        if self.change_log:
+            await self.change_log.record(
+                (playlist.get("user_id"), PLAYLIST, str(playlist["_id"]), DELETE) for playlist in subtree
+            )
         return result.deleted_count > 0
+    
+    @staticmethod
+    def _rank_at(
+        refs: List[dict],
+        before_song_id: Optional[str],
+        after_song_id: Optional[str],
+        index: Optional[int]
+    ) -> Tuple[float, Optional[float]]:
+        """
+        Rank for a song placed among refs (sorted, without the song itself).
+        
+        Returns the rank and the gap it was taken from (None at either end).
+        With no target the song goes last.
+        """
+        slot = len(refs)
+        target = before_song_id or after_song_id
+        if target is not None:
+            slot = next((i for i, ref in enumerate(refs) if ref["_id"] == target), None)
+            if slot is None:
+                raise ValueError(f"Song {target} is not in the playlist")
+            if after_song_id is not None:
+                slot += 1
+        elif index is not None:
+            slot = min(index, len(refs))
+        
+        previous = refs[slot - 1]["position"] if slot > 0 else None
+        following = refs[slot]["position"] if slot < len(refs) else None
+        if previous is None and following is None:
+            return 0, None
+        if previous is None:
+            return following - 1, None
+        if following is None:
+            return previous + 1, None
+        return (previous + following) / 2, following - previous
+    
+    async def place_song(
+        self,
+        playlist_id: str,
+        song_id: str,
+        before_song_id: Optional[str] = None,
+        after_song_id: Optional[str] = None,
+        index: Optional[int] = None,
+        insert: bool = False
+    ) -> Optional[dict]:
+        """
+        Move a song within a playlist, or insert an existing song (insert=True).
+        
+        The target is given as the song to place it before or after, or as an
+        index in the final order; without one the song goes last. Only the
+        song's rank changes, so whatever the playlist's length the write is a
+        single $set (or $push) of one reference. The update is conditional on
+        songs_version, which every change to the array bumps, and is retried
+        if the playlist changed in between.
+        
+        Returns {"song_id", "position", "rebalance"}, where rebalance says the
+        ranks are getting too close and rebalance_song_positions() should run
+        soon, or None if the playlist does not exist.
+        """
+        if not ObjectId.is_valid(playlist_id):
+            return None
+        if insert:
+            if not ObjectId.is_valid(song_id) or not await self.songs_collection.find_one(
+                {"_id": ObjectId(song_id)}, {"_id": 1}
+            ):
+                raise ValueError("Song not found")
+        
+        for _ in range(RANK_UPDATE_ATTEMPTS):
+            playlist = await self.collection.find_one(
+                {"_id": ObjectId(playlist_id)},
+                {"songs": 1, "songs_version": 1, "user_id": 1}
+            )
+            if not playlist:
+                return None
+            refs = sort_song_refs(playlist.get("songs", []))
+            others = [ref for ref in refs if ref["_id"] != song_id]
+            if insert and len(others) < len(refs):
+                raise ValueError("Song is already in the playlist")
+            if not insert and len(others) == len(refs):
+                raise ValueError("Song is not in the playlist")
+            if song_id in (before_song_id, after_song_id):
+                raise ValueError("A song cannot be placed next to itself")
+            
+            rank, gap = self._rank_at(others, before_song_id, after_song_id, index)
+            if gap is not None and gap < RANK_MIN_GAP:
+                await self.rebalance_song_positions(playlist_id)
+                continue
+            
+            # next_position stays above every rank so appended songs go last
+            query = {"_id": ObjectId(playlist_id), "songs_version": playlist.get("songs_version")}
+            update = {"$inc": {"songs_version": 1}, "$max": {"next_position": math.floor(rank) + 1}}
+            if insert:
+                update["$push"] = {"songs": build_song_ref(song_id, rank)}
+            else:
+                query["songs._id"] = song_id
+                update["$set"] = {"songs.$.position": rank}
+            result = await self.collection.update_one(query, update)
+            if result.matched_count:
+                if self.cache:
+                    await self.cache.invalidate("playlist", [playlist_id])
+                if self.change_log:
+                    await self.change_log.record([(playlist.get("user_id"), PLAYLIST, playlist_id, UPSERT)])
+                return {
+                    "song_id": song_id,
+                    "position": rank,
+                    "rebalance": gap is not None and gap < RANK_REBALANCE_GAP
+                }
+        raise PlaylistConflictError("The playlist is being changed by another request; try again")
+    
+    async def rebalance_song_positions(self, playlist_id: str) -> Optional[int]:
+        """
+        Respace a playlist's ranks to 0, 1, 2, ... keeping the current order.
+        
+        The array is rewritten in position order with one conditional update,
+        retried if the playlist changed meanwhile. Returns the number of songs,
+        or None if the playlist does not exist.
+        """
+        if not ObjectId.is_valid(playlist_id):
+            return None
+        for _ in range(RANK_UPDATE_ATTEMPTS):
+            playlist = await self.collection.find_one(
+                {"_id": ObjectId(playlist_id)},
+                {"songs": 1, "songs_version": 1, "user_id": 1}
+            )
+            if not playlist:
+                return None
+            refs = [
+                {**ref, "position": position}
+                for position, ref in enumerate(sort_song_refs(playlist.get("songs", [])))
+            ]
+            result = await self.collection.update_one(
+                {"_id": ObjectId(playlist_id), "songs_version": playlist.get("songs_version")},
+                {"$set": {"songs": refs, "next_position": len(refs)}, "$inc": {"songs_version": 1}}
+            )
+            if result.matched_count:
+                if self.cache:
+                    await self.cache.invalidate("playlist", [playlist_id])
+                if self.change_log:
+                    await self.change_log.record([(playlist.get("user_id"), PLAYLIST, playlist_id, UPSERT)])
+                return len(refs)
+        raise PlaylistConflictError("The playlist is being changed by another request; try again")
+    
+    @staticmethod
+    def get_upload_file_indexes(root: PlaylistUploadNode, file_count: int) -> List[int]:
+        """
+        Collect the file index of every song in an upload tree, validating each
+        one. A file shared by several songs is listed once per song.
+        """
+        indexes = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for song in node.songs:
+                if song.file_index >= file_count:
+                    raise ValueError(f"file_index {song.file_index} out of range ({file_count} files uploaded)")
+                indexes.append(song.file_index)
+            stack.extend(node.children)
+        return indexes
+    
+    async def create_playlist_tree(
+        self,
+        user_id: str,
+        device_id: str,
+        root: PlaylistUploadNode,
+        uploads: Dict[int, List[dict]]
+    ) -> dict:
+        """
+        Create a nested playlist tree and all of its songs.
+        
+        uploads holds one upload per song for each file index (as returned by
+        upload_audio_files()), so songs sharing a file never share storage.
+        IDs are generated up front so the whole tree is written with one
+        insert_many for songs and one for playlists, regardless of size.
+        With quotas enabled the songs must fit in the user's quota, or
+        QuotaExceededError is raised before anything is written.
+        """
+        created_at = datetime.utcnow().isoformat()
+        song_docs = []
+        playlist_docs = []
+        unused_uploads = {index: iter(group) for index, group in uploads.items()}
+        
+        def build(node: PlaylistUploadNode, ancestors: List[str]) -> dict:
+            playlist_id = ObjectId()
+            songs = []
+            for position, song in enumerate(node.songs):
+                upload = next(unused_uploads[song.file_index])
+                song_dict = build_song_document(
+                    user_id=user_id,
+                    device_id=device_id,
+                    title=song.title,
+                    artist=song.artist,
+                    album=song.album,
+                    duration=song.duration,
+                    file_id=upload["file_id"],
+                    file_url=upload["file_url"],
+                    storage_path=upload["storage_path"],
+                    file_size=upload["file_size"],
+                    original_filename=upload["original_filename"],
+                    content_hash=upload["content_hash"]
+                )
+                song_dict["_id"] = ObjectId()
+                song_docs.append(song_dict)
+                songs.append((song_dict, build_song_ref(str(song_dict["_id"]), position)))
+            
+            playlist_docs.append({
+                "_id": playlist_id,
+                "user_id": user_id,
+                "device_id": device_id,
+                "name": node.name,
+                "search_terms": search_terms(node.name),
+                "parent_id": ancestors[-1] if ancestors else None,
+                "ancestors": ancestors,
+                "songs": [ref for _, ref in songs],
+                "next_position": len(songs),
+                "created_at": created_at
+            })
+            return {
+                "_id": str(playlist_id),
+                "name": node.name,
+                "songs": [{"_id": ref["_id"], "title": song["title"]} for song, ref in songs],
+                "children": [build(child, ancestors + [str(playlist_id)]) for child in node.children]
+            }
+        
+        tree = build(root, [])
+        
+        reserved = await self.quota.reserve_songs(song_docs) if self.quota else {}
+        try:
+            if song_docs:
+                await self.songs_collection.insert_many(song_docs, ordered=False)
+            try:
+                await self.collection.insert_many(playlist_docs, ordered=False)
+            except Exception:
+                await self.songs_collection.delete_many({"_id": {"$in": [song["_id"] for song in song_docs]}})
+                raise
+        except BaseException:
+            if self.quota:
+                await self.quota.release(reserved)
+            raise
+        if self.change_log:
+            await self.change_log.record(
+                [(user_id, PLAYLIST, str(playlist["_id"]), UPSERT) for playlist in playlist_docs]
+                + [(user_id, SONG, str(song["_id"]), UPSERT) for song in song_docs]
+            )
+        
+        return {
+            "playlists_created": len(playlist_docs),
+            "songs_created": len(song_docs),
+            "playlist": tree
+        }
@@ -0,0 +1,126 @@
+"""
+Per-user storage and song-count quotas.
+
+Usage is kept in the `user_usage` collection as one counter document per
+user ({_id: user_id, songs, bytes}), updated whenever songs are created or
+deleted, so checking a quota is a single _id lookup instead of counting or
+summing the user's songs. Reserving is one conditional $inc that only
+matches while the user stays within both limits, so concurrent uploads
+cannot overshoot them.
+
+Counters for songs created before quotas were enabled are backfilled with
+python -m app.migrations.user_usage.
+"""
+from typing import Dict, Iterable, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+
+class QuotaExceededError(ValueError):
+    """The user would go over their song or storage quota"""
+
+class QuotaService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db["user_usage"]
+
+    async def usage(self, user_id: str) -> dict:
+        usage = await self.collection.find_one({"_id": user_id})
+        return {"songs": usage.get("songs", 0), "bytes": usage.get("bytes", 0)} if usage else {"songs": 0, "bytes": 0}
+
+    @staticmethod
+    def _limits_filter(songs: int, size: int) -> dict:
+        """Filter matching users with room for songs more songs and size more bytes"""
+        limits = {}
+        if settings.quota_max_songs_per_user > 0:
+            limits["songs"] = {"$lte": settings.quota_max_songs_per_user - songs}
+        if settings.quota_max_bytes_per_user > 0:
+            limits["bytes"] = {"$lte": settings.quota_max_bytes_per_user - size}
+        return limits
+
+    @staticmethod
+    def _exceeded(usage: dict, songs: int, size: int) -> QuotaExceededError:
+        if settings.quota_max_songs_per_user > 0 and usage["songs"] + songs > settings.quota_max_songs_per_user:
+            return QuotaExceededError(
+                f"Song quota exceeded: {usage['songs']} of {settings.quota_max_songs_per_user} songs used"
+            )
+        return QuotaExceededError(
+            f"Storage quota exceeded: {usage['bytes']} of {settings.quota_max_bytes_per_user} bytes used"
+        )
+
+    async def check(self, user_id: str, songs: int = 0, size: int = 0) -> None:
+        """
+        Raise QuotaExceededError if the user has no room for songs more songs
+        and size more bytes. Cheap enough to call before accepting an upload;
+        reserve() enforces the limits when the songs are created.
+        """
+        limits = self._limits_filter(songs, size)
+        if not limits:
+            return
+        usage = await self.usage(user_id)
+        if not all(usage[field] <= bound["$lte"] for field, bound in limits.items()):
+            raise self._exceeded(usage, songs, size)
+
+    async def reserve(self, user_id: str, songs: int, size: int) -> None:
+        """Count songs and bytes against the user's quota, or raise QuotaExceededError"""
+        if not user_id:
+            return
+        update = {"$inc": {"songs": songs, "bytes": size}}
+        limits = self._limits_filter(songs, size)
+        for _ in range(2):
+            result = await self.collection.update_one({"_id": user_id, **limits}, update)
+            if result.matched_count:
+                return
+            usage = await self.collection.find_one({"_id": user_id})
+            if usage:
+                raise self._exceeded({"songs": usage.get("songs", 0), "bytes": usage.get("bytes", 0)}, songs, size)
+            if songs > settings.quota_max_songs_per_user > 0 or size > settings.quota_max_bytes_per_user > 0:
+                raise self._exceeded({"songs": 0, "bytes": 0}, songs, size)
+            # First songs for this user: create the counter, then reserve against it
+            try:
+                await self.collection.insert_one({"_id": user_id, "songs": 0, "bytes": 0})
+            except DuplicateKeyError:
+                pass
+        raise QuotaExceededError("Could not reserve quota; retry")
+
+    async def reserve_songs(self, songs: Iterable[dict]) -> Dict[str, dict]:
+        """
+        Reserve quota for song documents, which may belong to several users.
+
+        All or nothing: if one user is over quota, what was reserved for the
+        others is released before raising. Returns the reserved usage by user,
+        to pass to release() if the songs are not created after all.
+        """
+        by_user = self.usage_by_user(songs)
+        reserved: Dict[str, dict] = {}
+        try:
+            for user_id, usage in by_user.items():
+                await self.reserve(user_id, usage["songs"], usage["bytes"])
+                reserved[user_id] = usage
+        except BaseException:
+            await self.release(reserved)
+            raise
+        return reserved
+
+    async def release(self, usage_by_user: Dict[str, dict]) -> None:
+        """Give back usage for songs that were deleted or never created"""
+        for user_id, usage in usage_by_user.items():
+            if user_id and (usage["songs"] or usage["bytes"]):
+                await self.collection.update_one(
+                    {"_id": user_id},
+                    {"$inc": {"songs": -usage["songs"], "bytes": -usage["bytes"]}}
+                )
+
+    @staticmethod
+    def usage_by_user(songs: Iterable[dict]) -> Dict[str, dict]:
+        """Song count and total file_size per user for song documents"""
+        by_user: Dict[str, dict] = {}
+        for song in songs:
+            usage = by_user.setdefault(song.get("user_id"), {"songs": 0, "bytes": 0})
+            usage["songs"] += 1
+            usage["bytes"] += song.get("file_size") or 0
+        return by_user
+
+async def check_quota(quota: Optional[QuotaService], user_id: str, songs: int = 0, size: int = 0) -> None:
+    """QuotaService.check() when quotas are enabled"""
+    if quota:
+        await quota.check(user_id, songs, size)
@@ -0,0 +1,400 @@
+"""
+Storage backend for S3 and S3-compatible stores (MinIO, moto server, ...).
+
+boto3 is blocking, so every S3 call runs in a thread pool owned by the
+backend (storage_s3_max_workers threads) and the event loop only awaits
+the result. Objects larger than storage_s3_part_size are transferred in
+parts: a writer sends parts as they fill, with at most
+storage_s3_part_concurrency in flight per object, so memory per upload is
+bounded by (concurrency + 1) part sizes. Resumable upload parts are streamed
+from the request with their known ContentLength, one chunk at a time.
+download() fetches ranges of the same size concurrently and writes them in
+place.
+
+Objects written in one piece, and direct uploads (presigned with their
+SHA-256), carry a full-object ChecksumSHA256 that head() reports; for
+multipart objects S3 only keeps per-part checksums, so head() reports the
+size alone.
+"""
+import asyncio
+import base64
+import binascii
+import functools
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from app.config import settings
+from app.services.storage_backends import StorageBackend, StorageWriter
+
+# S3 refuses parts smaller than this, except the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+def _is_not_found(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+def _checksum(sha256_hex: str) -> str:
+    """Hex SHA-256 digest in the base64 form S3 uses for ChecksumSHA256"""
+    return base64.b64encode(binascii.unhexlify(sha256_hex)).decode()
+
+class PartStream:
+    """
+    Blocking, file-like view of an async stream of chunks, which boto3 reads
+    from an executor thread while the event loop produces the chunks.
+
+    Only one chunk is held at a time. A stream longer or shorter than the
+    part's ContentLength fails the request; the ValueError describing it is
+    kept in error, since boto3 wraps whatever read() raises.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], size: int, part_number: int, loop: asyncio.AbstractEventLoop):
+        self.chunks = chunks.__aiter__()
+        self.size = size
+        self.part_number = part_number
+        self.loop = loop
+        self.pending = b""
+        self.received = 0
+        self.ended = False
+        self.error: Optional[Exception] = None
+
+    def _fail(self, message: str) -> None:
+        self.error = ValueError(message)
+        raise self.error
+
+    def read(self, amount: int = -1) -> bytes:
+        while not self.pending and not self.ended:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(self.chunks.__anext__(), self.loop).result()
+            except StopAsyncIteration:
+                self.ended = True
+                if self.received != self.size:
+                    self._fail(f"Part {self.part_number} must be {self.size} bytes, got {self.received}")
+                break
+            except Exception as e:
+                self.error = e
+                raise
+            self.received += len(chunk)
+            if self.received > self.size:
+                self._fail(f"Part {self.part_number} must be {self.size} bytes")
+            self.pending = chunk
+        if amount is None or amount < 0:
+            amount = len(self.pending)
+        data, self.pending = self.pending[:amount], self.pending[amount:]
+        return data
+
+class S3Writer(StorageWriter):
+    """
+    Buffers an object until it outgrows one part, then switches to a
+    multipart upload whose parts are sent concurrently. Small objects are
+    written with a single PUT on commit.
+    """
+
+    def __init__(self, backend: "S3StorageBackend", key: str, content_type: Optional[str]):
+        self.backend = backend
+        self.key = key
+        self.content_type = content_type
+        self.buffer = bytearray()
+        self.upload_id: Optional[str] = None
+        self.part_count = 0
+        self.etags: Dict[int, str] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.slots = asyncio.Semaphore(backend.part_concurrency)
+
+    async def write(self, chunk: bytes) -> None:
+        self.buffer += chunk
+        part_size = self.backend.part_size
+        while len(self.buffer) >= part_size:
+            part = bytes(self.buffer[:part_size])
+            del self.buffer[:part_size]
+            await self._send_part(part)
+
+    async def _send_part(self, body: bytes) -> None:
+        for task in self.tasks:
+            if task.done() and task.exception():
+                raise task.exception()
+        if self.upload_id is None:
+            self.upload_id = await self.backend._call(
+                self.backend._create_multipart_upload, self.key, self.content_type
+            )
+        # Waits while part_concurrency parts are in flight, bounding memory
+        await self.slots.acquire()
+        self.part_count += 1
+        self.tasks.append(asyncio.create_task(self._upload(self.part_count, body)))
+
+    async def _upload(self, part_number: int, body: bytes) -> None:
+        try:
+            self.etags[part_number] = await self.backend._call(
+                self.backend._upload_part, self.key, self.upload_id, part_number, body
+            )
+        finally:
+            self.slots.release()
+
+    async def commit(self) -> None:
+        if self.upload_id is None:
+            await self.backend._call(self.backend._put_object, self.key, bytes(self.buffer), self.content_type)
+            self.buffer = bytearray()
+            return
+        if self.buffer:
+            await self._send_part(bytes(self.buffer))
+            self.buffer = bytearray()
+        await asyncio.gather(*self.tasks)
+        parts = [{"PartNumber": number, "ETag": self.etags[number]} for number in range(1, self.part_count + 1)]
+        await self.backend._call(self.backend._complete_multipart_upload, self.key, self.upload_id, parts)
+
+    async def abort(self) -> None:
+        self.buffer = bytearray()
+        # Parts already running in threads cannot be interrupted; let them finish first
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.upload_id is not None:
+            await self.backend._call(self.backend._abort_multipart_upload, self.key, self.upload_id)
+
+class S3StorageBackend(StorageBackend):
+    def __init__(
+        self,
+        bucket: str,
+        base_url: str,
+        region: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        addressing_style: str = "auto",
+        part_size: Optional[int] = None,
+        part_concurrency: Optional[int] = None,
+        max_workers: Optional[int] = None
+    ):
+        if not bucket:
+            raise ValueError("STORAGE_S3_BUCKET is required for the s3 storage backend")
+        self.bucket = bucket
+        self.base_url = base_url.rstrip("/")
+        self.part_size = max(MIN_PART_SIZE, part_size or settings.storage_s3_part_size)
+        self.part_concurrency = max(1, part_concurrency or settings.storage_s3_part_concurrency)
+        max_workers = max(1, max_workers or settings.storage_s3_max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3")
+        session = boto3.session.Session()
+        config = Config(
+            max_pool_connections=max_workers,
+            s3={"addressing_style": addressing_style},
+            signature_version="s3v4",
+            retries={"mode": "standard"},
+            # Only send checksums we ask for; not every S3-compatible store accepts the defaults
+            request_checksum_calculation="when_required",
+            response_checksum_validation="when_required"
+        )
+        client_args = {
+            "region_name": region,
+            "endpoint_url": endpoint_url,
+            "aws_access_key_id": access_key_id,
+            "aws_secret_access_key": secret_access_key,
+        }
+        # boto3 clients are thread-safe; one client shares its connection pool across the threads
+        self.client = session.client("s3", config=config, **client_args)
+        # Parts streamed from a request cannot be hashed before they are sent, so this client
+        # leaves the payload unsigned; a stream cannot be rewound either, so it never retries
+        self.streaming_client = session.client(
+            "s3",
+            config=config.merge(Config(
+                s3={"addressing_style": addressing_style, "payload_signing_enabled": False},
+                retries={"mode": "standard", "total_max_attempts": 1}
+            )),
+            **client_args
+        )
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    # Blocking S3 calls, run in the executor
+
+    def _put_object(self, key: str, body: bytes, content_type: Optional[str]) -> None:
+        params = {
+            "Bucket": self.bucket,
+            "Key": key,
+            "Body": body,
+            "ChecksumAlgorithm": "SHA256",
+            "ChecksumSHA256": _checksum(hashlib.sha256(body).hexdigest())
+        }
+        if content_type:
+            params["ContentType"] = content_type
+        self.client.put_object(**params)
+
+    def _create_multipart_upload(self, key: str, content_type: Optional[str]) -> str:
+        params = {"Bucket": self.bucket, "Key": key}
+        if content_type:
+            params["ContentType"] = content_type
+        return self.client.create_multipart_upload(**params)["UploadId"]
+
+    def _upload_part(self, key: str, upload_id: str, part_number: int, body: bytes) -> str:
+        return self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+        )["ETag"]
+
+    def _upload_streamed_part(self, key: str, upload_id: str, part_number: int, size: int, body: PartStream) -> str:
+        return self.streaming_client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, ContentLength=size, Body=body
+        )["ETag"]
+
+    def _complete_multipart_upload(self, key: str, upload_id: str, parts: List[dict]) -> None:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+
+    def _abort_multipart_upload(self, key: str, upload_id: str) -> None:
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+
+    def _head_object(self, key: str) -> Optional[dict]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key, ChecksumMode="ENABLED")
+        except ClientError as e:
+            if _is_not_found(e):
+                return None
+            raise
+
+    def _get_object(self, key: str, offset: int, length: Optional[int]):
+        params = {"Bucket": self.bucket, "Key": key}
+        if offset or length is not None:
+            params["Range"] = f"bytes={offset}-{'' if length is None else offset + length - 1}"
+        try:
+            return self.client.get_object(**params)["Body"]
+        except ClientError as e:
+            if _is_not_found(e):
+                raise FileNotFoundError(key) from None
+            raise
+
+    def _download_range(self, key: str, fd: int, offset: int, length: int) -> None:
+        """Fetch one range and write it at the same offset, without handing the bytes to the event loop"""
+        body = self._get_object(key, offset, length)
+        try:
+            position = offset
+            for chunk in iter(lambda: body.read(settings.upload_chunk_size), b""):
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+        finally:
+            body.close()
+
+    # StorageBackend
+
+    async def open_writer(self, storage_path: str, content_type: Optional[str] = None) -> StorageWriter:
+        return S3Writer(self, storage_path, content_type)
+
+    async def read(self, storage_path: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        if length == 0:
+            return
+        body = await self._call(self._get_object, storage_path, offset, length)
+        try:
+            while True:
+                chunk = await self._call(body.read, settings.upload_chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await self._call(body.close)
+
+    async def download(self, storage_path: str, destination: str) -> int:
+        head = await self._call(self._head_object, storage_path)
+        if head is None:
+            raise FileNotFoundError(storage_path)
+        size = head["ContentLength"]
+        fd = await asyncio.to_thread(os.open, destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            await asyncio.to_thread(os.ftruncate, fd, size)
+            slots = asyncio.Semaphore(self.part_concurrency)
+
+            async def _range(offset: int) -> None:
+                async with slots:
+                    await self._call(self._download_range, storage_path, fd, offset, min(self.part_size, size - offset))
+            await asyncio.gather(*(_range(offset) for offset in range(0, size, self.part_size)))
+        finally:
+            await asyncio.to_thread(os.close, fd)
+        return size
+
+    async def delete(self, storage_path: str) -> bool:
+        # S3 deletes succeed whether or not the key exists, so check first
+        if await self._call(self._head_object, storage_path) is None:
+            return False
+        await self._call(functools.partial(self.client.delete_object, Bucket=self.bucket, Key=storage_path))
+        return True
+
+    def get_url(self, storage_path: str) -> str:
+        return f"{self.base_url}/{storage_path}"
+
+    async def head(self, storage_path: str) -> Optional[dict]:
+        head = await self._call(self._head_object, storage_path)
+        if head is None:
+            return None
+        checksum = head.get("ChecksumSHA256")
+        sha256 = None
+        # Multipart objects carry a checksum of the part checksums ("...-N"), not of the content
+        if checksum and "-" not in checksum and head.get("ChecksumType", "FULL_OBJECT") == "FULL_OBJECT":
+            sha256 = base64.b64decode(checksum).hex()
+        return {"size": head["ContentLength"], "sha256": sha256}
+
+    def presign_upload(
+        self,
+        storage_path: str,
+        size: int,
+        sha256: str,
+        content_type: Optional[str],
+        expires_in: int
+    ) -> dict:
+        # Signing is local; no request is made. S3 rejects a body whose SHA-256 differs.
+        checksum = _checksum(sha256)
+        params = {
+            "Bucket": self.bucket,
+            "Key": storage_path,
+            "ContentLength": size,
+            "ChecksumAlgorithm": "SHA256",
+            "ChecksumSHA256": checksum
+        }
+        headers = {
+            "Content-Length": str(size),
+            "x-amz-sdk-checksum-algorithm": "SHA256",
+            "x-amz-checksum-sha256": checksum
+        }
+        if content_type:
+            params["ContentType"] = content_type
+            headers["Content-Type"] = content_type
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+        return {"url": url, "method": "PUT", "headers": headers}
+
+    async def create_multipart_upload(self, storage_path: str, size: int, content_type: Optional[str] = None) -> str:
+        return await self._call(self._create_multipart_upload, storage_path, content_type)
+
+    async def upload_part(
+        self,
+        storage_path: str,
+        upload_id: str,
+        part_number: int,
+        offset: int,
+        size: int,
+        chunks: AsyncIterator[bytes]
+    ) -> dict:
+        # Sent with its known ContentLength as the chunks arrive, so the part is never held in memory
+        body = PartStream(chunks, size, part_number, asyncio.get_running_loop())
+        try:
+            etag = await self._call(self._upload_streamed_part, storage_path, upload_id, part_number, size, body)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                raise ValueError("Upload not found") from None
+            raise
+        except Exception:
+            if body.error:
+                raise body.error from None
+            raise
+        return {"size": size, "etag": etag}
+
+    async def complete_multipart_upload(self, storage_path: str, upload_id: str, parts: List[dict]) -> None:
+        await self._call(
+            self._complete_multipart_upload,
+            storage_path,
+            upload_id,
+            [{"PartNumber": part["part_number"], "ETag": part["etag"]} for part in parts]
+        )
+
+    async def abort_multipart_upload(self, storage_path: str, upload_id: str) -> None:
+        await self._call(self._abort_multipart_upload, storage_path, upload_id)
@@ -0,0 +1,113 @@
+import re
+import unicodedata
+from typing import List, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.pagination import encode_cursor, decode_cursor, encode_score_cursor, decode_score_cursor
+
+# Searchable collections and the fields returned for each hit
+SEARCH_FIELDS = {
+    "songs": ("user_id", "title", "artist", "album", "duration", "file_url"),
+    "playlists": ("user_id", "device_id", "name", "parent_id", "created_at"),
+}
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase, accent-folded word tokens of a string"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.casefold())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(folded)
+
+def search_terms(*texts: Optional[str]) -> List[str]:
+    """
+    Distinct tokens stored on a document for prefix search.
+    
+    Kept in a multikey array so a prefix query is an index range scan
+    on (user_id, search_terms).
+    """
+    terms = []
+    for text in texts:
+        for token in tokenize(text):
+            if token not in terms:
+                terms.append(token)
+    return terms
+
+class SearchService:
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+    
+    def _projection(self, kind: str) -> dict:
+        return {field: 1 for field in SEARCH_FIELDS[kind]}
+    
+    async def prefix_search(
+        self,
+        kind: str,
+        user_id: str,
+        q: str,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Typeahead search: every word of q must match a word of the document,
+        the last one as a prefix ("beatles le" matches "Let It Be" by The Beatles).
+        
+        Results are in _id order and paged with the same keyset cursor as
+        playlist listings.
+        """
+        tokens = tokenize(q)
+        if not tokens:
+            return [], None
+        conditions = [{"search_terms": token} for token in tokens[:-1]]
+        conditions.append({"search_terms": {"$regex": f"^{re.escape(tokens[-1])}"}})
+        query = {"user_id": user_id, "$and": conditions}
+        if cursor:
+            query["_id"] = {"$gt": decode_cursor(cursor)}
+        
+        docs = await self.db[kind].find(query, self._projection(kind)).sort("_id", 1).limit(limit + 1).to_list(length=None)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_cursor(docs[-1]["_id"])
+        return docs, next_cursor
+    
+    async def text_search(
+        self,
+        kind: str,
+        user_id: str,
+        q: str,
+        cursor: Optional[str] = None,
+        limit: int = 20
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Ranked full-text search using the collection's text index.
+        
+        Hits are ordered by relevance (score, highest first) and then _id;
+        the cursor carries the last (score, _id) pair so later pages do not
+        re-rank from the start. q accepts MongoDB $text syntax, e.g. quoted
+        phrases and -excluded words.
+        """
+        projection = self._projection(kind)
+        projection["score"] = {"$meta": "textScore"}
+        pipeline = [
+            {"$match": {"user_id": user_id, "$text": {"$search": q}}},
+            {"$project": projection},
+        ]
+        if cursor:
+            score, last_id = decode_score_cursor(cursor)
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": score}},
+                {"score": score, "_id": {"$gt": last_id}},
+            ]}})
+        pipeline += [
+            {"$sort": {"score": -1, "_id": 1}},
+            {"$limit": limit + 1},
+        ]
+        
+        docs = await self.db[kind].aggregate(pipeline).to_list(length=None)
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = encode_score_cursor(docs[-1]["score"], docs[-1]["_id"])
+        return docs, next_cursor
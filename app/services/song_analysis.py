@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Iterable, Optional
+from bson import ObjectId
+from app.config import settings
+from app.database import get_database
+from app.services.audio_analysis import analyze_audio
+from app.services.cache import get_cache
+from app.services.change_log import ChangeLog, SONG, UPSERT
+from app.services.cloud_storage import CloudStorageService
+from app.metrics import Counter
+from app.services.job_queue import JobQueue, PermanentJobError
+from app.services.search_service import search_terms
+
+ANALYZE_SONG = "analyze_song"
+
+logger = logging.getLogger(__name__)
+analysis_enqueue_failures = Counter("analysis_enqueue_failures_total", "Songs whose analysis job could not be queued")
+
+async def analyze_song(payload: dict, queue: JobQueue) -> dict:
+    """
+    Job handler: probe a song's audio file and store what it finds.
+    
+    The measured duration replaces the client-supplied one; artist and album
+    are only filled in when the client left them empty. All tags, stream
+    info and the waveform are stored on the song.
+    """
+    songs = get_database()["songs"]
+    song_id = payload["song_id"]
+    song = await songs.find_one(
+        {"_id": ObjectId(song_id)},
+        {"storage_path": 1, "title": 1, "artist": 1, "album": 1, "user_id": 1}
+    )
+    if not song:
+        raise PermanentJobError("Song not found")
+    backend = CloudStorageService().backend
+    path = backend.local_path(song["storage_path"])
+    temp_path = None
+    if path is None:
+        # Remote storage: analyze a temporary local copy
+        fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(song["storage_path"])[1])
+        os.close(fd)
+        path = temp_path
+    try:
+        if temp_path:
+            try:
+                await backend.download(song["storage_path"], temp_path)
+            except FileNotFoundError:
+                raise PermanentJobError("Audio file not found in storage") from None
+        analysis = await queue.run_in_process(analyze_audio, path, settings.waveform_points)
+    finally:
+        if temp_path:
+            await asyncio.to_thread(os.remove, temp_path)
+    tags = analysis["tags"]
+    update = {
+        "tags": tags,
+        "waveform": analysis["waveform"],
+        "audio": {
+            "format": analysis["format"],
+            "bitrate": analysis["bitrate"],
+            "sample_rate": analysis["sample_rate"],
+            "channels": analysis["channels"]
+        },
+        "analyzed_at": datetime.utcnow().isoformat()
+    }
+    if analysis["duration"] is not None:
+        update["duration"] = round(analysis["duration"])
+    for field in ("artist", "album"):
+        if not song.get(field) and tags.get(field):
+            update[field] = tags[field]
+    update["search_terms"] = search_terms(
+        song.get("title"), update.get("artist", song.get("artist")), update.get("album", song.get("album"))
+    )
+    
+    result = await songs.update_one({"_id": song["_id"]}, {"$set": update})
+    cache = get_cache()
+    if cache:
+        await cache.invalidate("song", [song_id])
+    if not result.matched_count:
+        raise PermanentJobError("Song was deleted during analysis")
+    if settings.sync_enabled:
+        await ChangeLog(get_database()).record([(song.get("user_id"), SONG, song_id, UPSERT)])
+    return {
+        "duration": update.get("duration"),
+        "tags": sorted(tags),
+        "waveform_points": len(analysis["waveform"] or [])
+    }
+
+async def enqueue_song_analysis(queue: Optional[JobQueue], song_ids: Iterable[str]) -> None:
+    """
+    Queue analysis for newly created songs.
+    
+    Best effort: the songs already exist, so a failure to queue is reported
+    rather than failing the upload.
+    """
+    if queue is None:
+        return
+    for song_id in song_ids:
+        try:
+            await queue.enqueue(ANALYZE_SONG, {"song_id": song_id})
+        except Exception:
+            analysis_enqueue_failures.inc()
+            logger.exception("Failed to queue analysis for song %s", song_id)
+
+def register_song_jobs(queue: JobQueue) -> None:
+    queue.register(ANALYZE_SONG, analyze_song)
@@ -1,12 +1,94 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 from datetime import datetime
+from app.config import settings
+from app.services.cache import DocumentCache
+from app.services.change_log import ChangeLog, PLAYLIST, SONG, UPSERT, DELETE
+from app.services.quota_service import QuotaService
+from app.services.search_service import search_terms
+
+# Song fields clients may request when hydrating playlist song references
+SONG_FIELDS = {
+    "user_id", "device_id", "title", "artist", "album", "duration",
+    "file_id", "file_url", "storage_path", "file_size", "original_filename",
+    "content_hash", "created_at"
+}
+
+def build_song_ref(song_id: str, position: float) -> dict:
+    """
+    Build the compact song reference stored in a playlist's songs array.
+    
+    position is a sortable rank, not an index: songs are ordered by it, and
+    a moved song gets a fractional rank between its new neighbours.
+    """
+    return {"_id": song_id, "position": position}
+
+def build_song_document(
+    user_id: str,
+    device_id: str,
+    title: str,
+    file_id: str,
+    file_url: str,
+    storage_path: str,
+    file_size: int,
+    original_filename: str,
+    artist: Optional[str] = None,
+    album: Optional[str] = None,
+    duration: Optional[int] = None,
+    content_hash: Optional[str] = None
+) -> dict:
+    """Build the song document stored in the songs collection"""
+    return {
+        "user_id": user_id,
+        "device_id": device_id,
+        "title": title,
+        "artist": artist,
+        "album": album,
+        "duration": duration,
+        "file_id": file_id,
+        "file_url": file_url,
+        "storage_path": storage_path,
+        "file_size": file_size,
+        "original_filename": original_filename,
+        "content_hash": content_hash,
+        "search_terms": search_terms(title, artist, album),
+        "created_at": datetime.utcnow().isoformat()
+    }
+
+def append_song_refs_update(song_ids: List[str]) -> List[dict]:
+    """
+    Pipeline update that appends references at the playlist's next positions
+    and advances next_position, so positions are assigned in the same write.
+    Like every change to the songs array it bumps songs_version.
+    """
+    next_position = {"$ifNull": ["$next_position", 0]}
+    return [{"$set": {
+        "songs": {"$concatArrays": [
+            {"$ifNull": ["$songs", []]},
+            [
+                {"_id": {"$literal": song_id}, "position": {"$add": [next_position, offset]}}
+                for offset, song_id in enumerate(song_ids)
+            ]
+        ]},
+        "next_position": {"$add": [next_position, len(song_ids)]},
+        "songs_version": {"$add": [{"$ifNull": ["$songs_version", 0]}, 1]}
+    }}]
 
 class SongService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        cache: Optional[DocumentCache] = None,
+        change_log: Optional[ChangeLog] = None,
+        quota: Optional[QuotaService] = None
+    ):
+        self.client = db.client
         self.collection = db["songs"]
         self.playlists_collection = db["playlists"]
+        self.cache = cache
+        self.change_log = change_log
+        self.quota = quota
     
     async def create_song_and_add_to_playlist(
         self,
@@ -21,78 +103,236 @@ class SongService:
         original_filename: str,
         artist: Optional[str] = None,
         album: Optional[str] = None,
-        duration: Optional[int] = None
+        duration: Optional[int] = None,
+        content_hash: Optional[str] = None
     ) -> dict:
         """Create a song record and add it to a playlist"""
+        song_dict = build_song_document(
+            user_id=user_id,
+            device_id=device_id,
+            title=title,
+            artist=artist,
+            album=album,
+            duration=duration,
+            file_id=file_id,
+            file_url=file_url,
+            storage_path=storage_path,
+            file_size=file_size,
+            original_filename=original_filename,
+            content_hash=content_hash
+        )
+        songs = await self.create_songs_and_add_to_playlist(playlist_id, [song_dict])
+        return songs[0]
+    
+    async def create_songs_and_add_to_playlist(self, playlist_id: str, song_docs: List[dict]) -> List[dict]:
+        """
+        Create many song records (built with build_song_document) and append them to a playlist.
         
-        # Verify playlist exists
+        Song IDs are generated up front, so this is two writes regardless of
+        batch size: one conditional update that checks the playlist exists,
+        appends the references and returns its owner, and one insert for the
+        songs. With mongodb_use_transactions both run in a transaction;
+        otherwise a failed insert removes the references again, so songs are
+        never orphaned. The songs and the playlist are then logged with a
+        single change log record(). Raises only if no song was created.
+        
+        With quotas enabled the songs are counted against their owners'
+        quotas first; QuotaExceededError is raised if they do not fit.
+        """
         if not ObjectId.is_valid(playlist_id):
             raise ValueError("Invalid playlist_id")
+        if not song_docs:
+            return []
         
-        playlist = await self.playlists_collection.find_one({"_id": ObjectId(playlist_id)})
-        if not playlist:
-            raise ValueError("Playlist not found")
+        for song_dict in song_docs:
+            song_dict["_id"] = ObjectId()
+        song_ids = [str(song_dict["_id"]) for song_dict in song_docs]
+        
+        reserved = await self.quota.reserve_songs(song_docs) if self.quota else {}
+        try:
+            if settings.mongodb_use_transactions:
+                async with await self.client.start_session() as session:
+                    async with session.start_transaction():
+                        owner = await self._write_songs(playlist_id, song_docs, song_ids, session)
+            else:
+                owner = await self._write_songs(playlist_id, song_docs, song_ids, None)
+        except BaseException:
+            if self.quota:
+                await self.quota.release(reserved)
+            raise
+        
+        if self.cache:
+            await self.cache.invalidate("playlist", [playlist_id])
         
-        # Create song document
-        song_dict = {
-            "user_id": user_id,
-            "device_id": device_id,
-            "title": title,
-            "artist": artist,
-            "album": album,
-            "duration": duration,
-            "file_id": file_id,
-            "file_url": file_url,
-            "storage_path": storage_path,
-            "file_size": file_size,
-            "original_filename": original_filename,
-            "created_at": datetime.utcnow().isoformat()
-        }
-        
-        # Insert song
-        result = await self.collection.insert_one(song_dict)
-        song_id = str(result.inserted_id)
-        song_dict["_id"] = song_id
-        
-        # Add song to playlist
-        await self.playlists_collection.update_one(
+        for song_dict in song_docs:
+            song_dict["_id"] = str(song_dict["_id"])
+        if self.change_log:
+            await self.change_log.record(
+                [(song["user_id"], SONG, song["_id"], UPSERT) for song in song_docs]
+                + [(owner, PLAYLIST, playlist_id, UPSERT)]
+            )
+        return song_docs
+    
+    async def _write_songs(self, playlist_id: str, song_docs: List[dict], song_ids: List[str], session) -> Optional[str]:
+        """Append the references and insert the songs, returning the playlist's owner"""
+        playlist = await self.playlists_collection.find_one_and_update(
             {"_id": ObjectId(playlist_id)},
-            {"$push": {"songs": song_dict}}
+            append_song_refs_update(song_ids),
+            projection={"user_id": 1},
+            session=session
         )
+        if playlist is None:
+            raise ValueError("Playlist not found")
         
-        return song_dict
+        try:
+            if len(song_docs) == 1:
+                await self.collection.insert_one(song_docs[0], session=session)
+            else:
+                await self.collection.insert_many(song_docs, session=session)
+        except Exception:
+            if session is None:
+                # Undo the references and any songs inserted before the failure
+                await self.playlists_collection.update_one(
+                    {"_id": ObjectId(playlist_id)},
+                    {"$pull": {"songs": {"_id": {"$in": song_ids}}}, "$inc": {"songs_version": 1}}
+                )
+                await self.collection.delete_many({"_id": {"$in": [song["_id"] for song in song_docs]}})
+            raise
+        return playlist.get("user_id")
     
     async def get_song(self, song_id: str) -> Optional[dict]:
         """Get a song by ID"""
         if not ObjectId.is_valid(song_id):
             return None
+        if self.cache:
+            song = await self.cache.get("song", song_id)
+            if song is not None:
+                return song
         song = await self.collection.find_one({"_id": ObjectId(song_id)})
         if song:
             song["_id"] = str(song["_id"])
+            if self.cache:
+                await self.cache.set("song", song)
         return song
     
+    async def get_songs_by_ids(self, song_ids: Iterable[str], fields: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        """
+        Fetch many songs with a single $in query, keyed by ID.
+        
+        Cached songs are served from the cache and only the misses go to
+        Mongo. IDs that are invalid or not found are simply absent. If fields
+        is given, only those song fields (plus _id) are returned.
+        """
+        song_ids = list(dict.fromkeys(song_id for song_id in song_ids if ObjectId.is_valid(song_id)))
+        if not song_ids:
+            return {}
+        
+        # Cached songs are full documents; only the misses go to Mongo
+        songs_by_id = await self.cache.get_many("song", song_ids) if self.cache else {}
+        missing_ids = [ObjectId(song_id) for song_id in song_ids if song_id not in songs_by_id]
+        
+        projection = None
+        if fields is not None and not self.cache:
+            projection = {field: 1 for field in fields if field in SONG_FIELDS}
+        
+        if missing_ids:
+            fetched = []
+            async for song in self.collection.find({"_id": {"$in": missing_ids}}, projection):
+                song["_id"] = str(song["_id"])
+                songs_by_id[song["_id"]] = song
+                fetched.append(song)
+            if self.cache and fetched:
+                await self.cache.set_many("song", fetched)
+        
+        if fields is not None:
+            keep = {field for field in fields if field in SONG_FIELDS} | {"_id"}
+            songs_by_id = {
+                song_id: {key: value for key, value in song.items() if key in keep}
+                for song_id, song in songs_by_id.items()
+            }
+        return songs_by_id
+    
+    async def hydrate_song_refs(self, refs: List[dict], fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Resolve a page of song references with a single $in query.
+        
+        Songs are returned in position order with their position attached.
+        References to songs that no longer exist are skipped. If fields is
+        given, only those song fields (plus _id) are fetched.
+        """
+        songs_by_id = await self.get_songs_by_ids([ref["_id"] for ref in refs], fields)
+        hydrated = []
+        for ref in sorted(refs, key=lambda ref: ref.get("position", 0)):
+            song = songs_by_id.get(ref["_id"])
+            if song:
+                hydrated.append({**song, "position": ref.get("position")})
+        return hydrated
+    
     async def remove_song_from_playlist(self, song_id: str, playlist_id: str) -> bool:
         """Remove a song from a playlist"""
         if not ObjectId.is_valid(playlist_id):
             return False
         
         result = await self.playlists_collection.update_one(
-            {"_id": ObjectId(playlist_id)},
-            {"$pull": {"songs": {"_id": song_id}}}
+            {"_id": ObjectId(playlist_id), "songs._id": song_id},
+            {"$pull": {"songs": {"_id": song_id}}, "$inc": {"songs_version": 1}}
         )
+        if self.cache:
+            await self.cache.invalidate("playlist", [playlist_id])
+        if self.change_log and result.modified_count:
+            await self.change_log.record_playlists([playlist_id])
         return result.modified_count > 0
     
-    async def delete_song(self, song_id: str) -> bool:
-        """Delete a song completely"""
-        if not ObjectId.is_valid(song_id):
-            return False
+    async def delete_song(self, song_id: str) -> Optional[dict]:
+        """Delete a song completely, returning the deleted song"""
+        deleted = await self.delete_songs([song_id])
+        return deleted[0] if deleted else None
+    
+    async def delete_songs(self, song_ids: List[str]) -> List[dict]:
+        """
+        Delete many songs and remove them from the playlists that reference them.
+        
+        Only playlists containing one of the songs are touched (via the songs._id
+        index), and each step is a single batched operation regardless of how
+        many songs are deleted. Returns the deleted songs (_id, user_id,
+        storage_path and file_size) so their stored files can be removed.
+        """
+        object_ids = [ObjectId(song_id) for song_id in song_ids if ObjectId.is_valid(song_id)]
+        if not object_ids:
+            return []
+        
+        songs = await self.collection.find(
+            {"_id": {"$in": object_ids}},
+            {"storage_path": 1, "user_id": 1, "file_size": 1}
+        ).to_list(length=None)
+        if not songs:
+            return []
+        found_ids = [str(song["_id"]) for song in songs]
         
-        # Remove from all playlists
+        # Remove from the playlists that contain them
+        playlist_filter = {"songs._id": {"$in": found_ids}}
+        if self.cache or self.change_log:
+            # Resolve the affected playlists first so their cache entries can be dropped
+            # and their changes logged
+            playlist_ids = await self.playlists_collection.distinct("_id", playlist_filter)
+            playlist_filter = {"_id": {"$in": playlist_ids}}
         await self.playlists_collection.update_many(
-            {},
-            {"$pull": {"songs": {"_id": song_id}}}
+            playlist_filter,
+            {"$pull": {"songs": {"_id": {"$in": found_ids}}}, "$inc": {"songs_version": 1}}
         )
         
-        # Delete song document
-        result = await self.collection.delete_one({"_id": ObjectId(song_id)})
-        return result.deleted_count > 0
+        # Delete song documents
+        await self.collection.delete_many({"_id": {"$in": [song["_id"] for song in songs]}})
+        if self.quota:
+            await self.quota.release(self.quota.usage_by_user(songs))
+        
+        if self.cache:
+            await self.cache.invalidate("song", found_ids)
+            await self.cache.invalidate("playlist", [str(playlist_id) for playlist_id in playlist_ids])
+        
+        for song in songs:
+            song["_id"] = str(song["_id"])
+        if self.change_log:
+            await self.change_log.record((song.get("user_id"), SONG, song["_id"], DELETE) for song in songs)
+            await self.change_log.record_playlists(playlist_ids)
+        return songs
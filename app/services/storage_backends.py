@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Optional
+from urllib.parse import quote, urlencode
+from app.config import settings
+
+
+class StorageWriter(ABC):
+    """
+    Handle for a single object being written to a storage backend.
+
+    Chunks are forwarded as they arrive; nothing is visible at the final
+    path until commit() succeeds.
+    """
+
+    @abstractmethod
+    async def write(self, chunk: bytes) -> None:
+        """Append a chunk to the object"""
+
+    @abstractmethod
+    async def commit(self) -> None:
+        """Finish the object and make it visible at its storage path"""
+
+    @abstractmethod
+    async def abort(self) -> None:
+        """Discard everything written so far"""
+
+
+class StorageBackend(ABC):
+    """
+    Pluggable destination for audio file bytes.
+
+    Every method is safe to call from the event loop: backends with blocking
+    clients run them in threads.
+    """
+
+    @abstractmethod
+    async def open_writer(self, storage_path: str, content_type: Optional[str] = None) -> StorageWriter:
+        """Start writing a new object at storage_path"""
+
+    @abstractmethod
+    def read(self, storage_path: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """
+        Stream an object, or length bytes of it starting at offset, in chunks.
+        Raises FileNotFoundError if the object does not exist.
+        """
+
+    async def download(self, storage_path: str, destination: str) -> int:
+        """
+        Copy an object to a local file, returning its size. Raises
+        FileNotFoundError if the object does not exist.
+        """
+        size = 0
+        f = await asyncio.to_thread(open, destination, "wb")
+        try:
+            async for chunk in self.read(storage_path):
+                await asyncio.to_thread(f.write, chunk)
+                size += len(chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        return size
+
+    @abstractmethod
+    async def delete(self, storage_path: str) -> bool:
+        """Delete an object, returning False if it did not exist"""
+
+    @abstractmethod
+    def get_url(self, storage_path: str) -> str:
+        """Public URL clients use to fetch the object"""
+    
+    def local_path(self, storage_path: str) -> Optional[str]:
+        """Filesystem path of the object if the backend keeps it locally, else None"""
+        return None
+    
+    async def head(self, storage_path: str) -> Optional[dict]:
+        """
+        Metadata of a stored object, or None if it does not exist:
+        {"size", "sha256"}, where sha256 is the hex digest or None if the
+        backend cannot tell without reading the object.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support head()")
+    
+    def presign_upload(
+        self,
+        storage_path: str,
+        size: int,
+        sha256: str,
+        content_type: Optional[str],
+        expires_in: int
+    ) -> dict:
+        """
+        A signed, expiring target for the client to PUT the object to directly:
+        {"url", "method", "headers"}. The backend must refuse a body that does
+        not match size and sha256.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support direct uploads")
+    
+    # Multipart uploads: an object assembled from parts written in any order,
+    # possibly concurrently, that becomes visible only when completed
+    
+    @abstractmethod
+    async def create_multipart_upload(self, storage_path: str, size: int, content_type: Optional[str] = None) -> str:
+        """Start a multipart upload of a size-byte object and return its upload ID"""
+    
+    @abstractmethod
+    async def upload_part(
+        self,
+        storage_path: str,
+        upload_id: str,
+        part_number: int,
+        offset: int,
+        size: int,
+        chunks: AsyncIterator[bytes]
+    ) -> dict:
+        """
+        Write one size-byte part (numbered from 1, starting at byte offset)
+        from a stream of chunks. Rewriting a part replaces it. Returns
+        {"size", "etag"}; a stream of another length raises ValueError.
+        """
+    
+    @abstractmethod
+    async def complete_multipart_upload(self, storage_path: str, upload_id: str, parts: List[dict]) -> None:
+        """Assemble the parts ({"part_number", "etag"}, in order) into the final object"""
+    
+    @abstractmethod
+    async def abort_multipart_upload(self, storage_path: str, upload_id: str) -> None:
+        """Discard a multipart upload and everything written to it"""
+
+
+class LocalFileWriter(StorageWriter):
+    def __init__(self, final_path: str):
+        self.final_path = final_path
+        self.temp_path = f"{final_path}.part-{uuid.uuid4().hex}"
+        self._file = None
+
+    async def _open(self):
+        def _open_file():
+            os.makedirs(os.path.dirname(self.final_path), exist_ok=True)
+            return open(self.temp_path, "wb")
+        self._file = await asyncio.to_thread(_open_file)
+
+    async def write(self, chunk: bytes) -> None:
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self) -> None:
+        def _finish():
+            self._file.close()
+            os.replace(self.temp_path, self.final_path)
+        await asyncio.to_thread(_finish)
+
+    async def abort(self) -> None:
+        def _discard():
+            self._file.close()
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        await asyncio.to_thread(_discard)
+
+
+def upload_signature(secret: str, storage_path: str, size: int, sha256: str, content_type: str, expires: int) -> str:
+    """HMAC-SHA256 over everything a presigned local upload URL allows"""
+    message = "\n".join(["PUT", storage_path, str(size), sha256, content_type, str(expires)])
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha256).hexdigest()
+
+def verify_upload_signature(
+    secret: str,
+    storage_path: str,
+    size: int,
+    sha256: str,
+    content_type: str,
+    expires: int,
+    signature: str
+) -> bool:
+    if not secret or expires < time.time():
+        return False
+    expected = upload_signature(secret, storage_path, size, sha256, content_type, expires)
+    return hmac.compare_digest(expected, signature)
+
+
+class LocalStorageBackend(StorageBackend):
+    """
+    Stores objects on the local filesystem under a root directory.
+    Useful for development and for testing uploads without a network.
+    
+    Direct uploads go to the stand-in storage server (app/storage_server.py)
+    at upload_url, which checks the HMAC signature made with signing_secret.
+    """
+
+    def __init__(self, root: str, base_url: str, upload_url: Optional[str] = None, signing_secret: str = ""):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        self.upload_url = upload_url.rstrip("/") if upload_url else None
+        self.signing_secret = signing_secret
+
+    def _full_path(self, storage_path: str) -> str:
+        full_path = os.path.abspath(os.path.join(self.root, storage_path))
+        if not full_path.startswith(self.root + os.sep):
+            raise ValueError("Invalid storage path")
+        return full_path
+
+    async def open_writer(self, storage_path: str, content_type: Optional[str] = None) -> StorageWriter:
+        writer = LocalFileWriter(self._full_path(storage_path))
+        await writer._open()
+        return writer
+
+    async def read(self, storage_path: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        f = await asyncio.to_thread(open, self._full_path(storage_path), "rb")
+        try:
+            await asyncio.to_thread(f.seek, offset)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = settings.upload_chunk_size if remaining is None else min(settings.upload_chunk_size, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def download(self, storage_path: str, destination: str) -> int:
+        source = self._full_path(storage_path)
+
+        def _copy():
+            shutil.copyfile(source, destination)
+            return os.path.getsize(destination)
+        return await asyncio.to_thread(_copy)
+
+    async def delete(self, storage_path: str) -> bool:
+        full_path = self._full_path(storage_path)
+
+        def _remove():
+            try:
+                os.remove(full_path)
+                return True
+            except FileNotFoundError:
+                return False
+        return await asyncio.to_thread(_remove)
+
+    def get_url(self, storage_path: str) -> str:
+        return f"{self.base_url}/{storage_path}"
+    
+    def local_path(self, storage_path: str) -> Optional[str]:
+        return self._full_path(storage_path)
+    
+    async def head(self, storage_path: str) -> Optional[dict]:
+        full_path = self._full_path(storage_path)
+        
+        def _stat():
+            # Local files carry no stored checksum, so it is computed from disk
+            hasher = hashlib.sha256()
+            try:
+                with open(full_path, "rb") as f:
+                    size = os.fstat(f.fileno()).st_size
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        hasher.update(chunk)
+            except FileNotFoundError:
+                return None
+            return {"size": size, "sha256": hasher.hexdigest()}
+        return await asyncio.to_thread(_stat)
+    
+    def presign_upload(
+        self,
+        storage_path: str,
+        size: int,
+        sha256: str,
+        content_type: Optional[str],
+        expires_in: int
+    ) -> dict:
+        if not self.upload_url or not self.signing_secret:
+            raise NotImplementedError("Direct uploads need STORAGE_UPLOAD_URL and STORAGE_SIGNING_SECRET")
+        self._full_path(storage_path)
+        expires = int(time.time()) + expires_in
+        query = urlencode({
+            "size": size,
+            "sha256": sha256,
+            "content_type": content_type or "",
+            "expires": expires,
+            "signature": upload_signature(self.signing_secret, storage_path, size, sha256, content_type or "", expires)
+        })
+        headers = {"Content-Length": str(size)}
+        if content_type:
+            headers["Content-Type"] = content_type
+        return {"url": f"{self.upload_url}/{quote(storage_path)}?{query}", "method": "PUT", "headers": headers}
+    
+    def _multipart_path(self, storage_path: str, upload_id: str) -> str:
+        if not upload_id.isalnum():
+            raise ValueError("Invalid upload ID")
+        return f"{self._full_path(storage_path)}.upload-{upload_id}"
+    
+    async def create_multipart_upload(self, storage_path: str, size: int, content_type: Optional[str] = None) -> str:
+        upload_id = uuid.uuid4().hex
+        part_path = self._multipart_path(storage_path, upload_id)
+        
+        def _create():
+            os.makedirs(os.path.dirname(part_path), exist_ok=True)
+            # Sparse file of the final size; parts are written in place at their offsets
+            with open(part_path, "wb") as f:
+                f.truncate(size)
+        await asyncio.to_thread(_create)
+        return upload_id
+    
+    async def upload_part(
+        self,
+        storage_path: str,
+        upload_id: str,
+        part_number: int,
+        offset: int,
+        size: int,
+        chunks: AsyncIterator[bytes]
+    ) -> dict:
+        part_path = self._multipart_path(storage_path, upload_id)
+        try:
+            fd = await asyncio.to_thread(os.open, part_path, os.O_WRONLY)
+        except FileNotFoundError:
+            raise ValueError("Upload not found") from None
+        hasher = hashlib.md5()
+        written = 0
+        try:
+            async for chunk in chunks:
+                if written + len(chunk) > size:
+                    raise ValueError(f"Part {part_number} must be {size} bytes")
+                if chunk:
+                    await asyncio.to_thread(os.pwrite, fd, chunk, offset + written)
+                    hasher.update(chunk)
+                    written += len(chunk)
+        finally:
+            await asyncio.to_thread(os.close, fd)
+        if written != size:
+            raise ValueError(f"Part {part_number} must be {size} bytes, got {written}")
+        return {"size": size, "etag": hasher.hexdigest()}
+    
+    async def complete_multipart_upload(self, storage_path: str, upload_id: str, parts: List[dict]) -> None:
+        part_path = self._multipart_path(storage_path, upload_id)
+        final_path = self._full_path(storage_path)
+        
+        def _finish():
+            with open(part_path, "rb+") as f:
+                os.fsync(f.fileno())
+            os.replace(part_path, final_path)
+        await asyncio.to_thread(_finish)
+    
+    async def abort_multipart_upload(self, storage_path: str, upload_id: str) -> None:
+        part_path = self._multipart_path(storage_path, upload_id)
+        
+        def _discard():
+            try:
+                os.remove(part_path)
+            except FileNotFoundError:
+                pass
+        await asyncio.to_thread(_discard)
+
+
+class StorageState:
+    backend: Optional[StorageBackend] = None
+
+storage_state = StorageState()
+
+def set_storage_backend(backend: Optional[StorageBackend]) -> None:
+    """Install a storage backend; None restores the configured one"""
+    storage_state.backend = backend
+
+def get_storage_backend() -> StorageBackend:
+    """The backend selected by STORAGE_BACKEND, created once per process"""
+    if storage_state.backend is None:
+        if settings.storage_backend == "local":
+            storage_state.backend = LocalStorageBackend(
+                settings.storage_local_root,
+                settings.storage_base_url,
+                upload_url=settings.storage_upload_url,
+                signing_secret=settings.storage_signing_secret
+            )
+        elif settings.storage_backend == "s3":
+            # Imported here so boto3 is only needed when it is used
+            from app.services.s3_storage import S3StorageBackend
+            storage_state.backend = S3StorageBackend(
+                settings.storage_s3_bucket,
+                settings.storage_base_url,
+                # Empty values in .env mean unset
+                region=settings.storage_s3_region or None,
+                endpoint_url=settings.storage_s3_endpoint_url or None,
+                access_key_id=settings.storage_s3_access_key_id or None,
+                secret_access_key=settings.storage_s3_secret_access_key or None,
+                addressing_style=settings.storage_s3_addressing_style
+            )
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {settings.storage_backend!r}; use local or s3")
+    return storage_state.backend
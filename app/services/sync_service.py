@@ -0,0 +1,73 @@
+import time
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.pagination import encode_sync_token, decode_sync_token
+from app.services.cache import DocumentCache
+from app.services.change_log import ChangeLog, PLAYLIST, SONG, UPSERT, sync_token_expired
+from app.services.playlist_service import PlaylistService, PLAYLIST_LIST_FIELDS
+from app.services.song_service import SongService, SONG_FIELDS
+
+class SyncTokenExpired(ValueError):
+    """The changes after a token have expired from the log; the device must resync fully"""
+
+class SyncService:
+    """
+    Delta sync for devices, read from the change log.
+    
+    A sync costs one indexed range read of the log plus one $in query each
+    for the changed playlists and songs, so it grows with the number of
+    changes since the device's token rather than with the library.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase, cache: Optional[DocumentCache] = None):
+        self.change_log = ChangeLog(db)
+        self.playlist_service = PlaylistService(db, cache=cache)
+        self.song_service = SongService(db, cache=cache)
+    
+    async def sync(self, user_id: str, since: Optional[str], limit: int = 500) -> dict:
+        """
+        Changes to a user's playlists and songs after the since token.
+        
+        Without a token, nothing is returned but a token for the current end
+        of the log: take it before listing the library, then sync from it.
+        Each changed item appears once, in its current state, or in the
+        deleted lists. Raises ValueError for a malformed token and
+        SyncTokenExpired for one older than the log's retention.
+        """
+        result = {"playlists": [], "songs": [], "deleted_playlists": [], "deleted_songs": [], "has_more": False}
+        if since is None:
+            seq = await self.change_log.current_seq(user_id)
+            return {**result, "next_token": encode_sync_token(seq, time.time())}
+        
+        seq, issued_at = decode_sync_token(since)
+        if sync_token_expired(issued_at):
+            raise SyncTokenExpired("Sync token has expired; list the library again and sync from a new token")
+        entries, last_seq, has_more = await self.change_log.changes_since(user_id, seq, limit)
+        
+        # Only the last change to each item matters
+        latest = {}
+        for entry in entries:
+            latest[(entry["kind"], entry["entity_id"])] = entry["op"]
+        upserted = {PLAYLIST: [], SONG: []}
+        for (kind, entity_id), op in latest.items():
+            if op == UPSERT:
+                upserted[kind].append(entity_id)
+            else:
+                result[f"deleted_{kind}s"].append(entity_id)
+        
+        playlists = await self.playlist_service.get_playlists_by_ids(upserted[PLAYLIST], fields=list(PLAYLIST_LIST_FIELDS))
+        songs = await self.song_service.get_songs_by_ids(upserted[SONG], fields=SONG_FIELDS)
+        for playlist_id in upserted[PLAYLIST]:
+            playlist = playlists.get(playlist_id)
+            if playlist:
+                result["playlists"].append(playlist)
+            else:
+                # Deleted since; its tombstone is further along the log
+                result["deleted_playlists"].append(playlist_id)
+        for song_id in upserted[SONG]:
+            if song_id in songs:
+                result["songs"].append(songs[song_id])
+            else:
+                result["deleted_songs"].append(song_id)
+        
+        return {**result, "has_more": has_more, "next_token": encode_sync_token(last_seq, time.time())}
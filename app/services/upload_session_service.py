@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from app.config import settings
+from app.metrics import record_storage, upload_cleanup_failures
+from app.schemas.upload import UploadSessionCreate
+from app.services.cloud_storage import CloudStorageService
+
+logger = logging.getLogger(__name__)
+
+class UploadSessionService:
+    """
+    Resumable uploads.
+
+    A session fixes the file size and the part size up front. Part N covers
+    bytes [(N-1) * chunk_size, N * chunk_size) and is streamed straight to a
+    multipart upload on the storage backend, so parts can arrive in any
+    order, in parallel, and be retried. Each received part is recorded on the
+    session document; completing the session assembles the object.
+
+    Sessions expire after resumable_session_ttl_seconds without a new part
+    and are removed, with their partial or assembled objects, by
+    expire_sessions().
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, cloud_storage: CloudStorageService):
+        self.collection = db["upload_sessions"]
+        self.cloud_storage = cloud_storage
+        self.backend = cloud_storage.backend
+
+    @staticmethod
+    def _expires_at() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=settings.resumable_session_ttl_seconds)
+
+    @staticmethod
+    def total_parts(session: dict) -> int:
+        return -(-session["size"] // session["chunk_size"])
+
+    def progress(self, session: dict) -> dict:
+        """Client-facing view of a session"""
+        received = sorted(int(number) for number in session.get("parts", {}))
+        received_set = set(received)
+        total = self.total_parts(session)
+        return {
+            "upload_id": str(session["_id"]),
+            "status": session["status"],
+            "size": session["size"],
+            "chunk_size": session["chunk_size"],
+            "total_parts": total,
+            "received_bytes": sum(part["size"] for part in session.get("parts", {}).values()),
+            "received_parts": received,
+            "missing_parts": [number for number in range(1, total + 1) if number not in received_set],
+            "expires_at": session["expires_at"],
+            "song_id": session.get("song_id")
+        }
+
+    async def create_session(self, request: UploadSessionCreate) -> dict:
+        """Start a session and the backend multipart upload behind it"""
+        if request.size > settings.resumable_max_size:
+            raise ValueError(f"File too large; the limit is {settings.resumable_max_size} bytes")
+        if not ObjectId.is_valid(request.playlist_id):
+            raise ValueError("Invalid playlist_id")
+
+        file_extension = request.filename.split(".")[-1] if "." in request.filename else "mp3"
+        file_id = str(uuid.uuid4())
+        storage_path = f"users/{request.user_id}/audio/{file_id}.{file_extension}"
+        backend_upload_id = await self.backend.create_multipart_upload(storage_path, request.size, request.content_type)
+
+        session = {
+            **request.model_dump(),
+            "file_id": file_id,
+            "storage_path": storage_path,
+            "backend_upload_id": backend_upload_id,
+            "chunk_size": settings.resumable_chunk_size,
+            "parts": {},
+            "status": "active",
+            "created_at": datetime.utcnow().isoformat(),
+            "expires_at": self._expires_at()
+        }
+        try:
+            result = await self.collection.insert_one(session)
+        except BaseException:
+            await self.backend.abort_multipart_upload(storage_path, backend_upload_id)
+            raise
+        session["_id"] = result.inserted_id
+        return session
+
+    async def get_session(self, upload_id: str) -> Optional[dict]:
+        """Get a session that has not expired"""
+        if not ObjectId.is_valid(upload_id):
+            return None
+        session = await self.collection.find_one({"_id": ObjectId(upload_id)})
+        if not session or session["expires_at"] <= datetime.utcnow():
+            return None
+        return session
+
+    async def write_part(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Optional[dict]:
+        """
+        Stream the part starting at offset to the backend and record it.
+
+        offset must be a multiple of the session's chunk_size and the body must
+        be exactly one part long (shorter only for the last part). Returns the
+        updated session, or None if it does not exist or has expired.
+        """
+        session = await self.get_session(upload_id)
+        if not session:
+            return None
+        if session["status"] != "active":
+            raise ValueError(f"Upload is {session['status']}")
+        chunk_size = session["chunk_size"]
+        if offset % chunk_size or offset >= session["size"]:
+            raise ValueError(f"offset must be a multiple of {chunk_size} below {session['size']}")
+        part_number = offset // chunk_size + 1
+        expected_size = min(chunk_size, session["size"] - offset)
+
+        start = time.perf_counter()
+        # The backend refuses a body of any other length
+        part = await self.backend.upload_part(
+            session["storage_path"], session["backend_upload_id"], part_number, offset, expected_size, chunks
+        )
+        record_storage("upload_part", time.perf_counter() - start, part["size"])
+
+        return await self.collection.find_one_and_update(
+            {"_id": session["_id"], "status": "active"},
+            {"$set": {f"parts.{part_number}": part, "expires_at": self._expires_at()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def complete(self, upload_id: str) -> Optional[dict]:
+        """
+        Assemble the object once every part has arrived, hash it and claim it
+        for the song.
+
+        The session moves to completing atomically with a lease of
+        resumable_complete_lease_seconds, so concurrent completions cannot
+        assemble it twice, while one that crashed can be retried once the
+        lease runs out; the steps already done are recorded on the session
+        and skipped. With deduplication on, the object is registered as a
+        blob, or dropped for an identical one already stored. Returns the
+        session, with the stored file's details under "upload" in the shape
+        of CloudStorageService.upload_audio_file(). A session that already
+        completed is returned as is (with its song_id) so retries are safe.
+        """
+        session = await self.get_session(upload_id)
+        if not session:
+            return None
+        if session["status"] == "completed":
+            return session
+        now = datetime.utcnow()
+        if session["status"] == "completing" and session.get("lease_until", now) > now:
+            raise ValueError("Upload is already being completed")
+        if session["status"] not in ("active", "completing"):
+            raise ValueError(f"Upload is {session['status']}")
+        missing = self.progress(session)["missing_parts"]
+        if missing:
+            raise ValueError(f"Missing parts: {missing[:20]}")
+
+        session = await self.collection.find_one_and_update(
+            {
+                "_id": session["_id"],
+                "$or": [{"status": "active"}, {"status": "completing", "lease_until": {"$lte": now}}]
+            },
+            {"$set": {
+                "status": "completing",
+                "lease_until": now + timedelta(seconds=settings.resumable_complete_lease_seconds),
+                "expires_at": self._expires_at()
+            }},
+            return_document=ReturnDocument.AFTER
+        )
+        if not session:
+            raise ValueError("Upload is already being completed")
+
+        try:
+            if not session.get("assembled"):
+                parts = [
+                    {"part_number": number, "etag": session["parts"][str(number)]["etag"]}
+                    for number in range(1, self.total_parts(session) + 1)
+                ]
+                await self.backend.complete_multipart_upload(session["storage_path"], session["backend_upload_id"], parts)
+                session["assembled"] = True
+                await self.collection.update_one({"_id": session["_id"]}, {"$set": {"assembled": True}})
+            if not session.get("upload"):
+                session["upload"] = await self._claim_object(session)
+                await self.collection.update_one({"_id": session["_id"]}, {"$set": {"upload": session["upload"]}})
+        except BaseException:
+            # Until the object is assembled the parts can still change; after that a retry resumes here
+            await self.collection.update_one(
+                {"_id": session["_id"]},
+                {"$set": {"status": "completing" if session.get("assembled") else "active", "lease_until": now}}
+            )
+            raise
+        return session
+
+    async def _claim_object(self, session: dict) -> dict:
+        """Hash the assembled object and, when deduplicating, take a blob reference for it"""
+        start = time.perf_counter()
+        hasher = hashlib.sha256()
+        async for chunk in self.backend.read(session["storage_path"]):
+            hasher.update(chunk)
+        content_hash = hasher.hexdigest()
+        record_storage("hash", time.perf_counter() - start, session["size"])
+
+        file_id = session["file_id"]
+        storage_path = session["storage_path"]
+        blob_index = self.cloud_storage.blob_index
+        if blob_index:
+            file_id = content_hash
+            blob = await blob_index.register(content_hash, storage_path, session["size"], session.get("content_type"))
+            if blob["storage_path"] != storage_path:
+                # An identical file is already stored; share it instead
+                await self.backend.delete(storage_path)
+                storage_path = blob["storage_path"]
+        return {
+            "file_id": file_id,
+            "file_url": self.backend.get_url(storage_path),
+            "storage_path": storage_path,
+            "file_size": session["size"],
+            "content_hash": content_hash,
+            "content_type": session.get("content_type"),
+            "original_filename": session["filename"]
+        }
+
+    async def mark_completed(self, upload_id: str, song_id: str) -> None:
+        await self.collection.update_one(
+            {"_id": ObjectId(upload_id)},
+            {"$set": {"status": "completed", "song_id": song_id}}
+        )
+
+    async def abort(self, upload_id: str) -> bool:
+        """Cancel a session and discard its parts"""
+        if not ObjectId.is_valid(upload_id):
+            return False
+        session = await self.collection.find_one_and_delete(
+            {"_id": ObjectId(upload_id), "status": "active"}
+        )
+        if not session:
+            return False
+        await self.backend.abort_multipart_upload(session["storage_path"], session["backend_upload_id"])
+        return True
+
+    async def fail(self, session: dict) -> None:
+        """
+        Give up on a session whose object was assembled but whose song could
+        not be created: the stored file (or blob reference) is released and
+        the session removed.
+        """
+        await self.cloud_storage.delete_audio_files([session["upload"]["storage_path"]])
+        await self.collection.delete_one({"_id": session["_id"]})
+
+    async def expire_sessions(self) -> int:
+        """
+        Remove expired sessions and their objects, returning how many were
+        removed. A session left completing by a crash may have assembled its
+        object, or claimed it, already; that is deleted (or released) too.
+        """
+        removed = 0
+        async for session in self.collection.find(
+            {"expires_at": {"$lte": datetime.utcnow()}},
+            {"storage_path": 1, "backend_upload_id": 1, "status": 1, "assembled": 1, "upload": 1}
+        ):
+            if session["status"] != "completed":
+                try:
+                    await self.backend.abort_multipart_upload(session["storage_path"], session["backend_upload_id"])
+                    if session.get("upload"):
+                        await self.cloud_storage.delete_audio_file(session["upload"]["storage_path"])
+                    elif session.get("assembled"):
+                        await self.backend.delete(session["storage_path"])
+                except Exception:
+                    upload_cleanup_failures.inc(kind="resumable")
+                    logger.exception("Failed to abort expired upload %s", session["_id"])
+                    continue
+            await self.collection.delete_one({"_id": session["_id"]})
+            removed += 1
+        return removed
+
+async def collect_expired_uploads(service_factory, interval: float) -> None:
+    """Run expire_sessions() every interval seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            removed = await service_factory().expire_sessions()
+            if removed:
+                logger.info("Removed %d expired upload sessions", removed)
+        except Exception:
+            upload_cleanup_failures.inc(kind="collector")
+            logger.exception("Upload session cleanup failed")
@@ -0,0 +1,68 @@
+"""
+Stand-in for an object store's presigned uploads, for development and
+offline testing of direct uploads.
+
+Accepts PUT requests signed by LocalStorageBackend.presign_upload() and
+writes them under STORAGE_LOCAL_ROOT, the same tree the API reads, so the
+whole flow (POST /direct-uploads, PUT to the returned URL, finalize) works
+without cloud credentials. Like S3 with a checksum header, it refuses a body
+whose size or SHA-256 differs from what was signed, and the object appears
+only once it has been received completely.
+
+    python -m app.storage_server
+"""
+import hashlib
+import uvicorn
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from app.config import settings
+from app.services.storage_backends import LocalStorageBackend, verify_upload_signature
+
+app = FastAPI(title="Local storage server", docs_url=None, redoc_url=None)
+
+def get_backend() -> LocalStorageBackend:
+    return LocalStorageBackend(settings.storage_local_root, settings.storage_base_url)
+
+@app.put("/{storage_path:path}")
+async def put_object(
+    storage_path: str,
+    request: Request,
+    size: int = Query(...),
+    sha256: str = Query(...),
+    content_type: str = Query(""),
+    expires: int = Query(...),
+    signature: str = Query(...)
+):
+    if not verify_upload_signature(
+        settings.storage_signing_secret, storage_path, size, sha256, content_type, expires, signature
+    ):
+        raise HTTPException(status_code=403, detail="Signature does not match or has expired")
+    if content_type and request.headers.get("content-type", "") != content_type:
+        raise HTTPException(status_code=400, detail="Content-Type does not match the signed upload")
+
+    try:
+        writer = await get_backend().open_writer(storage_path, content_type or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    hasher = hashlib.sha256()
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > size:
+                raise HTTPException(status_code=400, detail=f"Body exceeds the signed size of {size} bytes")
+            hasher.update(chunk)
+            await writer.write(chunk)
+        if received != size:
+            raise HTTPException(status_code=400, detail=f"Received {received} bytes, expected {size}")
+        if hasher.hexdigest() != sha256:
+            raise HTTPException(status_code=400, detail="SHA-256 of the body does not match the signed upload")
+        await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+    return Response(status_code=200, headers={"ETag": f'"{sha256}"'})
+
+if __name__ == "__main__":
+    if not settings.storage_signing_secret:
+        raise SystemExit("Set STORAGE_SIGNING_SECRET (the same value the API uses)")
+    uvicorn.run(app, host=settings.api_host, port=settings.storage_server_port)
@@ -0,0 +1,135 @@
+"""
+Audio streaming with HTTP range requests and ETag validation.
+
+Songs are streamed from the storage backend with seek support: a Range
+request gets 206 with just the requested bytes, so a player seeking within
+a long track does not download it from the start. The ETag is the song's
+content hash (stored files never change), which clients revalidate with
+If-None-Match (304) and use with If-Range to resume.
+
+Files on the local backend are served with FileResponse, which handles
+Range and If-Range itself and hands the whole file to the server with
+http.response.pathsend (zero-copy) when the server supports it. Other
+backends are streamed with ranged reads.
+"""
+import asyncio
+import os
+from mimetypes import guess_type
+from typing import AsyncIterator, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app.config import settings
+from app.services.storage_backends import StorageBackend
+
+class RangeNotSatisfiable(ValueError):
+    """The requested range starts past the end of the file"""
+
+def audio_etag(song: dict) -> str:
+    return f'"{song.get("content_hash") or song["file_id"]}"'
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match list"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in header.split(","))
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    The [start, end) bytes of a single-range "bytes=" header, or None to
+    send the whole file (malformed or multiple ranges are ignored, as HTTP
+    allows). Raises RangeNotSatisfiable for a range outside the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec or size <= 0:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    if not (first or last) or not (first or "0").isdigit() or not (last or "0").isdigit():
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if end <= start:
+        return None
+    return start, min(end, size)
+
+async def _prefetched(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Start a stream before the response does, so a missing object raises
+    FileNotFoundError while a 404 can still be sent.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = b""
+
+    async def _stream():
+        if first:
+            yield first
+        async for chunk in chunks:
+            yield chunk
+    return _stream()
+
+async def stream_song(request: Request, song: dict, backend: StorageBackend) -> Response:
+    """
+    Response streaming a song's audio, honouring Range, If-Range and
+    If-None-Match. Raises FileNotFoundError if the file is not in storage.
+    """
+    storage_path = song["storage_path"]
+    etag = audio_etag(song)
+    media_type = guess_type(storage_path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.stream_cache_max_age_seconds}",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    path = backend.local_path(storage_path)
+    if path is not None:
+        stat_result = await asyncio.to_thread(os.stat, path)
+        response = FileResponse(path, media_type=media_type, headers=headers, stat_result=stat_result)
+        response.chunk_size = settings.stream_chunk_size
+        return response
+
+    size = song.get("file_size")
+    if size is None:
+        stored = await backend.head(storage_path)
+        if stored is None:
+            raise FileNotFoundError(storage_path)
+        size = stored["size"]
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # A stale If-Range validator means the client's partial copy is outdated: send everything
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        chunks = await _prefetched(backend.read(storage_path))
+        return StreamingResponse(
+            chunks, media_type=media_type, headers={**headers, "Content-Length": str(size)}
+        )
+    start, end = byte_range
+    chunks = await _prefetched(backend.read(storage_path, start, end - start))
+    return StreamingResponse(
+        chunks,
+        status_code=206,
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(end - start), "Content-Range": f"bytes {start}-{end - 1}/{size}"}
+    )
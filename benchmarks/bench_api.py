@@ -0,0 +1,298 @@
+"""
+Load test for the API hot paths, run in-process against the FastAPI app.
+
+Requests go through the full ASGI stack (routing, validation, services,
+storage) via httpx without a network hop. Scenarios, in order:
+
+    playlist_create, playlist_list, playlist_get,
+    song_upload, song_get, song_delete,
+    tree_upload, tree_get, tree_delete,
+    song_move (random moves within one --move-playlist-songs long playlist)
+
+Each reports throughput, latency percentiles and the process's peak RSS.
+By default the database is a mongomock stand-in (pip install mongomock-motor);
+--mongo uses the MongoDB at MONGODB_URL with a separate, freshly dropped
+database. Audio is written to a temporary directory.
+
+    python -m benchmarks.bench_api --json results.json
+    python -m benchmarks.bench_api --mongo --requests 2000 --concurrency 32
+    python -m benchmarks.bench_api --json new.json --compare baseline.json
+
+With --compare, the run fails (exit status 1) if any scenario's throughput
+dropped, or its p99 grew, by more than --tolerance against the baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+import httpx
+from app.config import settings
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+USER_ID = "bench-user"
+DEVICE_ID = "bench-device"
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(latencies: List[float], errors: int, wall_s: float) -> dict:
+    ordered = sorted(latencies) or [0.0]
+    
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_s": wall_s,
+        "throughput_rps": len(latencies) / wall_s if wall_s else 0.0,
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1],
+        "mean_ms": statistics.fmean(ordered),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+async def run_scenario(
+    count: int,
+    concurrency: int,
+    request: Callable[[int], Awaitable[httpx.Response]]
+) -> dict:
+    """Issue count requests with at most concurrency in flight and time each one"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await request(i)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+class AudioFactory:
+    """Synthetic audio payloads; each one is unique so storage dedup never short-circuits"""
+    
+    def __init__(self, size: int):
+        self.body = os.urandom(max(size, 8))
+        self.counter = 0
+    
+    def next(self) -> bytes:
+        self.counter += 1
+        return self.counter.to_bytes(8, "big") + self.body[8:]
+
+def build_tree(depth: int, fanout: int, songs_per_node: int, counter: List[int]) -> dict:
+    """Playlist upload structure; counter[0] tracks the next file_index"""
+    songs = []
+    for _ in range(songs_per_node):
+        songs.append({"file_index": counter[0], "title": f"Song {counter[0]}", "artist": "Bench", "duration": 200})
+        counter[0] += 1
+    children = [build_tree(depth - 1, fanout, songs_per_node, counter) for _ in range(fanout)] if depth > 1 else []
+    return {"name": f"Level {depth}", "songs": songs, "children": children}
+
+async def run(args) -> dict:
+    from app.database import mongodb
+    from app.main import app
+    
+    settings.storage_local_root = tempfile.mkdtemp(prefix="bench-storage-")
+    # One client drives every request: keep admission control in the path but never reject
+    settings.rate_limit_user_per_second = settings.rate_limit_device_per_second = 0
+    settings.concurrency_limit_per_user = settings.concurrency_limit_per_device = 0
+    settings.admission_max_inflight_writes = 0
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from app.database import get_client_options, get_database
+        from app.indexes import ensure_indexes
+        settings.mongodb_db_name = args.db
+        mongodb.client = AsyncIOMotorClient(settings.mongodb_url, **get_client_options())
+        await mongodb.client.drop_database(args.db)
+        await ensure_indexes(get_database())
+    else:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            raise SystemExit("The in-memory stand-in needs mongomock-motor (pip install mongomock-motor), or use --mongo")
+        from benchmarks.mongomock_compat import patch_mongomock
+        patch_mongomock()
+        mongodb.client = AsyncMongoMockClient()
+    
+    audio = AudioFactory(args.audio_kb * 1024)
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def scenario(name: str, count: int, request, concurrency: Optional[int] = None):
+            results[name] = await run_scenario(count, concurrency or args.concurrency, request)
+            stats = results[name]
+            print(
+                f"{name:>16}: {stats['throughput_rps']:8.1f} req/s  p50 {stats['p50_ms']:7.2f} ms  "
+                f"p99 {stats['p99_ms']:7.2f} ms  errors {stats['errors']}  peak RSS {stats['peak_rss_mb'] or 0:.0f} MB"
+            )
+        
+        # Playlists
+        playlist_ids = []
+        
+        async def create_playlist(i):
+            response = await client.post("/api/v1/playlists", json={
+                "name": f"Playlist {i}", "user_id": USER_ID, "device_id": DEVICE_ID
+            })
+            if response.status_code == 201:
+                playlist_ids.append(response.json()["_id"])
+            return response
+        await scenario("playlist_create", args.requests, create_playlist)
+        if not playlist_ids:
+            raise SystemExit("No playlists were created; check the database backend")
+        
+        await scenario("playlist_list", args.requests, lambda i: client.get(
+            "/api/v1/playlists", params={"user_id": USER_ID, "limit": args.page_size}
+        ))
+        await scenario("playlist_get", args.requests, lambda i: client.get(
+            f"/api/v1/playlists/{random.choice(playlist_ids)}"
+        ))
+        
+        # Songs
+        song_ids = []
+        
+        async def upload_song(i):
+            response = await client.post(
+                "/api/v1/songs/add-to-playlist",
+                data={
+                    "playlist_id": playlist_ids[i % len(playlist_ids)],
+                    "user_id": USER_ID,
+                    "device_id": DEVICE_ID,
+                    "title": f"Song {i}",
+                    "artist": "Bench",
+                },
+                files={"audio_file": (f"{i}.mp3", audio.next(), "audio/mpeg")}
+            )
+            if response.status_code == 201:
+                song_ids.append(response.json()["_id"])
+            return response
+        await scenario("song_upload", args.uploads, upload_song)
+        if song_ids:
+            await scenario("song_get", args.requests, lambda i: client.get(f"/api/v1/songs/{random.choice(song_ids)}"))
+            await scenario("song_delete", len(song_ids), lambda i: client.delete(f"/api/v1/songs/{song_ids[i]}"))
+        
+        # Nested trees
+        counter = [0]
+        structure = json.dumps(build_tree(args.tree_depth, args.tree_fanout, args.tree_songs, counter))
+        tree_files = counter[0]
+        tree_ids = []
+        
+        async def upload_tree(i):
+            response = await client.post(
+                "/api/v1/playlists/upload",
+                data={"user_id": USER_ID, "device_id": DEVICE_ID, "playlist_structure": structure},
+                files=[("audio_files", (f"{n}.mp3", audio.next(), "audio/mpeg")) for n in range(tree_files)]
+            )
+            if response.status_code == 201:
+                tree_ids.append(response.json()["playlist"]["_id"])
+            return response
+        await scenario("tree_upload", args.trees, upload_tree)
+        if tree_ids:
+            await scenario("tree_get", args.requests, lambda i: client.get(f"/api/v1/playlists/{random.choice(tree_ids)}/tree"))
+            await scenario("tree_delete", len(tree_ids), lambda i: client.delete(f"/api/v1/playlists/{tree_ids[i]}"))
+        
+        # Reordering a long playlist; its songs all share one small uploaded file,
+        # which is stored once per song
+        response = await client.post(
+            "/api/v1/playlists/upload",
+            data={"user_id": USER_ID, "device_id": DEVICE_ID, "playlist_structure": json.dumps({
+                "name": "Long playlist",
+                "songs": [{"file_index": 0, "title": f"Song {n}"} for n in range(args.move_playlist_songs)]
+            })},
+            files=[("audio_files", ("0.mp3", audio.next()[:1024], "audio/mpeg"))]
+        )
+        if response.status_code == 201:
+            long_playlist = response.json()["playlist"]
+            long_song_ids = [song["_id"] for song in long_playlist["songs"]]
+            # One editor at a time: concurrent moves in one playlist retry on each other
+            await scenario("song_move", args.requests, lambda i: client.post(
+                f"/api/v1/playlists/{long_playlist['_id']}/songs/{random.choice(long_song_ids)}/move",
+                json={"index": random.randrange(len(long_song_ids))}
+            ), concurrency=1)
+    
+    if args.mongo:
+        await mongodb.client.drop_database(args.db)
+        mongodb.client.close()
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Describe every scenario that regressed beyond tolerance"""
+    regressions = []
+    for name, stats in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if stats["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {stats['throughput_rps']:.1f} req/s vs {base['throughput_rps']:.1f}")
+        if stats["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {stats['p99_ms']:.2f} ms vs {base['p99_ms']:.2f}")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", action="store_true", help="Use MONGODB_URL instead of the mongomock stand-in")
+    parser.add_argument("--db", default=f"{settings.mongodb_db_name}_loadtest", help="Database used with --mongo (dropped)")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per read/create scenario")
+    parser.add_argument("--uploads", type=int, default=200, help="Song uploads (each is then read and deleted)")
+    parser.add_argument("--audio-kb", type=int, default=256, help="Size of each synthetic audio file")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--page-size", type=int, default=100, help="limit for playlist_list")
+    parser.add_argument("--trees", type=int, default=20, help="Nested tree uploads")
+    parser.add_argument("--tree-depth", type=int, default=3)
+    parser.add_argument("--tree-fanout", type=int, default=3)
+    parser.add_argument("--tree-songs", type=int, default=2, help="Songs per playlist in each tree")
+    parser.add_argument("--move-playlist-songs", type=int, default=5000, help="Length of the playlist reordered by song_move")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_output", help="Write results to this file")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    results = {
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": "mongo" if args.mongo else "mongomock",
+        "params": {key: value for key, value in vars(args).items() if key not in ("json_output", "compare")},
+        "scenarios": asyncio.run(run(args)),
+    }
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+Correctness and throughput checks for the S3 storage backend.
+
+Runs S3StorageBackend against a moto server started in-process (pip install
+"moto[server]"), or against a real S3-compatible store with --endpoint-url.
+Scenarios, in order:
+
+    put              one-piece write; head() must report the SHA-256
+    multipart        writer spanning several parts
+    streamed_part    resumable-style parts streamed with upload_part()
+    short_part       a part shorter than its size must raise ValueError
+    ranged_get       read() of a range in the middle of the object
+    download         concurrent ranged download into a file
+    presign          PUT to a presigned URL; head() must report the SHA-256
+
+Each reports MiB/s and whether the bytes came back intact; the run fails
+(exit status 1) if any check does not.
+
+    python -m benchmarks.bench_s3 --size-mib 24
+    python -m benchmarks.bench_s3 --endpoint-url http://127.0.0.1:9000 --bucket audio
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+from typing import AsyncIterator, Callable, Awaitable
+import boto3
+import httpx
+from app.services.s3_storage import MIN_PART_SIZE, S3StorageBackend
+
+try:
+    from moto.server import ThreadedMotoServer
+except ImportError:
+    ThreadedMotoServer = None
+
+async def chunked(data: bytes, chunk_size: int) -> AsyncIterator[bytes]:
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+async def collect(chunks: AsyncIterator[bytes]) -> bytes:
+    body = bytearray()
+    async for chunk in chunks:
+        body += chunk
+    return bytes(body)
+
+async def write(backend: S3StorageBackend, key: str, data: bytes, chunk_size: int) -> None:
+    writer = await backend.open_writer(key, "audio/mpeg")
+    async for chunk in chunked(data, chunk_size):
+        await writer.write(chunk)
+    await writer.commit()
+
+async def run(results: dict, name: str, size: int, scenario: Callable[[], Awaitable[bool]]) -> None:
+    start = time.perf_counter()
+    try:
+        passed = await scenario()
+        error = None
+    except Exception as e:
+        passed, error = False, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - start
+    results[name] = {
+        "passed": passed,
+        "seconds": elapsed,
+        "mib_per_s": size / (1024 * 1024) / elapsed if size and elapsed else None,
+        "error": error,
+    }
+    rate = f"{results[name]['mib_per_s']:8.1f} MiB/s" if results[name]["mib_per_s"] else " " * 14
+    print(f"{name:>14}: {'ok  ' if passed else 'FAIL'} {rate}  {elapsed * 1000:8.1f} ms  {error or ''}")
+
+async def main(args) -> int:
+    server = None
+    endpoint_url = args.endpoint_url
+    if not endpoint_url:
+        if ThreadedMotoServer is None:
+            print('moto is not installed (pip install "moto[server]"); pass --endpoint-url instead')
+            return 1
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        server = ThreadedMotoServer(port=args.moto_port, verbose=False)
+        server.start()
+        endpoint_url = f"http://127.0.0.1:{args.moto_port}"
+    credentials = {
+        "region_name": args.region,
+        "endpoint_url": endpoint_url,
+        "aws_access_key_id": args.access_key_id,
+        "aws_secret_access_key": args.secret_access_key,
+    }
+    try:
+        if server:
+            boto3.client("s3", **credentials).create_bucket(Bucket=args.bucket)
+        backend = S3StorageBackend(
+            args.bucket,
+            "https://cdn.example.com",
+            region=args.region,
+            endpoint_url=endpoint_url,
+            access_key_id=args.access_key_id,
+            secret_access_key=args.secret_access_key,
+            addressing_style="path",
+            part_size=MIN_PART_SIZE
+        )
+        prefix = f"bench/{uuid.uuid4().hex}"
+        chunk_size = 256 * 1024
+        small = os.urandom(1024 * 1024)
+        large = os.urandom(args.size_mib * 1024 * 1024)
+        results = {}
+
+        async def put() -> bool:
+            await write(backend, f"{prefix}/small", small, chunk_size)
+            head = await backend.head(f"{prefix}/small")
+            return head == {"size": len(small), "sha256": hashlib.sha256(small).hexdigest()}
+
+        async def multipart() -> bool:
+            await write(backend, f"{prefix}/large", large, chunk_size)
+            head = await backend.head(f"{prefix}/large")
+            return head["size"] == len(large) and await collect(backend.read(f"{prefix}/large")) == large
+
+        async def streamed_part() -> bool:
+            key = f"{prefix}/streamed"
+            upload_id = await backend.create_multipart_upload(key, len(large))
+            parts = []
+            for number, offset in enumerate(range(0, len(large), MIN_PART_SIZE), start=1):
+                part = large[offset:offset + MIN_PART_SIZE]
+                result = await backend.upload_part(key, upload_id, number, offset, len(part), chunked(part, chunk_size))
+                parts.append({"part_number": number, "etag": result["etag"]})
+            await backend.complete_multipart_upload(key, upload_id, parts)
+            return await collect(backend.read(key)) == large
+
+        async def short_part() -> bool:
+            key = f"{prefix}/short"
+            upload_id = await backend.create_multipart_upload(key, MIN_PART_SIZE)
+            try:
+                await backend.upload_part(key, upload_id, 1, 0, MIN_PART_SIZE, chunked(small, chunk_size))
+            except ValueError:
+                return True
+            finally:
+                await backend.abort_multipart_upload(key, upload_id)
+            return False
+
+        offset, length = len(large) // 3, len(large) // 4
+
+        async def ranged_get() -> bool:
+            return await collect(backend.read(f"{prefix}/large", offset, length)) == large[offset:offset + length]
+
+        async def download() -> bool:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "large")
+                size = await backend.download(f"{prefix}/large", path)
+                with open(path, "rb") as f:
+                    return size == len(large) and f.read() == large
+
+        async def presign() -> bool:
+            key = f"{prefix}/direct"
+            sha256 = hashlib.sha256(small).hexdigest()
+            target = backend.presign_upload(key, len(small), sha256, "audio/mpeg", 300)
+            async with httpx.AsyncClient() as client:
+                response = await client.request(target["method"], target["url"], headers=target["headers"], content=small)
+            head = await backend.head(key)
+            return response.is_success and head == {"size": len(small), "sha256": sha256}
+
+        await run(results, "put", len(small), put)
+        await run(results, "multipart", len(large), multipart)
+        await run(results, "streamed_part", len(large), streamed_part)
+        await run(results, "short_part", 0, short_part)
+        await run(results, "ranged_get", length, ranged_get)
+        await run(results, "download", len(large), download)
+        await run(results, "presign", len(small), presign)
+        for key in ("small", "large", "streamed", "direct"):
+            await backend.delete(f"{prefix}/{key}")
+        backend.executor.shutdown()
+    finally:
+        if server:
+            server.stop()
+
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result["passed"] for result in results.values()) else 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint; a moto server is started if omitted")
+    parser.add_argument("--bucket", default="bench-s3")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--access-key-id", default="testing")
+    parser.add_argument("--secret-access-key", default="testing")
+    parser.add_argument("--moto-port", type=int, default=5123)
+    parser.add_argument("--size-mib", type=int, default=24, help="Size of the multipart objects")
+    parser.add_argument("--json", dest="json_output")
+    sys.exit(asyncio.run(main(parser.parse_args())))
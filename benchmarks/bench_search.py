@@ -0,0 +1,157 @@
+"""
+Search latency on a synthetic song library.
+
+Seeds one user with --songs songs (titles, artists and albums drawn from a
+Zipf-distributed vocabulary, so common words match many songs), creates the
+search indexes, then times SearchService prefix and text queries and reports
+latency percentiles. Exits with status 1 if a p99 target is missed.
+
+Needs a running MongoDB; the data goes to a separate database and is reused
+on later runs:
+
+    python -m benchmarks.bench_search --songs 1000000 --prefix-p99-ms 50 --text-p99-ms 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+from typing import List
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from app.config import settings
+from app.indexes import ensure_indexes
+from app.services.search_service import SearchService
+from app.services.song_service import build_song_document
+
+USER_ID = "bench-user"
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "be", "da", "fi", "go", "ha", "ju", "ze", "pa", "qu", "re", "so", "wy"]
+
+def make_vocabulary(size: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+class Library:
+    def __init__(self, vocabulary: List[str], rng: random.Random):
+        self.vocabulary = vocabulary
+        self.weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        self.rng = rng
+    
+    def words(self, count: int) -> List[str]:
+        return self.rng.choices(self.vocabulary, self.weights, k=count)
+    
+    def phrase(self, low: int, high: int) -> str:
+        return " ".join(self.words(self.rng.randint(low, high))).title()
+
+async def seed(db: AsyncIOMotorDatabase, library: Library, songs: int, batch_size: int = 10_000) -> None:
+    existing = await db["songs"].count_documents({"user_id": USER_ID})
+    if existing >= songs:
+        print(f"Reusing {existing} seeded songs")
+        return
+    print(f"Seeding {songs - existing} songs...")
+    start = time.perf_counter()
+    for offset in range(existing, songs, batch_size):
+        batch = [
+            build_song_document(
+                user_id=USER_ID,
+                device_id="bench",
+                title=library.phrase(1, 4),
+                artist=library.phrase(1, 2),
+                album=library.phrase(1, 3),
+                duration=library.rng.randint(90, 420),
+                file_id=f"bench-{n}",
+                file_url=f"https://cdn.example.com/bench/{n}.mp3",
+                storage_path=f"bench/{n}.mp3",
+                file_size=library.rng.randint(2_000_000, 10_000_000),
+                original_filename=f"{n}.mp3"
+            )
+            for n in range(offset, min(offset + batch_size, songs))
+        ]
+        await db["songs"].insert_many(batch, ordered=False)
+    print(f"Seeded in {time.perf_counter() - start:.1f} s")
+
+def percentiles(timings: List[float]) -> dict:
+    ordered = sorted(timings)
+    
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1],
+        "mean_ms": statistics.fmean(ordered),
+    }
+
+async def run_queries(search, queries: List[str], limit: int) -> dict:
+    timings = []
+    hits = 0
+    for q in queries:
+        start = time.perf_counter()
+        docs, _ = await search("songs", USER_ID, q, None, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+        hits += len(docs)
+    return {**percentiles(timings), "queries": len(queries), "mean_hits": hits / len(queries)}
+
+async def main(args) -> int:
+    rng = random.Random(args.seed)
+    library = Library(make_vocabulary(args.vocabulary, rng), rng)
+    client = AsyncIOMotorClient(args.url)
+    try:
+        db = client[args.db]
+        await seed(db, library, args.songs)
+        await ensure_indexes(db)
+        service = SearchService(db)
+        
+        # Typeahead: the first 1-4 characters of a word, often after a complete word
+        prefix_queries = []
+        for _ in range(args.queries):
+            word = library.words(1)[0]
+            typed = word[:rng.randint(1, min(4, len(word)))]
+            prefix_queries.append(f"{library.words(1)[0]} {typed}" if rng.random() < 0.3 else typed)
+        text_queries = [" ".join(library.words(rng.randint(1, 2))) for _ in range(args.queries)]
+        
+        # Warm the cache and the connection pool before timing
+        await run_queries(service.prefix_search, prefix_queries[:20], args.limit)
+        await run_queries(service.text_search, text_queries[:20], args.limit)
+        
+        results = {
+            "songs": args.songs,
+            "limit": args.limit,
+            "prefix": await run_queries(service.prefix_search, prefix_queries, args.limit),
+            "text": await run_queries(service.text_search, text_queries, args.limit),
+        }
+    finally:
+        client.close()
+    
+    failed = False
+    for mode, target in (("prefix", args.prefix_p99_ms), ("text", args.text_p99_ms)):
+        stats = results[mode]
+        print(
+            f"{mode:>6}: p50 {stats['p50_ms']:.2f} ms  p95 {stats['p95_ms']:.2f} ms  "
+            f"p99 {stats['p99_ms']:.2f} ms  max {stats['max_ms']:.2f} ms  (target p99 {target} ms)"
+        )
+        stats["p99_target_ms"] = target
+        stats["passed"] = stats["p99_ms"] <= target
+        failed = failed or not stats["passed"]
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=settings.mongodb_url)
+    parser.add_argument("--db", default=f"{settings.mongodb_db_name}_bench")
+    parser.add_argument("--songs", type=int, default=1_000_000)
+    parser.add_argument("--vocabulary", type=int, default=20_000, help="Distinct words in generated metadata")
+    parser.add_argument("--queries", type=int, default=1000, help="Timed queries per mode")
+    parser.add_argument("--limit", type=int, default=20, help="Results per query")
+    parser.add_argument("--prefix-p99-ms", type=float, default=50.0)
+    parser.add_argument("--text-p99-ms", type=float, default=200.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_output", help="Write results to this file")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,105 @@
+"""
+Compare the playlist list response paths.
+
+- current: convert every ObjectId to str in Python, validate each item against
+  List[PlaylistResponse], then json.dumps (what FastAPI does with response_model)
+- fast: encode the raw Motor documents with orjson (app.responses.dumps)
+
+Run with: python -m benchmarks.bench_serialization --items 100 --songs 50
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+from typing import List
+from bson import ObjectId
+from pydantic import TypeAdapter
+from app.responses import dumps
+from app.schemas.playlist import PlaylistResponse
+
+def make_page(items: int, songs: int, hydrated: bool) -> List[dict]:
+    """Playlist documents as they come off the Motor cursor"""
+    page = []
+    for i in range(items):
+        if hydrated:
+            song_list = [
+                {
+                    "_id": str(ObjectId()),
+                    "title": f"Song {n}",
+                    "artist": "Artist",
+                    "album": "Album",
+                    "duration": 200 + n,
+                    "file_url": f"https://cdn.example.com/users/u/audio/{n}.mp3",
+                    "file_size": 5_000_000,
+                    "created_at": datetime.utcnow().isoformat(),
+                    "position": n,
+                }
+                for n in range(songs)
+            ]
+        else:
+            song_list = [{"_id": str(ObjectId()), "position": n} for n in range(songs)]
+        page.append({
+            "_id": ObjectId(),
+            "user_id": "user123",
+            "device_id": "device_abc",
+            "name": f"Playlist {i}",
+            "parent_id": None,
+            "songs": song_list,
+            "created_at": datetime.utcnow().isoformat(),
+        })
+    return page
+
+adapter = TypeAdapter(List[PlaylistResponse])
+
+def current_path(page: List[dict]) -> bytes:
+    for playlist in page:
+        playlist["_id"] = str(playlist["_id"])
+    validated = adapter.validate_python(page)
+    content = adapter.dump_python(validated, mode="json", by_alias=True)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def fast_path(page: List[dict]) -> bytes:
+    return dumps(page)
+
+def measure(fn, pages: List[List[dict]]) -> List[float]:
+    timings = []
+    for page in pages:
+        start = time.perf_counter()
+        fn(page)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def summarize(timings: List[float]) -> dict:
+    ordered = sorted(timings)
+    return {
+        "median_ms": statistics.median(ordered),
+        "p95_ms": ordered[int(len(ordered) * 0.95) - 1],
+        "mean_ms": statistics.fmean(ordered),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100, help="Playlists per page")
+    parser.add_argument("--songs", type=int, default=50, help="Songs per playlist")
+    parser.add_argument("--rounds", type=int, default=200, help="Pages encoded per path")
+    parser.add_argument("--hydrated", action="store_true", help="Use full song documents instead of references")
+    parser.add_argument("--json", dest="json_output", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = {"items": args.items, "songs": args.songs, "rounds": args.rounds, "hydrated": args.hydrated}
+    for name, fn in (("current", current_path), ("fast", fast_path)):
+        pages = [make_page(args.items, args.songs, args.hydrated) for _ in range(args.rounds)]
+        results[name] = summarize(measure(fn, pages))
+    results["speedup"] = results["current"]["median_ms"] / results["fast"]["median_ms"]
+
+    for name in ("current", "fast"):
+        stats = results[name]
+        print(f"{name:>8}: median {stats['median_ms']:.3f} ms  p95 {stats['p95_ms']:.3f} ms  mean {stats['mean_ms']:.3f} ms")
+    print(f" speedup: {results['speedup']:.1f}x")
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Make the mongomock stand-in apply the pipeline updates the services issue.
+
+mongomock accepts update pipelines but copies nested aggregation expressions
+into the document verbatim, so appending song references (see
+append_song_refs_update) would store unevaluated expressions. The patch
+evaluates $set/$addFields stages for the few operators the services use
+before handing mongomock a plain $set.
+
+mongomock also resolves the positional $ operator against any filter field
+sharing the array's prefix (songs_version for songs.$), so positional
+updates are applied with a filter narrowed to the array match. Real
+MongoDB needs none of this.
+"""
+from typing import Any
+import mongomock.collection
+
+def _evaluate(expr: Any, doc: dict) -> Any:
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = doc
+        for part in expr[1:].split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expr, list):
+        return [_evaluate(item, doc) for item in expr]
+    if isinstance(expr, dict):
+        if len(expr) == 1:
+            (op, arg), = expr.items()
+            if op == "$literal":
+                return arg
+            if op == "$ifNull":
+                value = _evaluate(arg[0], doc)
+                return _evaluate(arg[1], doc) if value is None else value
+            if op == "$concatArrays":
+                return [item for part in arg for item in _evaluate(part, doc)]
+            if op == "$add":
+                return sum(_evaluate(item, doc) for item in arg)
+            if op.startswith("$"):
+                raise NotImplementedError(f"{op} is not supported in pipeline updates on mongomock")
+        return {key: _evaluate(value, doc) for key, value in expr.items()}
+    return expr
+
+def patch_mongomock() -> None:
+    """Install the pipeline update evaluator; safe to call more than once"""
+    collection_class = mongomock.collection.Collection
+    if getattr(collection_class, "_pipeline_updates_patched", False):
+        return
+    original_update_one = collection_class.update_one
+    
+    def update_one(self, filter, update, *args, **kwargs):
+        if isinstance(update, dict) and any(".$." in field for field in update.get("$set", {})):
+            return positional_update_one(self, filter, update, *args, **kwargs)
+        if not isinstance(update, list):
+            return original_update_one(self, filter, update, *args, **kwargs)
+        doc = self.find_one(filter)
+        if doc is None:
+            return original_update_one(self, filter, {"$set": {}}, *args, **kwargs)
+        fields = {}
+        for stage in update:
+            (op, spec), = stage.items()
+            if op not in ("$set", "$addFields"):
+                raise NotImplementedError(f"{op} is not supported in pipeline updates on mongomock")
+            fields.update({field: _evaluate(expr, {**doc, **fields}) for field, expr in spec.items()})
+        return original_update_one(self, {"_id": doc["_id"]}, {"$set": fields}, *args, **kwargs)
+    
+    def positional_update_one(self, filter, update, *args, **kwargs):
+        doc = self.find_one(filter, {"_id": 1})
+        if doc is None:
+            return original_update_one(self, filter, update, *args, **kwargs)
+        array_filter = {field: value for field, value in filter.items() if "." in field}
+        result = original_update_one(self, {"_id": doc["_id"], **array_filter}, {"$set": update["$set"]}, *args, **kwargs)
+        others = {op: spec for op, spec in update.items() if op != "$set"}
+        if others:
+            original_update_one(self, {"_id": doc["_id"]}, others, *args, **kwargs)
+        return result
+    
+    collection_class.update_one = update_one
+    collection_class._pipeline_updates_patched = True
@@ -0,0 +1,65 @@
+"""
+Production entry point: uvicorn with API_WORKERS worker processes, no reload.
+
+Uses uvloop and httptools when they are installed (they come with uvicorn[standard]).
+Each worker has its own MongoDB connection pool, so the total number of connections
+is roughly API_WORKERS x MONGODB_MAX_POOL_SIZE.
+
+Features that keep their state in the process (the in-memory cache and the
+per-user and per-device admission limits) would silently become per worker,
+so more than one worker is refused while any of them is enabled.
+"""
+import copy
+import importlib.util
+import os
+import sys
+from typing import List
+import uvicorn
+from app.config import settings
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def log_config() -> dict:
+    """uvicorn's logging setup, with the app's own loggers sent to the same handler"""
+    config = copy.deepcopy(uvicorn.config.LOGGING_CONFIG)
+    config["loggers"]["app"] = {"handlers": ["default"], "level": "INFO", "propagate": False}
+    return config
+
+def per_process_features() -> List[str]:
+    """Enabled settings whose state lives in one worker process"""
+    features = []
+    if settings.cache_enabled:
+        features.append("CACHE_ENABLED")
+    if settings.admission_enabled:
+        limits = {
+            "RATE_LIMIT_USER_PER_SECOND": settings.rate_limit_user_per_second,
+            "RATE_LIMIT_DEVICE_PER_SECOND": settings.rate_limit_device_per_second,
+            "CONCURRENCY_LIMIT_PER_USER": settings.concurrency_limit_per_user,
+            "CONCURRENCY_LIMIT_PER_DEVICE": settings.concurrency_limit_per_device,
+        }
+        features.extend(name for name, limit in limits.items() if limit > 0)
+    return features
+
+if __name__ == "__main__":
+    workers = settings.api_workers or os.cpu_count() or 1
+    features = per_process_features()
+    if workers > 1 and features:
+        sys.exit(
+            f"Refusing to start {workers} workers: {', '.join(features)} keep per-process state "
+            "and would be wrong with several workers. Set API_WORKERS=1 or disable them (set to 0/false)."
+        )
+    uvicorn.run(
+        "app.main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        workers=workers,
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        backlog=settings.api_backlog,
+        timeout_keep_alive=settings.api_keepalive_timeout,
+        access_log=settings.api_access_log,
+        log_config=log_config(),
+        proxy_headers=True,
+        reload=False
+    )